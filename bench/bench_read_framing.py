@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Microbenchmark for reading newline-separated messages from a niri socket (see NiriSocket in niri_ipc.py).
+A captured (or synthetic) event stream is replayed through a local unix socket and read back
+using the current reader, as well as the older string-joining reader, for comparison.
+
+A real event stream can be captured using:
+    niri msg --json event-stream > capture.jsonl
+(leave it running while opening/closing/resizing windows, then hit ctrl+c)
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from collections import deque
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from niri_ipc import NiriSocket, json_loads
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Args
+
+parser = argparse.ArgumentParser(description="Benchmark for niri socket message reading")
+parser.add_argument("-c", "--capture", type=str, help="Captured event stream (json lines) to replay")
+parser.add_argument("-w", "--num_windows", type=int, default=500, help="Windows in synthetic WindowsChanged events")
+parser.add_argument("-e", "--num_events", type=int, default=2000, help="Number of synthetic events (default 2000)")
+parser.add_argument("-b", "--buffer_size", type=int, default=4096, help="Initial reader buffer size (default 4096)")
+parser.add_argument("-r", "--repeats", type=int, default=5, help="Number of timing repeats, best is reported")
+parser.add_argument("-d", "--decode", action="store_true", help="Include json decoding in timing")
+
+args = parser.parse_args()
+CAPTURE_PATH = args.capture
+NUM_WINDOWS = args.num_windows
+NUM_EVENTS = args.num_events
+BUFFER_SIZE = args.buffer_size
+NUM_REPEATS = args.repeats
+INCLUDE_DECODE = args.decode
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class LegacyStrReader:
+    """Copy of the original (decode + string join + split) message reader, used as a baseline"""
+
+    def __init__(self, socket_path: str, buffer_size: int = 4096):
+        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._skt.connect(socket_path)
+        self._bufsize = buffer_size
+        self._msg_queue = deque([])
+        self._inprog_str = None
+
+    def _read_next_line(self) -> str | None:
+        if len(self._msg_queue) > 0:
+            return self._msg_queue.popleft()
+        while True:
+            resp_binstr = self._skt.recv(self._bufsize)
+            if len(resp_binstr) == 0:
+                return None
+            resp_str = resp_binstr.decode("utf-8")
+            if self._inprog_str is not None:
+                resp_str = "".join((self._inprog_str, resp_str))
+                self._inprog_str = None
+            msg_list = resp_str.split("\n")
+            last_msg_piece = msg_list.pop()
+            self._inprog_str = last_msg_piece if len(last_msg_piece) > 0 else None
+            if len(msg_list) > 0:
+                break
+        self._msg_queue.extend(msg_list[1:])
+        return msg_list[0]
+
+    def close(self):
+        self._skt.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def make_window_data(window_id: int, workspace_id: int, column_idx: int) -> dict:
+    """Make fake window data, formatted like the niri IPC window info"""
+    return {
+        "id": window_id,
+        "title": f"Window number {window_id} - some typical looking (long-ish) title text",
+        "app_id": "org.example.app",
+        "pid": 1000 + window_id,
+        "workspace_id": workspace_id,
+        "is_focused": False,
+        "is_floating": False,
+        "is_urgent": False,
+        "layout": {
+            "pos_in_scrolling_layout": [column_idx, 1],
+            "tile_size": [960.0, 1080.0],
+            "window_size": [960, 1080],
+            "tile_pos_in_workspace_view": None,
+            "window_offset_in_tile": [0.0, 0.0],
+        },
+    }
+
+
+def make_synthetic_capture(num_windows: int, num_events: int) -> bytes:
+    """
+    Make a fake event stream, mostly made of layout changes (as happens during animations)
+    with periodic large WindowsChanged events (like on startup)
+    """
+
+    windows_list = [make_window_data(idx, 1 + idx % 10, 1 + idx // 10) for idx in range(num_windows)]
+    big_event = {"WindowsChanged": {"windows": windows_list}}
+    layout_changes = [[w["id"], w["layout"]] for w in windows_list[:20]]
+    layout_event = {"WindowLayoutsChanged": {"changes": layout_changes}}
+    focus_event = {"WindowFocusChanged": {"id": 1}}
+
+    event_strs = []
+    for evt_idx in range(num_events):
+        evt = big_event if evt_idx % 100 == 0 else (layout_event if evt_idx % 2 == 0 else focus_event)
+        event_strs.append(json.dumps(evt, separators=(",", ":")))
+    event_strs.append("")
+
+    return "\n".join(event_strs).encode("utf-8")
+
+
+def serve_capture_once(listener: socket.socket, capture_bytes: bytes) -> None:
+    """Sends all capture data to the first client that connects, then closes (runs on separate thread)"""
+    conn, _ = listener.accept()
+    with conn:
+        conn.sendall(capture_bytes)
+    return
+
+
+def time_reader(reader_class, capture_bytes: bytes, num_messages: int, decode: bool) -> float:
+    """Time (in seconds) taken to read all messages using the given reader"""
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        skt_path = os.path.join(temp_folder, "bench.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+            listener.bind(skt_path)
+            listener.listen()
+            server_thread = threading.Thread(target=serve_capture_once, args=(listener, capture_bytes), daemon=True)
+            server_thread.start()
+
+            reader = reader_class(skt_path, BUFFER_SIZE)
+            t1 = perf_counter()
+            for _ in range(num_messages):
+                msg = reader._read_next_line()
+                if decode:
+                    json_loads(msg)
+            t2 = perf_counter()
+            reader.close()
+            server_thread.join()
+
+    return t2 - t1
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Main
+
+# Load capture data
+if CAPTURE_PATH is not None:
+    capture_bytes = Path(CAPTURE_PATH).read_bytes()
+    if not capture_bytes.endswith(b"\n"):
+        capture_bytes += b"\n"
+else:
+    capture_bytes = make_synthetic_capture(NUM_WINDOWS, NUM_EVENTS)
+num_messages = capture_bytes.count(b"\n")
+num_megabytes = len(capture_bytes) / 1e6
+print(
+    "",
+    f"Capture: {CAPTURE_PATH if CAPTURE_PATH is not None else 'synthetic'}",
+    f"  {num_messages} messages, {num_megabytes:.1f} MB",
+    f"  buffer size: {BUFFER_SIZE}, json decoding: {INCLUDE_DECODE} ({json_loads.__module__})",
+    "",
+    sep="\n",
+)
+
+for reader_name, reader_class in (("NiriSocket", NiriSocket), ("Legacy (str join)", LegacyStrReader)):
+    best_time = min(time_reader(reader_class, capture_bytes, num_messages, INCLUDE_DECODE) for _ in range(NUM_REPEATS))
+    print(
+        f"{reader_name:>20}:",
+        f"{1000 * best_time:8.1f} ms",
+        f"{num_megabytes / best_time:8.1f} MB/s",
+        f"{num_messages / best_time:10.0f} msgs/s",
+        sep="  ",
+    )
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for niri_tile_to_n.py, using a fake niri socket (see fake_niri.py), so no compositor is needed.
+The tiling script is run as a separate process, then a series of scenarios (opening windows,
+mass closing, moving windows between workspaces & a burst of events) are played out through
+the fake niri socket. For each scenario, the number of events sent & actions received
+are reported, along with the latency (time from an event being sent until the first
+resulting action arrives) and overall event throughput.
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from time import perf_counter
+
+from fake_niri import FakeNiriServer, encode_message
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Args
+
+default_script_path = Path(__file__).resolve().parent.parent / "niri_tile_to_n.py"
+
+parser = argparse.ArgumentParser(description="Benchmark niri_tile_to_n.py using a fake niri socket")
+parser.add_argument("-n", type=int, default=3, help="Number of windows handled with auto-tiling (default 3)")
+parser.add_argument("-w", "--num_windows", type=int, default=10, help="Windows used for close/move scenarios")
+parser.add_argument("-e", "--num_events", type=int, default=5000, help="Number of events in throughput burst")
+parser.add_argument("-q", "--quiet_ms", type=int, default=100, help="Wait for no new actions before next step")
+parser.add_argument("-s", "--script", type=str, default=str(default_script_path), help="Path to tiling script")
+
+args = parser.parse_args()
+TILE_TO_N = args.n
+NUM_WINDOWS = args.num_windows
+NUM_BURST_EVENTS = args.num_events
+QUIET_SEC = args.quiet_ms / 1000
+SCRIPT_PATH = args.script
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class ScenarioResult:
+    """Helper used to accumulate measurements for a single scenario"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.num_events = 0
+        self.num_actions = 0
+        self.latencies_ms: list[float] = []
+        self.total_time_ms = 0.0
+
+    def add_step(self, server: FakeNiriServer, step_func, *step_args):
+        """Run a single scenario step and wait for all resulting actions, recording timing & counts"""
+
+        num_actions_before, num_events_before = len(server.action_log), server.num_events_sent
+        t_start = perf_counter()
+        step_func(*step_args)
+        server.wait_for_quiet(QUIET_SEC)
+
+        new_actions = server.action_log[num_actions_before:]
+        if len(new_actions) > 0:
+            self.latencies_ms.append(1000 * (new_actions[0][0] - t_start))
+            self.total_time_ms += 1000 * (new_actions[-1][0] - t_start)
+        self.num_actions += len(new_actions)
+        self.num_events += server.num_events_sent - num_events_before
+        return self
+
+    def print_summary(self):
+        num_lat = len(self.latencies_ms)
+        mean_lat = sum(self.latencies_ms) / num_lat if num_lat > 0 else float("nan")
+        max_lat = max(self.latencies_ms) if num_lat > 0 else float("nan")
+        evts_per_sec = 1000 * self.num_events / self.total_time_ms if self.total_time_ms > 0 else float("nan")
+        print(
+            f"{self.name:>20}",
+            f"{self.num_events:>8}",
+            f"{self.num_actions:>8}",
+            f"{mean_lat:>10.2f}",
+            f"{max_lat:>10.2f}",
+            f"{self.total_time_ms:>10.1f}",
+            f"{evts_per_sec:>10.0f}",
+            sep="  ",
+        )
+        return
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Scenarios
+
+
+def scenario_open_windows(server: FakeNiriServer) -> ScenarioResult:
+    """Open windows one-by-one on an empty workspace, up to one more than 'N'"""
+    result = ScenarioResult(f"open 1..{TILE_TO_N + 1}")
+    for _ in range(TILE_TO_N + 1):
+        result.add_step(server, server.open_window, "foot", 1)
+    return result
+
+
+def scenario_mass_close(server: FakeNiriServer) -> ScenarioResult:
+    """Close all but one window on a workspace, all at once (should end with the last window maximized)"""
+
+    win_ids = [server.open_window("foot", 2) for _ in range(NUM_WINDOWS)]
+    server.wait_for_quiet(QUIET_SEC)
+
+    def close_all_but_one():
+        for win_id in win_ids[1:]:
+            server.close_window(win_id)
+
+    return ScenarioResult(f"mass close {NUM_WINDOWS - 1}").add_step(server, close_all_but_one)
+
+
+def scenario_workspace_moves(server: FakeNiriServer) -> ScenarioResult:
+    """Move windows, one at a time, onto an empty workspace"""
+
+    win_ids = [server.open_window("foot", 2) for _ in range(TILE_TO_N + 1)]
+    server.wait_for_quiet(QUIET_SEC)
+
+    result = ScenarioResult(f"move 1..{TILE_TO_N + 1}")
+    for win_id in win_ids:
+        result.add_step(server, server.move_window_to_workspace, win_id, 3)
+    return result
+
+
+def scenario_event_burst(server: FakeNiriServer) -> ScenarioResult:
+    """
+    Send a large burst of focus/layout events, followed by a new window on an empty workspace.
+    The time until the new window is maximized gives the time needed to process the whole burst
+    """
+
+    win_ids = [server.open_window("foot", 1) for _ in range(2)]
+    server.wait_for_quiet(QUIET_SEC)
+
+    # Build burst of (valid) events for the existing windows
+    layouts_list = [[win_id, server.model.get_window_data(win_id)["layout"]] for win_id in win_ids]
+    layout_evt = encode_message({"WindowLayoutsChanged": {"changes": layouts_list}})
+    focus_evts = [encode_message({"WindowFocusChanged": {"id": win_id}}) for win_id in win_ids]
+    burst_list = [focus_evts[idx % 2] if idx % 4 == 0 else layout_evt for idx in range(NUM_BURST_EVENTS)]
+    burst_bytes = b"".join(burst_list)
+
+    def send_burst_then_probe():
+        server.send_raw_events(burst_bytes, NUM_BURST_EVENTS)
+        server.open_window("foot", 3)
+
+    return ScenarioResult(f"burst {NUM_BURST_EVENTS}").add_step(server, send_burst_then_probe)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def run_scenario(scenario_func) -> ScenarioResult:
+    """Run a single scenario against a fresh fake niri & tiling script"""
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        socket_path = os.path.join(temp_folder, "fake_niri.sock")
+        server = FakeNiriServer(socket_path).start()
+
+        # Use the temporary folder for state snapshots as well, so the snapshot of a real niri session isn't replaced
+        script_env = {**os.environ, "NIRI_SOCKET": socket_path, "XDG_RUNTIME_DIR": temp_folder}
+        script_args = [sys.executable, SCRIPT_PATH, "-q", "0", "-n", str(TILE_TO_N), "-m"]
+        proc = subprocess.Popen(script_args, env=script_env, stdout=subprocess.DEVNULL)
+        try:
+            if not server.wait_for_subscribers(1, timeout_sec=10):
+                raise RuntimeError("Tiling script never connected to the event stream!")
+            server.wait_for_quiet(QUIET_SEC)
+            result = scenario_func(server)
+
+        finally:
+            proc.terminate()
+            proc.wait(timeout=5)
+            server.close()
+
+    return result
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Main
+
+print(
+    "",
+    f"Script: {SCRIPT_PATH}",
+    f"  N: {TILE_TO_N}, quiet period: {1000 * QUIET_SEC:.0f} ms",
+    "",
+    "(latency is the time from the first event until the first resulting action)",
+    "",
+    sep="\n",
+)
+print(
+    f"{'Scenario':>20}",
+    f"{'Events':>8}",
+    f"{'Actions':>8}",
+    f"{'Lat. (ms)':>10}",
+    f"{'Max (ms)':>10}",
+    f"{'Total (ms)':>10}",
+    f"{'Events/s':>10}",
+    sep="  ",
+)
+for scenario in (scenario_open_windows, scenario_mass_close, scenario_workspace_moves, scenario_event_burst):
+    run_scenario(scenario).print_summary()
@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the niri IPC socket, used to run & benchmark the scripts without a live compositor.
+Requests (e.g. Windows, Workspaces, Outputs) and actions are handled using a simplified copy
+of the niri scrolling layout (columns of windows on each workspace), which also generates
+the events that niri would send (e.g. layout changes after maximizing a column).
+
+Alternatively, a capture (see record_niri.py) can be replayed to event stream listeners,
+in which case requests are answered using the recorded responses, when available.
+
+Can be run directly, for example:
+    python3 bench/fake_niri.py --socket /tmp/fake_niri.sock --windows 3
+    NIRI_SOCKET=/tmp/fake_niri.sock python3 niri_tile_to_n.py
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import json
+import signal
+import socket
+import argparse
+import threading
+from dataclasses import dataclass, field
+from time import perf_counter, sleep
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Data types
+
+
+@dataclass
+class FakeColumn:
+    """A single column of (tiled) windows in the fake scrolling layout"""
+
+    window_ids: list[int] = field(default_factory=list)
+    width: float = 0.5
+    prev_width: float = 0.5
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class FakeNiriModel:
+    """
+    Simplified model of the niri layout: a single output, with a fixed set of workspaces,
+    each holding a list of columns of windows (plus floating windows).
+    All changes return the list of events that niri would (roughly) send as a result
+    """
+
+    def __init__(self, output_name: str = "FAKE-1", output_size: tuple[int, int] = (1920, 1080), num_workspaces=3):
+
+        self.output_name = output_name
+        self.output_w, self.output_h = output_size
+
+        self.workspaces: dict[int, dict] = {}
+        for ws_id in range(1, num_workspaces + 1):
+            self.workspaces[ws_id] = {
+                "id": ws_id,
+                "idx": ws_id,
+                "name": None,
+                "output": output_name,
+                "is_urgent": False,
+                "is_active": ws_id == 1,
+                "is_focused": ws_id == 1,
+                "active_window_id": None,
+            }
+        self.columns_per_workspace: dict[int, list[FakeColumn]] = {ws_id: [] for ws_id in self.workspaces}
+
+        self.windows: dict[int, dict] = {}
+        self.focused_window_id: int | None = None
+        self.focused_workspace_id = 1
+        self._next_window_id = 1
+
+        # Last layout reported for each window, so we only report actual layout changes
+        self._reported_layouts: dict[int, dict] = {}
+
+    # .................................................................................................................
+
+    def get_outputs_data(self) -> dict:
+        logical = {"x": 0, "y": 0, "width": self.output_w, "height": self.output_h, "scale": 1.0, "transform": "Normal"}
+        output_data = {
+            "name": self.output_name,
+            "make": "Fake",
+            "model": "Fake Monitor",
+            "serial": None,
+            "physical_size": [600, 340],
+            "modes": [{"width": self.output_w, "height": self.output_h, "refresh_rate": 60000, "is_preferred": True}],
+            "current_mode": 0,
+            "vrr_supported": False,
+            "vrr_enabled": False,
+            "logical": logical,
+        }
+        return {self.output_name: output_data}
+
+    def get_workspaces_data(self) -> list[dict]:
+        return [dict(wspace) for wspace in self.workspaces.values()]
+
+    def get_window_data(self, window_id: int) -> dict:
+        win_data = dict(self.windows[window_id])
+        win_data["layout"] = self._make_layout(window_id)
+        return win_data
+
+    def get_windows_data(self) -> list[dict]:
+        return [self.get_window_data(win_id) for win_id in self.windows.keys()]
+
+    def get_initial_events(self) -> list[dict]:
+        """Events sent by niri when an event stream is first started"""
+        self._reported_layouts = {win_id: self._make_layout(win_id) for win_id in self.windows.keys()}
+        return [
+            {"WorkspacesChanged": {"workspaces": self.get_workspaces_data()}},
+            {"WindowsChanged": {"windows": self.get_windows_data()}},
+            {"KeyboardLayoutsChanged": {"keyboard_layouts": {"names": ["English (US)"], "current_idx": 0}}},
+            {"OverviewOpenedOrClosed": {"is_open": False}},
+            {"ConfigLoaded": {"failed": False}},
+        ]
+
+    # .................................................................................................................
+
+    def open_window(self, app_id: str = "foot", workspace_id: int | None = None, is_floating: bool = False):
+        """Open a new window (to the right of the focused column). Returns: new_window_id, events_list"""
+
+        ws_id = workspace_id if workspace_id is not None else self.focused_workspace_id
+        win_id = self._next_window_id
+        self._next_window_id += 1
+        self.windows[win_id] = {
+            "id": win_id,
+            "title": f"{app_id} window {win_id}",
+            "app_id": app_id,
+            "pid": 10000 + win_id,
+            "workspace_id": ws_id,
+            "is_focused": False,
+            "is_floating": is_floating,
+            "is_urgent": False,
+        }
+        if not is_floating:
+            columns = self.columns_per_workspace[ws_id]
+            insert_idx = self._get_column_index(self.focused_window_id, ws_id)
+            insert_idx = len(columns) if insert_idx is None else insert_idx + 1
+            columns.insert(insert_idx, FakeColumn([win_id]))
+
+        # New windows on the focused workspace take focus
+        if ws_id == self.focused_workspace_id:
+            self._set_focus_flags(win_id)
+        events_list = [self._make_window_event(win_id)]
+        events_list.extend(self._make_layout_events())
+        return win_id, events_list
+
+    def close_window(self, window_id: int) -> list[dict]:
+        """Close a window, focus moves to a neighbouring window if needed"""
+
+        if window_id not in self.windows:
+            return []
+
+        ws_id = self.windows[window_id]["workspace_id"]
+        neighbour_id = self._remove_from_columns(window_id)
+        del self.windows[window_id]
+        self._reported_layouts.pop(window_id, None)
+
+        events_list = [{"WindowClosed": {"id": window_id}}]
+        events_list.extend(self._make_layout_events())
+        if self.focused_window_id == window_id:
+            self.focused_window_id = None
+            if neighbour_id is None:
+                neighbour_id = next((w["id"] for w in self.windows.values() if w["workspace_id"] == ws_id), None)
+            self._set_focus_flags(neighbour_id)
+            events_list.append({"WindowFocusChanged": {"id": neighbour_id}})
+        return events_list
+
+    def move_window_to_workspace(self, window_id: int, workspace_id: int, focus: bool = False) -> list[dict]:
+        """Move a window to the end of another workspace"""
+
+        win_data = self.windows.get(window_id, None)
+        if win_data is None or workspace_id not in self.workspaces or win_data["workspace_id"] == workspace_id:
+            return []
+
+        self._remove_from_columns(window_id)
+        win_data["workspace_id"] = workspace_id
+        if not win_data["is_floating"]:
+            self.columns_per_workspace[workspace_id].append(FakeColumn([window_id]))
+
+        events_list = []
+        if focus:
+            events_list.extend(self._focus_window(window_id))
+        elif self.focused_window_id == window_id:
+            self._set_focus_flags(None)
+            events_list.append({"WindowFocusChanged": {"id": None}})
+        events_list.append(self._make_window_event(window_id))
+        events_list.extend(self._make_layout_events())
+        return events_list
+
+    # .................................................................................................................
+
+    def apply_action(self, action_name: str, kwargs: dict) -> tuple[bool, list[dict]]:
+        """
+        Apply an action (as sent through IPC) to the layout. Returns: is_ok, events_list
+        Actions that aren't modelled are accepted without changing anything
+        """
+
+        target_id = kwargs.get("id", None)
+        target_id = target_id if target_id is not None else self.focused_window_id
+
+        if action_name == "FocusWindow":
+            return True, self._focus_window(kwargs["id"])
+
+        if action_name == "CloseWindow":
+            return True, self.close_window(target_id)
+
+        if action_name == "MaximizeColumn":
+            col = self._get_column(self.focused_window_id)
+            if col is not None:
+                col.width, col.prev_width = (col.prev_width, col.width) if col.width == 1.0 else (1.0, col.width)
+            return True, self._make_layout_events()
+
+        if action_name in {"ConsumeOrExpelWindowLeft", "ConsumeOrExpelWindowRight"}:
+            self._consume_or_expel(target_id, is_left=action_name.endswith("Left"))
+            return True, self._make_layout_events()
+
+        if action_name == "MoveWindowToWorkspace":
+            win_id = kwargs.get("window_id", None)
+            win_id = win_id if win_id is not None else self.focused_window_id
+            ws_id = self._find_workspace_id(kwargs["reference"])
+            if ws_id is None:
+                return False, []
+            return True, self.move_window_to_workspace(win_id, ws_id, kwargs.get("focus", True))
+
+        if action_name == "FocusWorkspace":
+            ws_id = self._find_workspace_id(kwargs["reference"])
+            if ws_id is None:
+                return False, []
+            active_id = self.workspaces[ws_id]["active_window_id"]
+            if active_id is not None:
+                return True, self._focus_window(active_id)
+            self._set_focus_flags(None, ws_id)
+            return True, [{"WorkspaceActivated": {"id": ws_id, "focused": True}}]
+
+        if action_name in {"MoveWindowToFloating", "MoveWindowToTiling"} and target_id in self.windows:
+            win_data = self.windows[target_id]
+            to_floating = action_name == "MoveWindowToFloating"
+            if win_data["is_floating"] != to_floating:
+                if to_floating:
+                    self._remove_from_columns(target_id)
+                else:
+                    self.columns_per_workspace[win_data["workspace_id"]].append(FakeColumn([target_id]))
+                win_data["is_floating"] = to_floating
+                return True, [self._make_window_event(target_id), *self._make_layout_events()]
+
+        return True, []
+
+    # .................................................................................................................
+
+    def _make_layout(self, window_id: int) -> dict:
+        """Make niri-formatted layout data for a window, based on its position in the columns"""
+
+        win_data = self.windows[window_id]
+        layout = {
+            "pos_in_scrolling_layout": None,
+            "tile_size": [self.output_w / 2, self.output_h / 2],
+            "window_size": [self.output_w // 2, self.output_h // 2],
+            "tile_pos_in_workspace_view": [self.output_w / 4, self.output_h / 4],
+            "window_offset_in_tile": [0.0, 0.0],
+        }
+        if win_data["is_floating"]:
+            return layout
+
+        columns = self.columns_per_workspace[win_data["workspace_id"]]
+        col_idx = self._get_column_index(window_id)
+        col = columns[col_idx]
+        width, height = round(col.width * self.output_w), self.output_h // len(col.window_ids)
+        layout["pos_in_scrolling_layout"] = [col_idx + 1, col.window_ids.index(window_id) + 1]
+        layout["tile_size"] = [float(width), float(height)]
+        layout["window_size"] = [width, height]
+        layout["tile_pos_in_workspace_view"] = None
+        return layout
+
+    def _make_window_event(self, window_id: int) -> dict:
+        win_data = self.get_window_data(window_id)
+        self._reported_layouts[window_id] = win_data["layout"]
+        return {"WindowOpenedOrChanged": {"window": win_data}}
+
+    def _make_layout_events(self) -> list[dict]:
+        """Make a WindowLayoutsChanged event listing all windows whose layout differs from what was last reported"""
+
+        changes_list = []
+        for win_id in self.windows.keys():
+            new_layout = self._make_layout(win_id)
+            if self._reported_layouts.get(win_id, None) != new_layout:
+                self._reported_layouts[win_id] = new_layout
+                changes_list.append([win_id, new_layout])
+
+        return [{"WindowLayoutsChanged": {"changes": changes_list}}] if len(changes_list) > 0 else []
+
+    def _focus_window(self, window_id: int | None) -> list[dict]:
+        if window_id not in self.windows or window_id == self.focused_window_id:
+            return []
+
+        prev_ws_id = self.focused_workspace_id
+        self._set_focus_flags(window_id)
+        events_list = []
+        if self.focused_workspace_id != prev_ws_id:
+            events_list.append({"WorkspaceActivated": {"id": self.focused_workspace_id, "focused": True}})
+        events_list.append({"WindowFocusChanged": {"id": window_id}})
+        return events_list
+
+    def _set_focus_flags(self, window_id: int | None, workspace_id: int | None = None):
+        """Helper used to update focus flags on all windows/workspaces"""
+
+        for win_data in self.windows.values():
+            win_data["is_focused"] = win_data["id"] == window_id
+        self.focused_window_id = window_id
+
+        if window_id is not None:
+            workspace_id = self.windows[window_id]["workspace_id"]
+            self.workspaces[workspace_id]["active_window_id"] = window_id
+        if workspace_id is not None:
+            self.focused_workspace_id = workspace_id
+            for wspace in self.workspaces.values():
+                wspace["is_focused"] = wspace["is_active"] = wspace["id"] == workspace_id
+        return
+
+    def _get_column_index(self, window_id: int | None, workspace_id: int | None = None) -> int | None:
+        """Get the (0-based) index of the column holding a window. Returns None if not found"""
+        if window_id not in self.windows:
+            return None
+        ws_id = self.windows[window_id]["workspace_id"]
+        if workspace_id is not None and ws_id != workspace_id:
+            return None
+        for col_idx, col in enumerate(self.columns_per_workspace[ws_id]):
+            if window_id in col.window_ids:
+                return col_idx
+        return None
+
+    def _get_column(self, window_id: int | None) -> FakeColumn | None:
+        col_idx = self._get_column_index(window_id)
+        if col_idx is None:
+            return None
+        return self.columns_per_workspace[self.windows[window_id]["workspace_id"]][col_idx]
+
+    def _remove_from_columns(self, window_id: int) -> int | None:
+        """Remove a window from the layout, returns the id of a neighbouring window (if any)"""
+
+        ws_id = self.windows[window_id]["workspace_id"]
+        columns = self.columns_per_workspace[ws_id]
+        col_idx = self._get_column_index(window_id)
+        if col_idx is None:
+            return None
+
+        col = columns[col_idx]
+        col.window_ids.remove(window_id)
+        if len(col.window_ids) > 0:
+            return col.window_ids[0]
+
+        columns.pop(col_idx)
+        if len(columns) == 0:
+            return None
+        return columns[max(0, col_idx - 1)].window_ids[0]
+
+    def _consume_or_expel(self, window_id: int | None, is_left: bool):
+        """Move a window into the neighbouring column, or out into its own column if it's sharing a column"""
+
+        col_idx = self._get_column_index(window_id)
+        if col_idx is None:
+            return
+        columns = self.columns_per_workspace[self.windows[window_id]["workspace_id"]]
+        col = columns[col_idx]
+
+        # Expel from shared column
+        if len(col.window_ids) > 1:
+            col.window_ids.remove(window_id)
+            columns.insert(col_idx if is_left else col_idx + 1, FakeColumn([window_id]))
+            return
+
+        # Consume into neighbouring column (if there is one)
+        target_idx = col_idx - 1 if is_left else col_idx + 1
+        if 0 <= target_idx < len(columns):
+            columns.pop(col_idx)
+            target_col = columns[target_idx if is_left else col_idx]
+            if is_left:
+                target_col.window_ids.append(window_id)
+            else:
+                target_col.window_ids.insert(0, window_id)
+        return
+
+    def _find_workspace_id(self, reference: dict) -> int | None:
+        """Find workspace id from a niri workspace reference, like: {"Index": 2}"""
+        ref_type, ref_value = next(iter(reference.items()))
+        for wspace in self.workspaces.values():
+            if (ref_type == "Id" and wspace["id"] == ref_value) or (ref_type == "Index" and wspace["idx"] == ref_value):
+                return wspace["id"]
+            if ref_type == "Name" and wspace["name"] == ref_value:
+                return wspace["id"]
+        return None
+
+
+class FakeNiriServer:
+    """
+    Unix socket server which behaves (roughly) like the niri IPC socket, using a FakeNiriModel.
+    Each connection is handled on its own thread. Scenario changes (e.g. opening windows)
+    should go through the server, so that the resulting events are sent to event stream listeners.
+    All actions received are logged (with timestamps), for benchmarking
+    """
+
+    def __init__(self, socket_path: str, model: FakeNiriModel | None = None, replay_capture_path: str | None = None):
+
+        self.socket_path = socket_path
+        self.model = model if model is not None else FakeNiriModel()
+        self.version = "25.08 (af4b5f9)"
+
+        # Storage for actions received, as (time, action_name, kwargs)
+        self.action_log: list[tuple[float, str, dict]] = []
+        self.num_events_sent = 0
+
+        self._lock = threading.RLock()
+        self._action_cond = threading.Condition(self._lock)
+        self._subscribers: list[socket.socket] = []
+        self._listener: socket.socket | None = None
+
+        # Set up replay data, if needed
+        self._replay_events: list[tuple[float, bytes]] = []
+        self._recorded_responses: dict[str, bytes] = {}
+        self.replay_speed = 0.0
+        if replay_capture_path is not None:
+            self._replay_events, self._recorded_responses = load_capture(replay_capture_path)
+
+    # .................................................................................................................
+
+    def start(self):
+        """Start listening for connections (on a separate thread)"""
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen()
+        threading.Thread(target=self._accept_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        with self._lock:
+            for conn in self._subscribers:
+                conn.close()
+            self._subscribers.clear()
+        if self._listener is not None:
+            self._listener.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        return
+
+    # .................................................................................................................
+
+    def open_window(self, app_id: str = "foot", workspace_id: int | None = None, is_floating: bool = False) -> int:
+        with self._lock:
+            win_id, events_list = self.model.open_window(app_id, workspace_id, is_floating)
+            self.send_events(events_list)
+        return win_id
+
+    def close_window(self, window_id: int):
+        with self._lock:
+            self.send_events(self.model.close_window(window_id))
+        return
+
+    def move_window_to_workspace(self, window_id: int, workspace_id: int, focus: bool = False):
+        with self._lock:
+            self.send_events(self.model.move_window_to_workspace(window_id, workspace_id, focus))
+        return
+
+    def send_events(self, events_list: list[dict]):
+        """Send events to all event stream listeners"""
+        if len(events_list) > 0:
+            self.send_raw_events(b"".join(encode_message(evt) for evt in events_list), len(events_list))
+        return
+
+    def send_raw_events(self, events_bytes: bytes, num_events: int = 1):
+        """Send pre-encoded (newline terminated) events to all event stream listeners"""
+        with self._lock:
+            for conn in tuple(self._subscribers):
+                try:
+                    conn.sendall(events_bytes)
+                except OSError:
+                    self._subscribers.remove(conn)
+            self.num_events_sent += num_events
+        return
+
+    # .................................................................................................................
+
+    def get_num_subscribers(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def wait_for_subscribers(self, num_subscribers: int = 1, timeout_sec: float = 5.0) -> bool:
+        """Wait for event stream listeners to connect. Returns False if this times out"""
+        t_end = perf_counter() + timeout_sec
+        while self.get_num_subscribers() < num_subscribers:
+            if perf_counter() > t_end:
+                return False
+            sleep(0.005)
+        return True
+
+    def wait_for_actions(self, num_actions: int, timeout_sec: float = 5.0) -> bool:
+        """Wait until the total number of logged actions reaches the given count. Returns False on timeout"""
+        with self._action_cond:
+            return self._action_cond.wait_for(lambda: len(self.action_log) >= num_actions, timeout_sec)
+
+    def wait_for_quiet(self, quiet_sec: float = 0.1, timeout_sec: float = 5.0) -> bool:
+        """Wait until no actions have been received for a given amount of time. Returns False on timeout"""
+        t_end = perf_counter() + timeout_sec
+        with self._action_cond:
+            while perf_counter() < t_end:
+                num_actions = len(self.action_log)
+                self._action_cond.wait(quiet_sec)
+                if len(self.action_log) == num_actions:
+                    return True
+        return False
+
+    # .................................................................................................................
+
+    def _accept_forever(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        return
+
+    def _handle_connection(self, conn: socket.socket):
+        """Respond to requests & actions from a single client connection"""
+
+        with conn.makefile("rb") as conn_file:
+            for line in conn_file:
+                msg = json.loads(line)
+
+                # Switch connection over to event streaming (niri ignores any further messages)
+                if msg == "EventStream":
+                    self._start_eventstream(conn)
+                    return
+
+                if isinstance(msg, str):
+                    conn.sendall(self._respond_to_request(msg))
+                elif "Action" in msg:
+                    action_name, kwargs = next(iter(msg["Action"].items()))
+                    with self._lock:
+                        # When replaying, the capture already holds the results of actions, so don't apply them
+                        is_replaying = len(self._replay_events) > 0
+                        is_ok, events_list = True, []
+                        if not is_replaying:
+                            is_ok, events_list = self.model.apply_action(action_name, kwargs)
+                        resp = {"Ok": "Handled"} if is_ok else {"Err": f"Couldn't handle {action_name}"}
+                        conn.sendall(encode_message(resp))
+                        self.send_events(events_list)
+                        self.action_log.append((perf_counter(), action_name, kwargs))
+                        self._action_cond.notify_all()
+                else:
+                    conn.sendall(encode_message({"Err": "error parsing request"}))
+
+        conn.close()
+        return
+
+    def _respond_to_request(self, request: str) -> bytes:
+        """Make the (encoded) response to a simple request, like 'Windows'"""
+
+        if request in self._recorded_responses:
+            return self._recorded_responses[request]
+
+        with self._lock:
+            model = self.model
+            if request == "Version":
+                resp_data = self.version
+            elif request == "Outputs":
+                resp_data = model.get_outputs_data()
+            elif request == "Windows":
+                resp_data = model.get_windows_data()
+            elif request == "Workspaces":
+                resp_data = model.get_workspaces_data()
+            elif request == "FocusedWindow":
+                win_id = model.focused_window_id
+                resp_data = model.get_window_data(win_id) if win_id is not None else None
+            elif request == "FocusedOutput":
+                resp_data = model.get_outputs_data()[model.output_name]
+            else:
+                return encode_message({"Err": f"Unsupported request: {request}"})
+
+        return encode_message({"Ok": {request: resp_data}})
+
+    def _start_eventstream(self, conn: socket.socket):
+        with self._lock:
+            conn.sendall(encode_message({"Ok": "Handled"}))
+            if len(self._replay_events) > 0:
+                threading.Thread(target=self._replay_to_connection, args=(conn,), daemon=True).start()
+            else:
+                events_list = self.model.get_initial_events()
+                conn.sendall(b"".join(encode_message(evt) for evt in events_list))
+                self.num_events_sent += len(events_list)
+                self._subscribers.append(conn)
+        return
+
+    def _replay_to_connection(self, conn: socket.socket):
+        """Send captured events to a single event stream listener, (optionally) with the original timing"""
+
+        t_start = perf_counter()
+        try:
+            for t_evt, evt_bytes in self._replay_events:
+                if self.replay_speed > 0:
+                    sleep(max(0, t_start + t_evt / self.replay_speed - perf_counter()))
+                conn.sendall(evt_bytes)
+                with self._lock:
+                    self.num_events_sent += 1
+        except OSError:
+            return
+
+        # Keep connection open (like niri would) once the replay is done
+        with self._lock:
+            self._subscribers.append(conn)
+        return
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def catch_sigterm(signum, frame):
+    """Turn SIGTERM events into exceptions for graceful shutdown"""
+    raise InterruptedError
+
+
+def encode_message(json_data) -> bytes:
+    """Encode a message the way niri does (compact json, one message per line)"""
+    return (json.dumps(json_data, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def load_capture(capture_path: str) -> tuple[list[tuple[float, bytes]], dict[str, bytes]]:
+    """
+    Load events & request responses from a capture file. Supports either a recording made
+    with record_niri.py or a plain event stream capture (e.g. from: niri msg --json event-stream)
+    Returns:
+        events_list, responses_lut
+    -> Events are given as (time, event bytes), where times are relative to the first event
+    -> Responses are given as a dictionary of: request name -> encoded response
+    """
+
+    with open(capture_path, "r") as infile:
+        lines_list = [line.strip() for line in infile if len(line.strip()) > 0]
+    if len(lines_list) == 0:
+        return [], {}
+
+    # Plain event stream capture, without timing info
+    first_line_json = json.loads(lines_list[0])
+    is_recording = "dir" in first_line_json
+    if not is_recording:
+        return [(0.0, (line + "\n").encode("utf-8")) for line in lines_list], {}
+
+    # Figure out which connection was the event stream & pair up requests/responses on all others
+    records_list = [json.loads(line) for line in lines_list]
+    eventstream_conns = {rec["conn"] for rec in records_list if rec["dir"] == "out" and rec["msg"] == '"EventStream"'}
+    events_list, responses_lut = [], {}
+    pending_requests_per_conn: dict[int, list] = {}
+    for rec in records_list:
+        conn_id, msg = rec["conn"], rec["msg"]
+        if rec["dir"] == "out":
+            pending_requests_per_conn.setdefault(conn_id, []).append(json.loads(msg))
+            continue
+
+        pending_list = pending_requests_per_conn.get(conn_id, [])
+        request = pending_list.pop(0) if len(pending_list) > 0 else None
+        if conn_id in eventstream_conns and request is None:
+            events_list.append((rec["t"], (msg + "\n").encode("utf-8")))
+        elif isinstance(request, str) and request != "EventStream":
+            responses_lut.setdefault(request, (msg + "\n").encode("utf-8"))
+
+    # Make event timing relative to the first event
+    t_first = events_list[0][0] if len(events_list) > 0 else 0
+    events_list = [(t - t_first, evt_bytes) for t, evt_bytes in events_list]
+
+    return events_list, responses_lut
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Main
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fake niri IPC socket, for testing/benchmarking without niri")
+    parser.add_argument("-s", "--socket", type=str, default="/tmp/fake_niri.sock", help="Path to socket to create")
+    parser.add_argument("-w", "--windows", type=int, default=0, help="Number of windows to open on workspace 1")
+    parser.add_argument("-c", "--capture", type=str, help="Capture to replay to event stream listeners")
+    parser.add_argument("-x", "--speed", type=float, default=0, help="Replay speed (0: as fast as possible)")
+    args = parser.parse_args()
+
+    server = FakeNiriServer(args.socket, replay_capture_path=args.capture)
+    server.replay_speed = args.speed
+    for _ in range(args.windows):
+        server.open_window()
+    server.start()
+    print(f"Fake niri listening on: {args.socket}", f"  use: NIRI_SOCKET={args.socket}", sep="\n")
+
+    signal.signal(signal.SIGTERM, catch_sigterm)
+    try:
+        num_actions_printed = 0
+        while True:
+            sleep(0.1)
+            for t, action_name, kwargs in server.action_log[num_actions_printed:]:
+                print("Action:", action_name, kwargs)
+            num_actions_printed = len(server.action_log)
+    except (KeyboardInterrupt, InterruptedError):
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recorder for niri IPC traffic. This sits between a script and niri (as a socket proxy),
+and saves every message passing through it in either direction, with timestamps.
+This captures the raw event stream, along with all requests/actions sent by the script
+and the responses from niri. Recordings can be replayed using fake_niri.py
+
+Example usage:
+    python3 bench/record_niri.py -o capture.jsonl
+    NIRI_SOCKET=/tmp/niri_record.sock python3 niri_tile_to_n.py
+    (then open/close/move windows as usual, hit ctrl+c on the recorder to stop)
+
+Each line of the recording is a json object, like:
+    {"t": 1.234, "conn": 2, "dir": "out", "msg": "<raw message>"}
+Where 'dir' is either "out" (script to niri) or "in" (niri to script)
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import json
+import signal
+import socket
+import argparse
+import threading
+from time import perf_counter
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Args
+
+parser = argparse.ArgumentParser(description="Record niri IPC traffic between scripts & niri")
+parser.add_argument("-o", "--output", type=str, default="niri_capture.jsonl", help="Path to save recording")
+parser.add_argument("-s", "--socket", type=str, default="/tmp/niri_record.sock", help="Path to proxy socket")
+
+args = parser.parse_args()
+OUTPUT_PATH = args.output
+PROXY_SOCKET_PATH = args.socket
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class Recorder:
+    """Helper used to write timestamped messages to the recording file (from multiple threads)"""
+
+    def __init__(self, output_path: str):
+        self._file = open(output_path, "w")
+        self._lock = threading.Lock()
+        self._t_start = perf_counter()
+        self.num_messages = 0
+
+    def write(self, conn_id: int, direction: str, msg_bytes: bytes):
+        record = {
+            "t": round(perf_counter() - self._t_start, 6),
+            "conn": conn_id,
+            "dir": direction,
+            "msg": msg_bytes.decode("utf-8"),
+        }
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(json.dumps(record) + "\n")
+                self.num_messages += 1
+        return
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        return
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def catch_sigterm(signum, frame):
+    """Turn SIGTERM events into exceptions for graceful shutdown"""
+    raise InterruptedError
+
+
+def forward_forever(src: socket.socket, dst: socket.socket, recorder: Recorder, conn_id: int, direction: str):
+    """Pass data from one socket to another, recording each (newline separated) message along the way"""
+
+    partial_msg = b""
+    try:
+        while True:
+            data = src.recv(65536)
+            if len(data) == 0:
+                break
+
+            # Forward right away, so we don't add delays to the traffic
+            dst.sendall(data)
+
+            msgs_list = (partial_msg + data).split(b"\n")
+            partial_msg = msgs_list.pop()
+            for msg_bytes in msgs_list:
+                recorder.write(conn_id, direction, msg_bytes)
+
+    except OSError:
+        pass
+
+    finally:
+        for skt in (src, dst):
+            try:
+                skt.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    return
+
+
+def handle_connection(client_conn: socket.socket, niri_socket_path: str, recorder: Recorder, conn_id: int):
+    """Connect a script to niri, with recording of traffic in both directions"""
+
+    niri_conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    niri_conn.connect(niri_socket_path)
+    threading.Thread(
+        target=forward_forever, args=(niri_conn, client_conn, recorder, conn_id, "in"), daemon=True
+    ).start()
+    forward_forever(client_conn, niri_conn, recorder, conn_id, "out")
+    return
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Main
+
+niri_skt_path = os.environ.get("NIRI_SOCKET")
+if niri_skt_path is None or niri_skt_path == "":
+    print("Couldn't find niri socket! (from env: NIRI_SOCKET)")
+    quit()
+
+if os.path.exists(PROXY_SOCKET_PATH):
+    os.remove(PROXY_SOCKET_PATH)
+listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+listener.bind(PROXY_SOCKET_PATH)
+listener.listen()
+recorder = Recorder(OUTPUT_PATH)
+print(
+    f"Recording niri IPC traffic to: {OUTPUT_PATH}",
+    f"Run scripts using: NIRI_SOCKET={PROXY_SOCKET_PATH}",
+    "(ctrl+c to stop)",
+    sep="\n",
+)
+
+signal.signal(signal.SIGTERM, catch_sigterm)
+try:
+    conn_id = 0
+    while True:
+        client_conn, _ = listener.accept()
+        conn_id += 1
+        threading.Thread(
+            target=handle_connection, args=(client_conn, niri_skt_path, recorder, conn_id), daemon=True
+        ).start()
+
+except (KeyboardInterrupt, InterruptedError):
+    pass
+
+finally:
+    listener.close()
+    os.remove(PROXY_SOCKET_PATH)
+    recorder.close()
+    print("", f"Recorded {recorder.num_messages} messages", sep="\n")
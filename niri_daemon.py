@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import io
+import sys
+import json
+import socket
+import signal
+import argparse
+import threading
+import traceback
+
+from niri_ipc import NiriSocket, NiriRequests, NiriClient, NiriStateClient, use_client, make_workspace_reference
+from niri_state import NiriState, STATE_EVENT_NAMES, make_state_snapshot, make_state_from_snapshot
+from niri_spawn import WarmPool, reap_spawned
+from niri_trigger import SCRIPT_NAMES_LUT, get_daemon_socket_path, get_script_path
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Args
+
+# Define script arguments
+parser = argparse.ArgumentParser(
+    description="Resident daemon used to run keybind scripts (e.g. spawnjump) with pre-loaded niri state",
+    epilog="Scripts are triggered using niri_trigger.py, for example: niri_trigger.py spawnjump alacritty -p",
+)
+parser.add_argument(
+    "-r",
+    "--ready_timeout",
+    default=5,
+    type=float,
+    help="Maximum time (in seconds) to wait for initial niri state before accepting commands (default 5)",
+)
+parser.add_argument(
+    "-m",
+    "--max_wait",
+    default=2.0,
+    type=float,
+    help="Maximum time (in seconds) that scripts can wait for newly spawned windows (e.g. spawnjump --wait),"
+    " since other commands are held up while waiting (default 2)",
+)
+parser.add_argument(
+    "-p",
+    "--pool",
+    nargs="+",
+    action="append",
+    default=[],
+    metavar="COMMAND",
+    help="Command to keep pre-spawned (parked) instances of, for use by spawnjump. Can be followed by an app-id"
+    " (if different from the command) and can be given multiple times, e.g. -p 'flatpak run app.zen_browser.zen'",
+)
+parser.add_argument(
+    "-n",
+    "--pool_size",
+    default=1,
+    type=int,
+    help="Number of parked instances to keep for each pooled command (default 1)",
+)
+parser.add_argument(
+    "-w",
+    "--pool_workspace",
+    default="pool",
+    type=str,
+    help="Name of the workspace used to park pre-spawned instances (default 'pool')",
+)
+
+# Get script configs
+args, _ = parser.parse_known_args()
+READY_TIMEOUT_SEC = args.ready_timeout
+MAX_WAIT_SEC = args.max_wait
+POOL_CONFIGS = args.pool
+POOL_SIZE = args.pool_size
+POOL_WORKSPACE_NAME = args.pool_workspace
+
+# Sanity check
+assert all(len(pool_args) <= 2 for pool_args in POOL_CONFIGS), "Pools take a command & (optional) app-id only"
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class ThreadOutputRouter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout/sys.stderr, which sends anything written by a thread to that thread's
+    own buffer (if one is set, e.g. while running a script), otherwise to the original stream.
+    This way script output goes back to the trigger client that ran it, without picking up
+    messages from other threads (e.g. the event thread), which still end up in the terminal
+    """
+
+    def __init__(self, orig_stream):
+        self._orig_stream = orig_stream
+        self._local = threading.local()
+
+    def set_buffer(self, buffer: io.StringIO | None):
+        """Send output from the calling thread to the given buffer (or back to the original stream, if None)"""
+        self._local.buffer = buffer
+        return self
+
+    def _get_stream(self):
+        buffer = getattr(self._local, "buffer", None)
+        return buffer if buffer is not None else self._orig_stream
+
+    def write(self, text: str) -> int:
+        return self._get_stream().write(text)
+
+    def flush(self):
+        return self._get_stream().flush()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def catch_sigterm(signum, frame):
+    """Turn SIGTERM events into exceptions for graceful shutdown"""
+    raise InterruptedError
+
+
+def catch_sigchld(signum, frame):
+    """Clean up after spawned applications exit (otherwise they linger as zombie processes)"""
+    reap_spawned()
+    return
+
+
+def read_events_forever(reader: NiriRequests, state: NiriState, state_lock: threading.Lock, ready: threading.Event):
+    """Keeps the daemon state up-to-date using the niri event stream (meant to run on a separate thread)"""
+
+    try:
+        for evt_name, evt_data in reader.read_eventstream(STATE_EVENT_NAMES):
+            with state_lock:
+                state.update(evt_name, evt_data)
+                if len(warm_pools_lut) > 0:
+                    update_warm_pools(evt_name, evt_data, state)
+
+                # Workspace changes may come from monitors being (un)plugged, so refresh output info
+                if evt_name == "WorkspacesChanged":
+                    state.set_outputs(events_client.get_outputs())
+            if evt_name == "WindowsChanged":
+                ready.set()
+
+    except Exception:
+        traceback.print_exc()
+
+    # If we lose the event stream, our state is useless, so shut down the whole daemon
+    print("Lost connection to niri event stream, shutting down...")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+    return
+
+
+def update_warm_pools(evt_name: str, evt_data: dict, state: NiriState) -> None:
+    """
+    Park newly opened windows that belong to pre-spawned instances (by moving them to the pool workspace)
+    and replace parked windows that get closed. Meant to be called from the event thread only
+    """
+
+    if evt_name == "WindowOpenedOrChanged":
+        win = state.windows[evt_data["window"]["id"]]
+        for pool in warm_pools_lut.values():
+            if pool.adopt_window(win, state):
+                is_ok, resp = events_client.action(
+                    "MoveWindowToWorkspace",
+                    window_id=win.id,
+                    reference=make_workspace_reference(pool.workspace_name),
+                    focus=False,
+                )
+
+                # If the window couldn't be moved (e.g. missing pool workspace), leave it as a regular window
+                if is_ok:
+                    pool.park_window(win.id)
+                else:
+                    print(f"Error moving window to pool workspace ({pool.command}):", resp)
+                break
+
+    elif evt_name == "WindowClosed":
+        for pool in warm_pools_lut.values():
+            if pool.discard_window(evt_data["id"]):
+                pool.refill(state)
+                break
+
+    return
+
+
+def refill_warm_pools() -> None:
+    """Spawn new instances for any pools that are missing some (e.g. after spawnjump takes one)"""
+    with state_lock:
+        for pool in warm_pools_lut.values():
+            pool.refill(niri_state)
+    return
+
+
+def close_warm_pools() -> None:
+    """Close all parked windows, so they don't linger as regular windows after the daemon exits"""
+    try:
+        for pool in warm_pools_lut.values():
+            for win_id in pool.get_parked_ids():
+                niri_client.action("CloseWindow", id=win_id)
+    except OSError:
+        # Connection to niri may already be gone (e.g. if niri exited)
+        pass
+    return
+
+
+def load_script_code(script_name: str):
+    """Read & compile a script ahead of time, so that it can be run quickly on request"""
+    script_path = get_script_path(script_name)
+    with open(script_path, "r") as infile:
+        script_code = compile(infile.read(), script_path, "exec")
+    return script_code
+
+
+def run_script(script_name: str, script_args: list[str]) -> str:
+    """
+    Run one of the keybind scripts, as if it were called from the command line.
+    The script uses (a copy of) the daemon's state & connection, instead of connecting to niri itself.
+    Returns anything the script prints out, as a single string
+    """
+
+    # App-id inspection mode (spawnjump with no args) loops forever, which would lock up the daemon
+    if script_name == "spawnjump" and len(script_args) == 0:
+        return "App-id inspection isn't supported through the daemon, run niri_spawnjump.py directly\n"
+
+    script_path = get_script_path(script_name)
+    orig_argv = sys.argv
+    out_buffer = io.StringIO()
+
+    # Give the script it's own copy of the state, so that the event thread isn't held up while the
+    # script runs (e.g. while waiting on a newly spawned window) and the state can't change mid-script
+    with state_lock:
+        script_state = make_state_from_snapshot(make_state_snapshot(niri_state, skt_path))
+    state_client = NiriStateClient(niri_client, script_state, warm_pools_lut, MAX_WAIT_SEC)
+
+    with use_client(state_client):
+        sys.argv = [script_path, *script_args]
+        stdout_router.set_buffer(out_buffer)
+        stderr_router.set_buffer(out_buffer)
+        try:
+            exec(scripts_code_lut[script_name], {"__name__": "__main__", "__file__": script_path})
+        except SystemExit:
+            # Scripts call quit() when done, argparse also exits on bad/help args
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            sys.argv = orig_argv
+            stdout_router.set_buffer(None)
+            stderr_router.set_buffer(None)
+
+    return out_buffer.getvalue()
+
+
+def handle_trigger_connection(conn: socket.socket) -> None:
+    """Read a single command (json list of script args) from a trigger client and respond with script output"""
+
+    conn.settimeout(1.0)
+    with conn, conn.makefile("rb") as conn_file:
+        try:
+            argv = json.loads(conn_file.readline())
+            is_valid = isinstance(argv, list) and len(argv) > 0 and argv[0] in SCRIPT_NAMES_LUT
+            if is_valid:
+                resp_str = run_script(argv[0], [str(arg) for arg in argv[1:]])
+                if len(warm_pools_lut) > 0:
+                    refill_warm_pools()
+            else:
+                resp_str = f"Bad command: {argv} (expecting one of: {', '.join(SCRIPT_NAMES_LUT.keys())})\n"
+            conn.sendall(resp_str.encode("utf-8"))
+
+        except (OSError, ValueError) as err:
+            print("Error handling trigger command:", err)
+
+    return
+
+
+def make_listener_socket(socket_path: str) -> socket.socket:
+    """Set up socket used to listen for trigger commands. Fails if another daemon is already running"""
+
+    # Check for existing daemon or clean up left-over socket file from previous run
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as test_skt:
+            try:
+                test_skt.connect(socket_path)
+                raise RuntimeError(f"Daemon is already running! (socket: {socket_path})")
+            except ConnectionRefusedError:
+                os.remove(socket_path)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen()
+    return listener
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Setup
+
+# Send script output back to trigger clients, without capturing output from other threads (see: run_script)
+stdout_router, stderr_router = ThreadOutputRouter(sys.stdout), ThreadOutputRouter(sys.stderr)
+sys.stdout, sys.stderr = stdout_router, stderr_router
+
+# Get niri socket from env
+skt_path = NiriSocket.get_niri_socket_path()
+if skt_path is None or skt_path == "":
+    print("Couldn't find niri socket! (from env: NIRI_SOCKET)")
+    quit()
+
+# Create separate read/write sockets, since eventstream reader cannot issue actions
+# -> Event thread gets it's own client, so that scripts can use theirs without holding the state lock
+niri_reader = NiriRequests(skt_path)
+events_client = NiriClient(skt_path)
+niri_client = NiriClient(skt_path)
+
+# Set up pools of pre-spawned application instances (filled once initial state is ready)
+warm_pools_lut: dict[str, WarmPool] = {}
+for pool_command, *pool_app_id in POOL_CONFIGS:
+    pool_app_id = pool_app_id[0] if len(pool_app_id) > 0 else None
+    warm_pools_lut[pool_command] = WarmPool(pool_command, pool_app_id, POOL_SIZE, POOL_WORKSPACE_NAME)
+
+# Set up shared state, which is kept up-to-date by listening to the event stream
+niri_state = NiriState(niri_client.get_outputs())
+state_lock = threading.Lock()
+state_ready = threading.Event()
+event_thread = threading.Thread(
+    target=read_events_forever,
+    args=(niri_reader, niri_state, state_lock, state_ready),
+    daemon=True,
+)
+event_thread.start()
+
+# Pre-load all scripts, so we don't need to re-read them on every command
+scripts_code_lut = {script_name: load_script_code(script_name) for script_name in SCRIPT_NAMES_LUT.keys()}
+
+# Clean up after spawned applications exit. Only applications spawned by the scripts are reaped
+# (rather than ignoring SIGCHLD entirely), so scripts can still wait on their own subprocesses
+signal.signal(signal.SIGCHLD, catch_sigchld)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% *** Command listening loop ***
+
+# Wait for initial window/workspace state before accepting commands
+if not state_ready.wait(READY_TIMEOUT_SEC):
+    print("Timed out waiting for initial niri state! Scripts may not work properly...")
+refill_warm_pools()
+
+daemon_skt_path = get_daemon_socket_path()
+listener = make_listener_socket(daemon_skt_path)
+
+signal.signal(signal.SIGTERM, catch_sigterm)
+try:
+    while True:
+        conn, _ = listener.accept()
+        handle_trigger_connection(conn)
+
+except (KeyboardInterrupt, InterruptedError):
+    pass
+
+finally:
+    listener.close()
+    if os.path.exists(daemon_skt_path):
+        os.remove(daemon_skt_path)
+    close_warm_pools()
+    niri_client.close()
+    events_client.close()
+    niri_reader.close()
+    print("", f"({os.path.basename(__file__)}) - Closed niri IPC connection", sep="\n")
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for talking to niri directly over the IPC socket ($NIRI_SOCKET).
+This avoids having to run a 'niri msg ...' subprocess for every query/action.
+See: https://github.com/YaLTeR/niri/wiki/IPC
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import socket
+import json
+import os
+import logging
+from time import perf_counter, sleep
+from contextlib import contextmanager
+
+from niri_state import NiriState, WindowInfo, WorkspaceInfo, OutputInfo, make_output_state_from_Outputs
+from niri_state import get_state_snapshot_path, load_state_snapshot, is_snapshot_fresh, make_state_from_snapshot
+
+# Use a faster json decoder if one is installed, otherwise fall back to the built-in decoder
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from msgspec.json import decode as json_loads
+    except ImportError:
+        json_loads = json.loads
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Globals
+
+# Shared modules only log through their own (un-configured) logger, scripts decide where messages end up
+logger = logging.getLogger(__name__)
+
+# Client handed out by connect_client() instead of making a new connection (see: use_client)
+_SHARED_CLIENT = None
+
+# Start of every layout change event message (used to find events to merge without decoding)
+LAYOUTS_CHANGED_PREFIX = b'{"WindowLayoutsChanged":'
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class NiriSocket:
+    """Helper used to read & write json messages to a niri socket connection"""
+
+    def __init__(self, socket_path: str, buffer_size: int = 4096):
+
+        # Sanity check
+        is_bad_path = socket_path is None or str(socket_path) == ""
+        assert not is_bad_path, "Cannot connect to niri, no socket path given..."
+
+        self._socket_path = socket_path
+        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._skt.connect(socket_path)
+
+        # Storage for received (binary) data. Messages are newline separated, and may be
+        # split across reads or be larger than the buffer (in which case it grows as needed)
+        # -> Data between 'start' & 'end' indexes has been received but not yet read out
+        # -> 'Scan' index marks how far we've already searched for newlines (so we don't re-search)
+        self._bufsize = buffer_size
+        self._buf = bytearray(buffer_size)
+        self._buf_view = memoryview(self._buf)
+        self._buf_start_idx = 0
+        self._buf_end_idx = 0
+        self._buf_scan_idx = 0
+
+        # Count of event stream messages that were merged into others (see: _decode_event)
+        self.num_coalesced_events = 0
+
+        # Optional timing recorder (see niri_stats.py), used to record event decoding time
+        self.stats = None
+
+    def _read_next(self):
+        """Read the next (json) message from the socket. Returns an empty dict if the connection closes"""
+        msg_bytes = self._read_next_line()
+        return json_loads(msg_bytes) if msg_bytes is not None else {}
+
+    def _read_next_line(self) -> bytes | None:
+        """
+        Read the next message (i.e. line of text) from the socket, as raw bytes (without the newline)
+        Returns None if the connection closes
+        """
+
+        while True:
+
+            # Check for a complete message that we've already received
+            msg_bytes = self._pop_buffered_line()
+            if msg_bytes is not None:
+                return msg_bytes
+
+            # Make room for more data if the buffer is full
+            if self._buf_end_idx == len(self._buf):
+                self._make_buffer_space()
+
+            # Listen for more (binary) data directly into the buffer
+            # -> Will return 0 bytes if connection closes
+            num_bytes = self._skt.recv_into(self._buf_view[self._buf_end_idx :])
+            if num_bytes == 0:
+                logger.debug("No data received, connection closed")
+                return None
+            self._buf_end_idx += num_bytes
+
+    def _pop_buffered_line(self) -> bytes | None:
+        """
+        Read out the next complete message, if it has already been received (i.e. is in the buffer).
+        Returns None if there is no complete message, this never waits on the socket
+        """
+
+        # Check for a complete message, only searching through newly received data
+        newline_idx = self._buf.find(b"\n", self._buf_scan_idx, self._buf_end_idx)
+        if newline_idx < 0:
+            self._buf_scan_idx = self._buf_end_idx
+            return None
+
+        msg_bytes = bytes(self._buf_view[self._buf_start_idx : newline_idx])
+        self._buf_start_idx = self._buf_scan_idx = newline_idx + 1
+        if self._buf_start_idx == self._buf_end_idx:
+            self._buf_start_idx = self._buf_end_idx = self._buf_scan_idx = 0
+        return msg_bytes
+
+    def _pop_buffered_lines_with_prefix(self, prefix: bytes) -> list[bytes]:
+        """
+        Read out all complete messages at the front of the buffer that start with the given prefix.
+        Stops at the first message that doesn't match (or isn't fully received yet)
+        """
+
+        msgs_list = []
+        while self._buf.startswith(prefix, self._buf_start_idx, self._buf_end_idx):
+            msg_bytes = self._pop_buffered_line()
+            if msg_bytes is None:
+                break
+            msgs_list.append(msg_bytes)
+
+        return msgs_list
+
+    def _make_buffer_space(self):
+        """
+        Helper used to free up space at the end of the read buffer. Shifts un-read data to the
+        start of the buffer if possible, otherwise doubles the buffer size (e.g. for very large messages)
+        """
+
+        num_unread = self._buf_end_idx - self._buf_start_idx
+        if self._buf_start_idx > 0:
+            self._buf_view[:num_unread] = self._buf_view[self._buf_start_idx : self._buf_end_idx]
+        else:
+            self._buf_view.release()
+            self._buf.extend(bytes(len(self._buf)))
+            self._buf_view = memoryview(self._buf)
+
+        self._buf_scan_idx -= self._buf_start_idx
+        self._buf_start_idx, self._buf_end_idx = 0, num_unread
+        return
+
+    def _decode_event(self, msg_bytes: bytes, event_names: set[str] | None, coalesce_layouts: bool):
+        """
+        Helper used to decode a single event stream message into: (event_name, event_data)
+        Returns None if the event is not one of the given event names (when given)
+        """
+
+        # Check event name before decoding, so we can skip events we don't care about
+        skip_unlisted = event_names is not None
+        event_name = peek_event_name(msg_bytes)
+        if skip_unlisted and event_name is not None and event_name not in event_names:
+            return None
+
+        # Merge with any other layout changes that are already waiting to be read
+        if coalesce_layouts and event_name == "WindowLayoutsChanged":
+            merge_msgs_list = self._pop_buffered_lines_with_prefix(LAYOUTS_CHANGED_PREFIX)
+            if len(merge_msgs_list) > 0:
+                self.num_coalesced_events += len(merge_msgs_list)
+                return event_name, merge_layout_changes([msg_bytes, *merge_msgs_list])
+
+        event_json = json_loads(msg_bytes)
+        if event_name is None:
+            event_name = tuple(event_json.keys())[0]
+            if skip_unlisted and event_name not in event_names:
+                return None
+        return event_name, event_json.get(event_name, None)
+
+    def _send_string(self, string: str):
+        """Helper used to send simple string messages (e.g. for requests)"""
+        return self._skt.sendall(f'"{string}"\n'.encode("utf-8"))
+
+    def _send_json(self, json_data: dict):
+        """Helper used to send json message (e.g. for actions)"""
+        json_as_str = json.dumps(json_data, indent=None, separators=(",", ":"))
+        return self._skt.sendall(("".join([json_as_str, "\n"])).encode("utf-8"))
+
+    def reconnect(self):
+        """Close & re-open the connection to niri (e.g. after losing the connection). Discards any unread data"""
+        self._skt.close()
+        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._skt.connect(self._socket_path)
+        self._buf_start_idx = self._buf_end_idx = self._buf_scan_idx = 0
+        return self
+
+    def set_timeout(self, timeout_sec: float | None):
+        """Limit the time spent waiting on (blocking) reads, after which a TimeoutError is raised. None to disable"""
+        self._skt.settimeout(timeout_sec)
+        return self
+
+    def close(self):
+        self._skt.close()
+
+    @staticmethod
+    def get_niri_socket_path():
+        return os.environ.get("NIRI_SOCKET")
+
+
+class NiriRequests(NiriSocket):
+    """
+    Helper used to make requests to niri
+    See: https://yalter.github.io/niri/niri_ipc/enum.Request.html
+    """
+
+    def get_version(self):
+        return self.request("Version")
+
+    def get_windows(self) -> list[WindowInfo]:
+        return [WindowInfo(win_data) for win_data in self.request_data("Windows")]
+
+    def get_workspaces(self) -> list[WorkspaceInfo]:
+        return [WorkspaceInfo(wspace_data) for wspace_data in self.request_data("Workspaces")]
+
+    def get_outputs(self) -> dict[str, OutputInfo]:
+        return make_output_state_from_Outputs(self.request_data("Outputs"))
+
+    def get_state(self) -> NiriState:
+        """
+        Build a (one-off) copy of the niri window/workspace state, including the window indexes
+        (e.g. for finding windows by app_id). Output info is not included
+        """
+        niri_state = NiriState()
+        niri_state.update("WorkspacesChanged", {"workspaces": self.request_data("Workspaces")})
+        niri_state.update("WindowsChanged", {"windows": self.request_data("Windows")})
+        return niri_state
+
+    def get_focused_window(self) -> WindowInfo | None:
+        win_data = self.request_data("FocusedWindow")
+        return WindowInfo(win_data) if win_data is not None else None
+
+    def get_focused_output(self) -> OutputInfo | None:
+        out_data = self.request_data("FocusedOutput")
+        return OutputInfo(out_data) if out_data is not None else None
+
+    def request(self, message: str):
+        self._send_string(message)
+
+        # Listen for ok/err response
+        return parse_request_response(self._read_next())
+
+    def request_data(self, message: str):
+        """
+        Helper used to make a request and return only the response payload
+        (e.g. the list of windows from a 'Windows' request). Raises an error if the request fails
+        """
+        is_ok, resp_data = self.request(message)
+        if not is_ok:
+            raise IOError(f"Error requesting {message}: {resp_data}")
+        return resp_data[message]
+
+    def read_eventstream(self, event_names: set[str] | None = None, coalesce_layouts: bool = True):
+        """
+        Generator which yields (event_name, event_data) for every event from niri.
+        If a set of event names is given, then all other events are skipped
+        without being decoded (which saves a lot of work on larger events).
+        If coalescing, back-to-back WindowLayoutsChanged events which have already been
+        received (e.g. during animations) are merged into a single event
+        """
+
+        is_ok, evt_resp = self.request("EventStream")
+        if not is_ok:
+            logger.warning("EventStream response: %s", evt_resp)
+            raise IOError("Error requesting EventStream")
+
+        # Read events from stream, forever
+        while True:
+            msg_bytes = self._read_next_line()
+            if msg_bytes is None:
+                raise IOError("Lost connection to niri event stream")
+
+            t1 = perf_counter()
+            evt = self._decode_event(msg_bytes, event_names, coalesce_layouts)
+            if evt is not None:
+                if self.stats is not None:
+                    self.stats.record("decode", evt[0], perf_counter() - t1)
+                yield evt
+        return
+
+
+class NiriActions(NiriSocket):
+    """
+    Helper used to trigger actions through the niri IPC
+    See: https://yalter.github.io/niri/niri_ipc/enum.Action.html
+    """
+
+    def action(self, message: str, **kwargs):
+
+        # Build action request
+        self._skt.sendall(encode_actions([(message, kwargs)]))
+
+        # Listen for ok/err response
+        return self._read_action_response()
+
+    def action_batch(self, actions: list[tuple[str, dict]]) -> list[tuple[bool, dict]]:
+        """
+        Helper used to send a sequence of actions all at once, for example:
+            action_batch([("FocusWindow", {"id": 5}), ("MaximizeColumn", {})])
+        All actions are written in a single send, then responses are read back in order.
+        This is faster than calling action(...) repeatedly, since we don't need to wait
+        for each response before sending the next action.
+        Returns a list of (is_ok, response) results, one per action
+        """
+
+        if len(actions) == 0:
+            return []
+
+        # Send all actions together, as a block of newline-separated json messages
+        self._skt.sendall(encode_actions(actions))
+
+        # Niri handles messages in order, so responses come back in the same order as the actions
+        return [self._read_action_response() for _ in actions]
+
+    def _read_action_response(self):
+        """Helper used to read the ok/err response to an action"""
+        return parse_action_response(self._read_next())
+
+
+class NiriClient(NiriRequests, NiriActions):
+    """
+    Helper used to make both requests & actions over a single (persistent) connection.
+    Meant for one-shot scripts. Note that this cannot be used for reading the event stream,
+    since niri doesn't accept further messages on a connection once it starts streaming events
+    """
+
+    def get_warm_pool(self, command: str):
+        """Get the pool of pre-spawned instances of a command (see niri_spawn.py), only available through the daemon"""
+        return None
+
+    def get_max_wait_sec(self) -> float | None:
+        """Get the longest time scripts should wait on niri (e.g. for new windows), None if there is no limit"""
+        return None
+
+
+class NiriStateClient:
+    """
+    Stand-in for a NiriClient, which answers requests using existing niri state (e.g. from
+    the daemon's event stream or a saved snapshot) rather than asking niri. Once a script
+    triggers an action, the state may be out-of-date (we won't see the resulting events),
+    so all requests after that point are passed through to niri directly.
+    """
+
+    def __init__(
+        self, client: NiriClient, state: NiriState, warm_pools: dict | None = None, max_wait_sec: float | None = None
+    ):
+        self._client = client
+        self._state = state
+        self._warm_pools = warm_pools if warm_pools is not None else {}
+        self._max_wait_sec = max_wait_sec
+        self._is_stale = False
+
+    def reset(self):
+        """Mark state as up-to-date, should be called before running each script"""
+        self._is_stale = False
+        return self
+
+    def get_windows(self) -> list[WindowInfo]:
+        if self._is_stale:
+            return self._client.get_windows()
+        return list(self._state.windows.values())
+
+    def get_workspaces(self) -> list[WorkspaceInfo]:
+        if self._is_stale:
+            return self._client.get_workspaces()
+        return list(self._state.workspaces.values())
+
+    def get_outputs(self) -> dict[str, OutputInfo]:
+        return self._client.get_outputs() if self._is_stale else self._state.outputs
+
+    def get_state(self) -> NiriState:
+        """Get the existing state (kept up-to-date by events, including indexes). Do not modify!"""
+        return self._client.get_state() if self._is_stale else self._state
+
+    def get_focused_window(self) -> WindowInfo | None:
+        return self._client.get_focused_window() if self._is_stale else self._state.get_focused_window()
+
+    def get_focused_output(self) -> OutputInfo | None:
+        return self._client.get_focused_output() if self._is_stale else self._state.get_focused_output()
+
+    def get_warm_pool(self, command: str):
+        return self._warm_pools.get(command, None)
+
+    def get_max_wait_sec(self) -> float | None:
+        return self._max_wait_sec
+
+    def request(self, message: str):
+        return self._client.request(message)
+
+    def request_data(self, message: str):
+        return self._client.request_data(message)
+
+    def action(self, message: str, **kwargs):
+        self._is_stale = True
+        return self._client.action(message, **kwargs)
+
+    def action_batch(self, actions: list[tuple[str, dict]]) -> list[tuple[bool, dict]]:
+        self._is_stale = True
+        return self._client.action_batch(actions)
+
+    def close(self):
+        return self._client.close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def connect_client(use_snapshot: bool = True) -> NiriClient | NiriStateClient:
+    """
+    Helper used to connect to niri using the socket path given by the environment (NIRI_SOCKET)
+    If a shared client has been set up (see: use_client), then it is returned instead.
+    If a fresh state snapshot is available (saved by niri_tile_to_n.py), then the returned
+    client answers window/workspace/output requests from the snapshot, instead of asking niri
+    """
+
+    if _SHARED_CLIENT is not None:
+        return _SHARED_CLIENT
+
+    skt_path = NiriSocket.get_niri_socket_path()
+    if skt_path is None or skt_path == "":
+        raise IOError("Couldn't find niri socket! (from env: NIRI_SOCKET)")
+    client = NiriClient(skt_path)
+
+    if use_snapshot:
+        snapshot_state = load_fresh_snapshot_state(client, skt_path)
+        if snapshot_state is not None:
+            return NiriStateClient(client, snapshot_state)
+
+    return client
+
+
+def load_fresh_snapshot_state(client: NiriClient, niri_socket_path: str) -> NiriState | None:
+    """
+    Helper used to load niri state from a saved snapshot, but only if it is still being kept
+    up-to-date (i.e. the process that saved it is still running & connected to niri). As a sanity check,
+    the focused window is requested from niri (a small, fast request) and compared to the snapshot,
+    in case there are events that haven't been saved yet. Returns None if the snapshot can't be used
+    """
+
+    snapshot_path = get_state_snapshot_path()
+    if snapshot_path is None:
+        return None
+
+    snapshot = load_state_snapshot(niri_socket_path, snapshot_path)
+    if snapshot is None or not is_snapshot_fresh(snapshot):
+        return None
+
+    snapshot_state = make_state_from_snapshot(snapshot)
+    snap_win, niri_win = snapshot_state.get_focused_window(), client.get_focused_window()
+    if snap_win is None or niri_win is None:
+        is_match = snap_win is None and niri_win is None
+    else:
+        is_match = all(getattr(snap_win, k) == getattr(niri_win, k) for k in ("id", "workspace_id", "is_floating"))
+
+    return snapshot_state if is_match else None
+
+
+def connect_with_retry(socket_class, socket_path: str, timeout_sec: float = 10, max_wait_sec: float = 1.0):
+    """
+    Helper used to connect to niri, retrying with (exponential) backoff if the socket isn't ready yet,
+    for example when starting up along with niri. Raises the connection error if the timeout is reached
+    """
+
+    t_end = perf_counter() + timeout_sec
+    wait_sec = 0.01
+    while True:
+        try:
+            return socket_class(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if perf_counter() + wait_sec > t_end:
+                raise
+        sleep(wait_sec)
+        wait_sec = min(2 * wait_sec, max_wait_sec)
+
+
+def encode_actions(actions: list[tuple[str, dict]]) -> bytes:
+    """
+    Helper used to encode a sequence of (action name, kwargs) into a block of
+    newline-separated json messages, ready to be sent to niri
+    """
+    json_str_list = [json.dumps({"Action": {msg: kwargs}}, separators=(",", ":")) for msg, kwargs in actions]
+    json_str_list.append("")
+    return "\n".join(json_str_list).encode("utf-8")
+
+
+def parse_request_response(resp_json: dict) -> tuple[bool, dict]:
+    """Helper used to split a (decoded) request response into: is_ok, response data"""
+    is_ok_resp = "Ok" in resp_json.keys()
+    resp_data = resp_json.get("Ok" if is_ok_resp else "Err", None)
+    return is_ok_resp, resp_data
+
+
+def parse_action_response(resp_json: dict) -> tuple[bool, dict]:
+    """Helper used to split a (decoded) action response into: is_ok, response data"""
+    is_ok_resp = "Err" not in resp_json.keys()
+    resp_data = resp_json if is_ok_resp else resp_json["Err"]
+    return is_ok_resp, resp_data
+
+
+def peek_event_name(msg_bytes: bytes) -> str | None:
+    """
+    Helper used to get the name of an event from a raw event stream message, without decoding it.
+    Events are formatted like: {"EventName":{...event data...}}
+    Returns None if the message isn't formatted as expected
+    """
+    if msg_bytes.startswith(b'{"'):
+        name_end_idx = msg_bytes.find(b'"', 2)
+        if name_end_idx > 2:
+            return msg_bytes[2:name_end_idx].decode("utf-8")
+    return None
+
+
+def merge_layout_changes(msgs_list: list[bytes]) -> dict:
+    """
+    Helper used to merge several (raw) WindowLayoutsChanged events into a single event,
+    keeping only the last layout for each window. Returns the merged event data
+    """
+    layouts_per_window_id = {}
+    for msg_bytes in msgs_list:
+        for win_id, layout in json_loads(msg_bytes)["WindowLayoutsChanged"]["changes"]:
+            layouts_per_window_id[win_id] = layout
+    return {"changes": list(layouts_per_window_id.items())}
+
+
+def make_workspace_reference(workspace_key: int | str) -> dict:
+    """
+    Helper used to build a workspace reference for actions (e.g. FocusWorkspace).
+    Mimics 'niri msg' argument handling: digits are treated as an index, anything else is a name
+    See: https://yalter.github.io/niri/niri_ipc/enum.WorkspaceReferenceArg.html
+    """
+    key_str = str(workspace_key)
+    return {"Index": int(key_str)} if key_str.isdigit() else {"Name": key_str}
+
+
+@contextmanager
+def use_client(client):
+    """
+    Context manager used to have connect_client() hand out an existing client, rather than
+    making a new connection. This is used by the resident daemon (niri_daemon.py) to
+    run the keybind scripts using its already-connected client & state
+    """
+    global _SHARED_CLIENT
+    prev_client, _SHARED_CLIENT = _SHARED_CLIENT, client
+    try:
+        yield client
+    finally:
+        _SHARED_CLIENT = prev_client
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio versions of the niri IPC helpers (see niri_ipc.py), for long-running scripts.
+These allow the event stream to be read continuously while actions are still waiting
+on a response from niri, rather than having events pile up during every action.
+Message formatting & parsing is shared with the regular (blocking) helpers in niri_ipc.py,
+which are still the better choice for one-shot scripts (no event loop start-up cost).
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import socket
+import asyncio
+import logging
+from collections import deque
+from time import perf_counter
+
+from niri_ipc import NiriSocket, json_loads
+from niri_ipc import encode_actions, parse_request_response, parse_action_response
+
+# Shared modules only log through their own (un-configured) logger, scripts decide where messages end up
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class AsyncNiriSocket:
+    """
+    Helper used to read & write json messages to a niri socket connection, using asyncio streams.
+    The socket connects immediately (so connection errors show up right away),
+    but start() must be awaited (inside a running event loop) before use
+    """
+
+    # Largest single message we expect to receive (e.g. WindowsChanged with many windows)
+    MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, socket_path: str):
+
+        # Sanity check
+        is_bad_path = socket_path is None or str(socket_path) == ""
+        assert not is_bad_path, "Cannot connect to niri, no socket path given..."
+
+        self._socket_path = socket_path
+        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._skt.connect(socket_path)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def start(self):
+        """Hand the (connected) socket over to the running event loop"""
+        self._reader, self._writer = await asyncio.open_unix_connection(sock=self._skt, limit=self.MAX_MESSAGE_BYTES)
+        return self
+
+    async def _read_next_line(self) -> bytes | None:
+        """Read the next message (i.e. line of text) as raw bytes. Returns None if the connection closes"""
+        try:
+            msg_bytes = await self._reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError:
+            return None
+        return msg_bytes[:-1]
+
+    async def reconnect(self):
+        """Close & re-open the connection to niri (e.g. after losing the connection)"""
+        self.close()
+        self._reader, self._writer = None, None
+        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._skt.connect(self._socket_path)
+        return await self.start()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self._skt.close()
+        return
+
+    @staticmethod
+    def get_niri_socket_path():
+        return NiriSocket.get_niri_socket_path()
+
+
+class AsyncNiriRequests(NiriSocket):
+    """
+    Helper used to make requests & read the event stream from niri, using asyncio.
+    This shares the read buffer handling of the regular NiriSocket (including
+    merging of layout change events), but waits on data using the event loop.
+    Must call start() (inside a running event loop) before use
+    See: https://yalter.github.io/niri/niri_ipc/enum.Request.html
+    """
+
+    async def start(self):
+        """Switch the socket to non-blocking use, for the running event loop"""
+        self._skt.setblocking(False)
+        return self
+
+    async def reconnect(self):
+        """Close & re-open the connection to niri (e.g. after losing the event stream)"""
+        super().reconnect()
+        return await self.start()
+
+    async def _read_next(self):
+        """Read the next (json) message from the socket. Returns an empty dict if the connection closes"""
+        msg_bytes = await self._read_next_line()
+        return json_loads(msg_bytes) if msg_bytes is not None else {}
+
+    async def _read_next_line(self) -> bytes | None:
+        """Read the next message (i.e. line of text) as raw bytes. Returns None if the connection closes"""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            msg_bytes = self._pop_buffered_line()
+            if msg_bytes is not None:
+                return msg_bytes
+
+            if self._buf_end_idx == len(self._buf):
+                self._make_buffer_space()
+
+            num_bytes = await loop.sock_recv_into(self._skt, self._buf_view[self._buf_end_idx :])
+            if num_bytes == 0:
+                return None
+            self._buf_end_idx += num_bytes
+
+    async def request(self, message: str):
+        await asyncio.get_running_loop().sock_sendall(self._skt, f'"{message}"\n'.encode("utf-8"))
+        return parse_request_response(await self._read_next())
+
+    async def read_eventstream(self, event_names: set[str] | None = None, coalesce_layouts: bool = True):
+        """
+        Async generator which yields (event_name, event_data) for every event from niri.
+        Works the same as NiriRequests.read_eventstream (e.g. skipping unlisted events without decoding)
+        """
+
+        is_ok, evt_resp = await self.request("EventStream")
+        if not is_ok:
+            logger.warning("EventStream response: %s", evt_resp)
+            raise IOError("Error requesting EventStream")
+
+        # Read events from stream, forever
+        while True:
+            msg_bytes = await self._read_next_line()
+            if msg_bytes is None:
+                raise IOError("Lost connection to niri event stream")
+
+            t1 = perf_counter()
+            evt = self._decode_event(msg_bytes, event_names, coalesce_layouts)
+            if evt is not None:
+                if self.stats is not None:
+                    self.stats.record("decode", evt[0], perf_counter() - t1)
+                yield evt
+        return
+
+
+class AsyncNiriActions(AsyncNiriSocket):
+    """
+    Helper used to trigger actions through the niri IPC, without having to wait on responses.
+    Actions are sent immediately and return a future, which is completed (with: is_ok, response)
+    once niri responds. Niri responds to messages in order, so responses are matched up to
+    waiting futures on a first-in-first-out basis, by a background task.
+    Requests (e.g. for output info) can also be sent on the same connection, see: submit_request
+    See: https://yalter.github.io/niri/niri_ipc/enum.Action.html
+    """
+
+    def __init__(self, socket_path: str):
+        super().__init__(socket_path)
+
+        # Messages waiting on a response, stored as: (future, is_request, action/request name, time sent)
+        self._pending: deque[tuple[asyncio.Future, bool, str, float]] = deque()
+        self._response_task: asyncio.Task | None = None
+
+        # Optional timing recorder (see niri_stats.py), used to record action round-trip times
+        self.stats = None
+
+    async def start(self):
+        await super().start()
+        self._response_task = asyncio.create_task(self._read_responses_forever())
+        return self
+
+    def submit(self, message: str, **kwargs) -> asyncio.Future:
+        """Send an action without waiting for a response. Returns a future holding: (is_ok, response)"""
+        return self.submit_batch([(message, kwargs)])[0]
+
+    def submit_batch(self, actions: list[tuple[str, dict]]) -> list[asyncio.Future]:
+        """
+        Send a sequence of actions all at once, for example:
+            submit_batch([("FocusWindow", {"id": 5}), ("MaximizeColumn", {})])
+        Returns a list of futures (one per action), holding (is_ok, response) results
+        """
+
+        if len(actions) == 0:
+            return []
+        if not self._is_connected():
+            raise ConnectionError("Not connected to niri, cannot send actions")
+
+        loop = asyncio.get_running_loop()
+        t_sent = perf_counter()
+        futures_list = [loop.create_future() for _ in actions]
+        self._pending.extend((fut, False, name, t_sent) for fut, (name, _) in zip(futures_list, actions))
+        self._writer.write(encode_actions(actions))
+        return futures_list
+
+    def submit_request(self, message: str) -> asyncio.Future:
+        """
+        Send a request (e.g. "Outputs") without waiting for a response. Returns a future holding:
+        (is_ok, response data), where the data is the same as from NiriRequests.request_data
+        """
+
+        if not self._is_connected():
+            raise ConnectionError("Not connected to niri, cannot send requests")
+
+        resp_future = asyncio.get_running_loop().create_future()
+        self._pending.append((resp_future, True, message, perf_counter()))
+        self._writer.write(f'"{message}"\n'.encode("utf-8"))
+        return resp_future
+
+    async def action(self, message: str, **kwargs):
+        """Send an action and wait for the response (other tasks keep running while waiting)"""
+        return await self.submit(message, **kwargs)
+
+    async def action_batch(self, actions: list[tuple[str, dict]]) -> list[tuple[bool, dict]]:
+        """Send a sequence of actions and wait for all responses (see: submit_batch)"""
+        return list(await asyncio.gather(*self.submit_batch(actions)))
+
+    async def _read_responses_forever(self):
+        """Background task used to hand out responses to waiting futures, in the order actions were sent"""
+
+        try:
+            while True:
+                msg_bytes = await self._read_next_line()
+                if msg_bytes is None:
+                    break
+                if len(self._pending) == 0:
+                    logger.warning("Unexpected action response: %s", msg_bytes)
+                    continue
+                resp_future, is_request, msg_name, t_sent = self._pending.popleft()
+                if self.stats is not None:
+                    self.stats.record("request" if is_request else "action", msg_name, perf_counter() - t_sent)
+                if resp_future.done():
+                    continue
+                if is_request:
+                    is_ok, resp_data = parse_request_response(json_loads(msg_bytes))
+                    resp_future.set_result((is_ok, resp_data.get(msg_name, None) if is_ok else resp_data))
+                else:
+                    resp_future.set_result(parse_action_response(json_loads(msg_bytes)))
+
+        finally:
+            # Connection closed (or failed), so no other responses are coming
+            self._fail_pending()
+
+        return
+
+    def _is_connected(self) -> bool:
+        """Helper used to check if messages can be sent (e.g. not while re-connecting)"""
+        is_reading = self._response_task is not None and not self._response_task.done()
+        return is_reading and self._writer is not None
+
+    def _fail_pending(self):
+        """Helper used to give up on all actions still waiting on a response (e.g. when disconnected)"""
+        while len(self._pending) > 0:
+            resp_future, _, _, _ = self._pending.popleft()
+            if not resp_future.done():
+                resp_future.set_exception(IOError("Lost connection to niri while waiting on action response"))
+        return
+
+    def close(self):
+        """Close the connection to niri. Any actions still waiting on a response will fail"""
+        if self._response_task is not None:
+            self._response_task.cancel()
+            self._response_task = None
+        self._fail_pending()
+        return super().close()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+async def reconnect_with_retry(connection, timeout_sec: float = 10, max_wait_sec: float = 1.0):
+    """
+    Helper used to re-connect to niri (see the reconnect() methods above), retrying with (exponential)
+    backoff if niri isn't accepting connections. Raises the connection error if the timeout is reached
+    """
+
+    loop = asyncio.get_running_loop()
+    t_end = loop.time() + timeout_sec
+    wait_sec = 0.01
+    while True:
+        await asyncio.sleep(wait_sec)
+        try:
+            return await connection.reconnect()
+        except (FileNotFoundError, ConnectionRefusedError):
+            if loop.time() + wait_sec > t_end:
+                raise
+        wait_sec = min(2 * wait_sec, max_wait_sec)
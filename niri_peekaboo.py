@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import subprocess
-import json
+
+from niri_ipc import connect_client
+from niri_state import WindowInfo, OutputInfo
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -47,38 +48,35 @@ TOGGLE_FULLSCREEN = args.toggle_fullscreen
 # %% Helpers
 
 
-def run_command(command_str: str, **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(command_str.split(" "), **kwargs)
-
+def get_windows_list() -> list[WindowInfo]:
+    return niri.get_windows()
 
-def get_windows_list() -> list[dict]:
-    resp = run_command("niri msg --json windows", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
 
+def get_focused_monitor_info() -> OutputInfo | None:
+    return niri.get_focused_output()
 
-def get_focused_monitor_info() -> dict:
-    resp = run_command("niri msg --json focused-output", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
 
-
-def get_focused_window() -> dict | None:
-    resp = run_command("niri msg --json focused-window", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
+def get_focused_window() -> WindowInfo | None:
+    return niri.get_focused_window()
 
 
 def niri_focus_window(window_id: int) -> None:
-    run_command(f"niri msg action focus-window --id {window_id}")
+    niri.action("FocusWindow", id=window_id)
     return
 
 
-def niri_action(command: str) -> None:
-    run_command(f"niri msg action {command}")
+def niri_action(message: str, **kwargs) -> None:
+    niri.action(message, **kwargs)
     return
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Connect to niri
+
+# All queries & actions go through one socket connection (instead of a niri msg process per call)
+niri = connect_client()
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Get current windowing info
 
@@ -89,37 +87,38 @@ if user_win is None:
 
 # Figure out what windows we have
 all_win_info = get_windows_list()
-wspace_win_list = [w for w in all_win_info if w["workspace_id"] == user_win["workspace_id"]]
+wspace_win_list = [w for w in all_win_info if w.workspace_id == user_win.workspace_id]
 float_win_list, nonfloat_win_list = [], []
 for win_info in wspace_win_list:
-    win_list = float_win_list if win_info["is_floating"] else nonfloat_win_list
+    win_list = float_win_list if win_info.is_floating else nonfloat_win_list
     win_list.append(win_info)
 
 # Get monitor size, if possible (not sure if this can fail)
 monitor_info = get_focused_monitor_info()
-monitor_w = monitor_info.get("logical", {}).get("width", 1920)
-monitor_h = monitor_info.get("logical", {}).get("height", 1080)
+has_monitor_size = monitor_info is not None and monitor_info.width is not None
+monitor_w = monitor_info.width if has_monitor_size else 1920
+monitor_h = monitor_info.height if has_monitor_size else 1080
 monitor_area = monitor_w * monitor_h
 
 # Try to figure out if window is fullscreen (IPC doesn't give this info...?) and toggle out
 if TOGGLE_FULLSCREEN:
-    user_win_w, user_win_h = user_win["layout"]["window_size"]
+    user_win_w, user_win_h = user_win.window_size
     user_win_area = user_win_w * user_win_h
     user_win_area_norm = user_win_area / monitor_area
     is_fullscreen = user_win_area_norm > 0.99
 
     # Switch to maximized state to mimic fullscreen while allowing floats
     if is_fullscreen:
-        niri_action("fullscreen-window")  # Confusing: this is a toggle *out* of fullscreen
+        niri_action("FullscreenWindow")  # Confusing: this is a toggle *out* of fullscreen
 
         # Make sure we're in a maximized state (not indicated by IPC...?) to mimic fullscreen
         user_win = get_focused_window()
-        user_win_w, user_win_h = user_win["layout"]["window_size"]
+        user_win_w, user_win_h = user_win.window_size
         user_win_area = user_win_w * user_win_h
         user_win_area_norm = user_win_area / monitor_area
         is_maximized = user_win_area_norm > 0.75
         if not is_maximized:
-            niri_action("maximize-column")
+            niri_action("MaximizeColumn")
         pass
 
 
@@ -130,25 +129,25 @@ if TOGGLE_FULLSCREEN:
 if len(float_win_list) > 0:
 
     # Make sure focus is where the user is looking, not on floats
-    if user_win["is_floating"]:
-        niri_action("focus-tiling")
+    if user_win.is_floating:
+        niri_action("FocusTiling")
 
     # Try to stack floats into column while preserving vertical order
-    float_win_list = sorted(float_win_list, key=lambda w: w["layout"]["tile_pos_in_workspace_view"][1])
+    float_win_list = sorted(float_win_list, key=lambda w: w.tile_pos_in_workspace_view[1])
     for win_idx, target_win in enumerate(float_win_list):
-        target_id = target_win["id"]
-        niri_action(f"move-window-to-tiling --id {target_id}")
+        target_id = target_win.id
+        niri_action("MoveWindowToTiling", id=target_id)
         # Strange looking: used to stack multiple floats into 1 column
         if win_idx > 0:
-            niri_action(f"consume-or-expel-window-right --id {target_id}")
+            niri_action("ConsumeOrExpelWindowRight", id=target_id)
 
     # Move un-peeked column to left side if needed
     if not PEEK_RIGHT:
-        niri_action("move-column-right")
+        niri_action("MoveColumnRight")
 
     # Fullscreen user if needed (used to undo the move to max/non-fullscreen needed for floating windows)
     if TOGGLE_FULLSCREEN:
-        niri_action("fullscreen-window")
+        niri_action("FullscreenWindow")
 
     quit()
 
@@ -157,15 +156,15 @@ if len(float_win_list) > 0:
 # %% Handle 'need to peek' case
 
 # For sanity. This shouldn't happen if we get here
-if user_win["is_floating"]:
+if user_win.is_floating:
     raise RuntimeError("Unexpected error! Trying to float but user is already floating")
 
 # Check for windows to peek (i.e. float)
-user_col, user_row = user_win["layout"]["pos_in_scrolling_layout"]
+user_col, user_row = user_win.col_idx, user_win.row_idx
 have_peekable_wins = False
 for attempt_idx in range(2 if PEEK_BOTHSIDES else 1):
     target_peek_col = user_col + 1 if PEEK_RIGHT else user_col - 1
-    peek_win_info = [w for w in nonfloat_win_list if w["layout"]["pos_in_scrolling_layout"][0] == target_peek_col]
+    peek_win_info = [w for w in nonfloat_win_list if w.col_idx == target_peek_col]
     have_peekable_wins = len(peek_win_info) > 0
     if have_peekable_wins:
         break
@@ -176,37 +175,37 @@ if not have_peekable_wins:
     quit()
 
 # Figure out y-positioning of target windows when floated
-peek_win_info = sorted(peek_win_info, key=lambda w: w["layout"]["pos_in_scrolling_layout"][1])
+peek_win_info = sorted(peek_win_info, key=lambda w: w.row_idx)
 target_float_y, csum_y = [], TARGET_FLOAT_Y_OFFSET
 for target_win in peek_win_info:
     target_float_y.append(csum_y)
-    csum_y += target_win["layout"]["window_size"][1] + FLOAT_Y_GAP
+    csum_y += target_win.window_size[1] + FLOAT_Y_GAP
 
 # Float target windows and move to far side of screen
-max_row_idx = max(w["layout"]["pos_in_scrolling_layout"][1] for w in peek_win_info)
+max_row_idx = max(w.row_idx for w in peek_win_info)
 for win_info, target_y in zip(peek_win_info, target_float_y):
-    target_id = win_info["id"]
-    niri_action(f"move-window-to-floating --id {target_id}")
+    target_id = win_info.id
+    niri_action("MoveWindowToFloating", id=target_id)
 
     # Resize floated windows if needed
-    target_w, target_h = win_info["layout"]["window_size"]
+    target_w, target_h = win_info.window_size
     if ALLOW_FLOAT_RESIZE:
         target_w = min(target_w, int(monitor_w * MAX_RESIZE_WIDTH)) if LIMIT_MAX_WIDTH else target_w
         niri_focus_window(target_id)
         floated_info = get_focused_window()
-        float_w, float_h = floated_info["layout"]["window_size"]
+        float_w, float_h = floated_info.window_size
         if float_w != target_w:
-            niri_action(f"set-window-width {target_w}")
+            niri_action("SetWindowWidth", change={"SetFixed": target_w})
         if float_h != target_h:
-            niri_action(f"set-window-height {target_h}")
+            niri_action("SetWindowHeight", change={"SetFixed": target_h})
         pass
 
     # Position floated windows on left or right side of screen
     target_x = TARGET_FLOAT_X if PEEK_RIGHT else (monitor_w - target_w - TARGET_FLOAT_X)
-    niri_action(f"move-floating-window --id {target_id} -x {target_x} -y {target_y}")
+    niri_action("MoveFloatingWindow", id=target_id, x={"SetFixed": target_x}, y={"SetFixed": target_y})
 
 # Set final focus window after peeking
 if FOCUS_PEEKED:
-    niri_focus_window(peek_win_info[0]["id"])
+    niri_focus_window(peek_win_info[0].id)
 else:
-    niri_focus_window(user_win["id"])
+    niri_focus_window(user_win.id)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helper for turning the window changes wanted by a script (e.g. maximize this window,
+consume that one into the next column) into a short list of niri actions.
+Some actions (like MaximizeColumn) only apply to the focused window, so they need the target
+window to be focused first and the original focus restored afterwards. When several changes are
+needed at once, doing this separately for each change makes focus bounce back & forth (visible
+as flicker). The planner instead collects all changes & only restores focus once, at the end.
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+from niri_state import WindowInfo
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class ActionPlanner:
+    """
+    Helper used to collect wanted window changes (e.g. while handling a single event)
+    and then build the smallest list of actions needed to carry them out.
+    Changes are compared against the current window state, so changes that aren't
+    needed (or that cancel out, like maximizing & then un-maximizing) are dropped.
+    Keeps a count of the actions that were avoided compared to handling each change separately
+    """
+
+    def __init__(self):
+
+        # Wanted changes, in order, stored as: (window id, action name, action kwargs)
+        # -> Window id is only given for actions that apply to the focused window (e.g. MaximizeColumn)
+        self._steps: list[tuple[int | None, str, dict]] = []
+        self._toggle_window_ids: set[int] = set()
+
+        # Counts for reporting
+        self.num_actions_sent = 0
+        self.num_actions_saved = 0
+
+    def has_changes(self) -> bool:
+        return len(self._steps) > 0
+
+    def set_maximized(self, window: WindowInfo, is_maximized: bool):
+        """
+        Ask for a window to be maximized (or not). This is a toggle in niri, so nothing is done
+        if the window is already in the wanted state. Must be called before updating the state of
+        the window, so that a second call (in the opposite direction) cancels out the first one
+        """
+
+        if window.is_maximized == is_maximized:
+            return self
+
+        # Toggling twice is the same as doing nothing
+        if window.id in self._toggle_window_ids:
+            self._toggle_window_ids.discard(window.id)
+            self._steps = [step for step in self._steps if step[0] != window.id]
+            self.num_actions_saved += 2
+            return self
+
+        self._toggle_window_ids.add(window.id)
+        self._steps.append((window.id, "MaximizeColumn", {}))
+        return self
+
+    def add_action(self, action_name: str, **kwargs):
+        """Ask for an action which doesn't depend on focus (e.g. with a window id given as a kwarg)"""
+        self._steps.append((None, action_name, kwargs))
+        return self
+
+    def plan(self, focused_window_id: int | None) -> list[tuple[str, dict]]:
+        """
+        Build the list of actions for all changes asked for so far (and clear them).
+        Focus is moved only when needed and restored once, at the end.
+        Returns a list of (action name, kwargs), for use with action_batch(...)
+        """
+
+        actions_list = []
+        num_separate_actions = 0
+        curr_focus_id = focused_window_id
+        for window_id, action_name, kwargs in self._steps:
+
+            # Handling each change separately costs a focus change & restore for non-focused windows
+            is_focus_needed = window_id is not None and window_id != focused_window_id
+            num_separate_actions += 3 if is_focus_needed else 1
+
+            if window_id is not None and window_id != curr_focus_id:
+                actions_list.append(("FocusWindow", {"id": window_id}))
+                curr_focus_id = window_id
+            actions_list.append((action_name, kwargs))
+
+        # Put focus back where it was (if there was a focused window to begin with)
+        if curr_focus_id != focused_window_id and focused_window_id is not None:
+            actions_list.append(("FocusWindow", {"id": focused_window_id}))
+
+        self._steps.clear()
+        self._toggle_window_ids.clear()
+        self.num_actions_sent += len(actions_list)
+        self.num_actions_saved += num_separate_actions - len(actions_list)
+
+        return actions_list
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for spawning applications (detached from the calling script), along with
+'warm pools' of pre-spawned application instances, used by niri_daemon.py & niri_spawnjump.py.
+Applications that are slow to open a first window (e.g. browsers or flatpaks) can be kept
+parked on a (hidden) workspace, so that spawning only needs to pull a parked window into view.
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import threading
+import subprocess
+from pathlib import Path
+from time import perf_counter
+
+from niri_state import NiriState, WindowInfo
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Globals
+
+# Time allowed for a pre-spawned instance to open a window, before it is given up on (and spawned again)
+POOL_SPAWN_TIMEOUT_SEC = 30.0
+
+# Processes started by spawn_command, which still need to be cleaned up after they exit (see: reap_spawned)
+_SPAWNED_PROCS: list[subprocess.Popen] = []
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class WarmPool:
+    """
+    Helper used to keep track of pre-spawned ('parked') instances of a single command.
+    Spawned instances are matched to newly opened windows based on pid (or app_id, if unambiguous),
+    after which the window is expected to be moved to the pool workspace (see: adopt_window & park_window).
+    Parked windows are handed out first-in-first-out, and the pool is topped back up with
+    new instances using refill(). Safe to use from multiple threads (e.g. daemon event thread & scripts)
+    """
+
+    def __init__(self, command: str, app_id: str | None = None, size: int = 1, workspace_name: str = "pool"):
+        self.command = command
+        self.app_id = app_id if app_id is not None else get_default_app_id(command)
+        self.size = size
+        self.workspace_name = workspace_name
+
+        # Parked window ids (oldest first) & spawned instances without a window yet, stored as:
+        # (pid, lowest possible window id, time spawned) (niri window ids only ever increase)
+        self._parked_ids: list[int] = []
+        self._pending: list[tuple[int, int, float]] = []
+        self._lock = threading.Lock()
+
+    def get_parked_ids(self) -> list[int]:
+        """Get ids of all parked windows (e.g. so they can be left out of window cycling)"""
+        with self._lock:
+            return list(self._parked_ids)
+
+    def refill(self, niri_state: NiriState) -> int:
+        """Spawn new instances to replace any that were taken or closed. Returns number of instances spawned"""
+
+        with self._lock:
+
+            # Give up on instances that never opened a window
+            t_now = perf_counter()
+            self._pending = [entry for entry in self._pending if t_now - entry[2] < POOL_SPAWN_TIMEOUT_SEC]
+
+            num_missing = self.size - len(self._parked_ids) - len(self._pending)
+            next_window_id = max(niri_state.windows.keys(), default=0) + 1
+            for _ in range(num_missing):
+                self._pending.append((spawn_command(self.command), next_window_id, t_now))
+
+        return max(num_missing, 0)
+
+    def adopt_window(self, window: WindowInfo, niri_state: NiriState) -> bool:
+        """
+        Check if a (new or changed) window belongs to a spawned instance and if so, claim it.
+        Returns True if the window was adopted, in which case it should be moved to the pool workspace.
+        The window only counts as parked once the move succeeds (see: park_window)
+        """
+
+        with self._lock:
+            if len(self._pending) == 0 or window.id in self._parked_ids:
+                return False
+
+            for entry_idx, (pid, min_window_id, _) in enumerate(self._pending):
+                if window.id >= min_window_id and window.pid == pid:
+                    del self._pending[entry_idx]
+                    return True
+
+            # Some commands (e.g. flatpak) launch the application as a different process, so fall back
+            # to matching by app_id, as long as it's clear which spawned instance the window belongs to.
+            # Windows that existed before spawning (e.g. previously taken from the pool) are ignored, since
+            # they have lower ids, but any other same-app window opened since spawning makes the match ambiguous
+            _, min_window_id, _ = self._pending[0]
+            if len(self._pending) != 1 or window.id < min_window_id or not self._is_app_id_match(window):
+                return False
+            is_other_new_window_open = any(
+                self._is_app_id_match(other_win)
+                for other_win in niri_state.windows.values()
+                if other_win.id >= min_window_id and other_win.id != window.id and other_win.id not in self._parked_ids
+            )
+            if not is_other_new_window_open:
+                self._pending.clear()
+                return True
+
+        return False
+
+    def _is_app_id_match(self, window: WindowInfo) -> bool:
+        """Helper used to check if a window has the app_id of the pooled application"""
+        return window.app_id is not None and window.app_id.lower() == self.app_id.lower()
+
+    def park_window(self, window_id: int) -> None:
+        """Record an adopted window as parked (after it has been moved to the pool workspace)"""
+        with self._lock:
+            if window_id not in self._parked_ids:
+                self._parked_ids.append(window_id)
+        return
+
+    def discard_window(self, window_id: int) -> bool:
+        """Forget about a parked window (e.g. if it was closed). Returns True if the window was parked"""
+        with self._lock:
+            if window_id not in self._parked_ids:
+                return False
+            self._parked_ids.remove(window_id)
+        return True
+
+    def take_window(self, niri_state: NiriState) -> WindowInfo | None:
+        """
+        Take the oldest parked window out of the pool (e.g. to pull it into view).
+        Windows that have left the pool workspace (e.g. moved by the user) are no longer
+        considered parked. Returns None if there are no parked windows
+        """
+
+        with self._lock:
+            while len(self._parked_ids) > 0:
+                win = niri_state.windows.get(self._parked_ids.pop(0), None)
+                wspace = niri_state.workspaces.get(win.workspace_id, None) if win is not None else None
+                if wspace is not None and wspace.name == self.workspace_name:
+                    return win
+
+        return None
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def spawn_command(command: str) -> int:
+    """Run the command and detach from caller. Returns the process id of the spawned command"""
+    proc = subprocess.Popen(
+        command.split(" "),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        start_new_session=True,
+    )
+    _SPAWNED_PROCS.append(proc)
+    return proc.pid
+
+
+def reap_spawned() -> None:
+    """
+    Clean up after spawned commands that have exited (otherwise they linger as zombie processes
+    in long-running scripts, like the daemon). Only processes started by spawn_command are checked,
+    so this doesn't interfere with waiting on any other child processes. Safe to call from a signal handler
+    """
+    for proc in list(_SPAWNED_PROCS):
+        if proc.poll() is not None:
+            try:
+                _SPAWNED_PROCS.remove(proc)
+            except ValueError:
+                # Already removed (e.g. by another call interrupted by a signal)
+                pass
+    return
+
+
+def get_default_app_id(command: str) -> str:
+    """
+    Guess the app_id of an application based on the command used to run it.
+    For flatpaks this is the last part of the command, for scripts it's the file name (without extension)
+    """
+    app_id = command.split(" ")[-1] if command.startswith("flatpak") else command
+    if Path(app_id).is_file():
+        app_id = Path(app_id).stem
+    return app_id
@@ -5,10 +5,14 @@
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Imports
 
+import re
 import argparse
-import subprocess
-import json
-from pathlib import Path
+from copy import copy
+from time import perf_counter
+
+from niri_ipc import NiriRequests, connect_client, make_workspace_reference
+from niri_spawn import spawn_command, get_default_app_id
+from niri_state import NiriState, WindowInfo, APP_ID_MATCH_MODES, STATE_EVENT_NAMES, find_window_ids
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -25,8 +29,19 @@ parser.add_argument(
     type=str,
     help="Spawn command used to run an application (e.g. 'firefox' or 'flatpak run app.zen_browser.zen')",
 )
-parser.add_argument("app_id", nargs="?", type=str, help="Target app-id (only needed if different from the run command)")
+parser.add_argument(
+    "app_id",
+    nargs="*",
+    type=str,
+    help="Target app-id (only needed if different from the run command). Multiple app-ids can be given",
+)
 parser.add_argument("-b", "--backward", action="store_true", help="Cycle backwards instead of forward")
+parser.add_argument(
+    "--mru",
+    action="store_true",
+    help="Jump to most recently used instance (or the one before, if already focused) instead of cycling by position."
+    " With -b, jump to the least recently used instance. Needs the daemon or niri_tile_to_n.py for focus history",
+)
 parser.add_argument("-w", "--workspace", action="store_true", help="Only search on active workspace")
 parser.add_argument("-p", "--pull", action="store_true", help="If an instance exists, pull it next to focused window")
 parser.add_argument(
@@ -41,18 +56,39 @@ parser.add_argument(
     type=str,
     help="Auto-enables push/pull. Applications are pushed to a workspace with this name",
 )
+parser.add_argument(
+    "-m",
+    "--match",
+    default="exact",
+    choices=APP_ID_MATCH_MODES,
+    help="How app-ids are matched: exact, glob (e.g. 'org.gnome.*') or regex. Always ignores case (default exact)",
+)
+parser.add_argument("--title", type=str, help="Only target windows with a title matching this (regex) pattern")
 parser.add_argument("--no_floats", action="store_true", help="Don't check for floating windows")
 parser.add_argument("--no_tiles", action="store_true", help="Don't check for tiled windows")
 parser.add_argument("--no_spawn", action="store_true", help="Never spawn, only jump/cycle instances")
 parser.add_argument(
     "--always_spawn", action="store_true", help="Always spawn, no jumping (may be useful for scripting?)"
 )
+parser.add_argument(
+    "--wait",
+    nargs="?",
+    const=5.0,
+    default=None,
+    type=float,
+    help="After spawning, wait (up to this many seconds, 5 if not given) for the new window to open,"
+    " so that pull/scratchpad/float placement can be applied to it right away",
+)
+parser.add_argument("--float", action="store_true", help="Make newly spawned windows floating (needs --wait)")
 
 # For convenience
 args = parser.parse_args()
 COMMAND = args.command
-TARGET_APP_ID = args.app_id
+TARGET_APP_IDS = args.app_id
+MATCH_MODE = args.match
+TITLE_PATTERN = args.title
 CYCLE_FORWARD = not args.backward
+USE_MRU = args.mru
 ACTIVE_WORKSPACE_ONLY = args.workspace
 ENABLE_PULL = args.pull
 ENABLE_PUSH = args.push
@@ -61,10 +97,13 @@ NO_FLOATS = args.no_floats
 NO_TILES = args.no_tiles
 ENABLE_SPAWN = not args.no_spawn
 ALWAYS_SPAWN = args.always_spawn
+SPAWN_WAIT_SEC = args.wait
+MAKE_FLOATING = args.float
 
 # Sanity checks
 assert not (NO_FLOATS and NO_TILES), "Cannot disable checks for floating & tiled windows (enable only one or neither)"
 assert not (ALWAYS_SPAWN and not ENABLE_SPAWN), "Cannot always spawn & disable spawning at the same time!"
+assert not (MAKE_FLOATING and SPAWN_WAIT_SEC is None), "Cannot make spawned windows floating without waiting (--wait)"
 
 # Auto-config for push/pull to scratchpad, if provided
 if SCRATCHPAD is not None:
@@ -73,71 +112,53 @@ if SCRATCHPAD is not None:
     ACTIVE_WORKSPACE_ONLY = False
 
 # Fill in missing app-id
-if TARGET_APP_ID is None and COMMAND is not None:
-    TARGET_APP_ID = COMMAND.split(" ")[-1] if COMMAND.startswith("flatpak") else COMMAND
-    if Path(TARGET_APP_ID).is_file():
-        TARGET_APP_ID = Path(TARGET_APP_ID).stem
+if len(TARGET_APP_IDS) == 0 and COMMAND is not None:
+    TARGET_APP_IDS = [get_default_app_id(COMMAND)]
+
+# Check (regex) patterns up front, so that bad patterns are reported as a usage error instead of a traceback
+regex_patterns_list = TARGET_APP_IDS if MATCH_MODE == "regex" else []
+regex_patterns_list = regex_patterns_list + ([TITLE_PATTERN] if TITLE_PATTERN is not None else [])
+for pattern_str in regex_patterns_list:
+    try:
+        re.compile(pattern_str)
+    except re.error as err:
+        parser.error(f"Bad regex pattern ({pattern_str!r}): {err}")
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Helper functions
 
 
-def run_command(command_str: str, **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(command_str.split(" "), **kwargs)
-
-
-def focus_window(id: int) -> subprocess.CompletedProcess:
-    return run_command(f"niri msg action focus-window --id {id}")
-
-
-def get_focused_window() -> dict:
-    resp = run_command("niri msg --json focused-window", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
+def focus_window(id: int) -> None:
+    niri.action("FocusWindow", id=id)
+    return
 
 
-def get_active_workspace_ids() -> list[int]:
-    resp = run_command("niri msg --json workspaces", capture_output=True, text=True)
-    resp.check_returncode()
-    resp_list = json.loads(resp.stdout)
-    return [wspace_dict["id"] for wspace_dict in resp_list if wspace_dict["is_active"]]
+def get_focused_window() -> WindowInfo | None:
+    return niri.get_focused_window()
 
 
-def get_focused_workspace_idx(default_if_missing: int = 1) -> int:
-    resp = run_command("niri msg --json workspaces", capture_output=True, text=True)
-    resp.check_returncode()
-    resp_list = json.loads(resp.stdout)
-    workspace_idx = default_if_missing
-    for wspace_dict in resp_list:
-        if wspace_dict["is_focused"]:
-            workspace_idx = wspace_dict["idx"]
-            break
-        pass
-    return workspace_idx
+def get_active_workspace_ids(niri_state: NiriState) -> set[int]:
+    return {wspace.id for wspace in niri_state.workspaces.values() if wspace.is_active}
 
 
-def get_windows_list() -> list[dict]:
-    resp = run_command("niri msg --json windows", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
+def get_focused_workspace_idx(niri_state: NiriState, default_if_missing: int = 1) -> int:
+    wspace = niri_state.workspaces.get(niri_state.focus.workspace_id, None)
+    return wspace.idx if wspace is not None else default_if_missing
 
 
-def check_is_stacked_in_column(target_window_data: dict, all_windows_data: list[dict]) -> bool:
+def check_is_stacked_in_column(target_window_data: WindowInfo, niri_state: NiriState) -> bool:
     """Helper used to determine if a window is stacked with 1 or more other windows in a column"""
 
     # No columns for floating windows so skip checks
-    if target_window_data["is_floating"]:
+    if target_window_data.is_floating:
         return False
 
-    # Count how many windows have the same target workspace/column position
-    target_wspace_id = target_window_data["workspace_id"]
-    target_column = target_window_data["layout"]["pos_in_scrolling_layout"][0]
+    # Count how many (tiled) windows on the same workspace have the same column position
+    target_column = target_window_data.col_idx
     num_same_col = 0
-    for other_win in all_windows_data:
-        if other_win["is_floating"] or other_win["workspace_id"] != target_wspace_id:
-            continue
-        if other_win["layout"]["pos_in_scrolling_layout"][0] == target_column:
+    for other_id in niri_state.get_tiled_window_ids(target_window_data.workspace_id):
+        if niri_state.windows[other_id].col_idx == target_column:
             num_same_col += 1
         if num_same_col > 1:
             break
@@ -145,109 +166,197 @@ def check_is_stacked_in_column(target_window_data: dict, all_windows_data: list[
     return num_same_col > 1
 
 
-def pull_window(target_window_data: dict, all_windows_data: list[dict]) -> None:
-    """Brings a target window toward where the user is currently looking"""
+def make_pull_actions(target_window_data: WindowInfo, niri_state: NiriState, orig_win: WindowInfo | None) -> list:
+    """
+    Builds the actions needed to bring a target window toward where the user is currently looking
+    (i.e. next to the original window). All actions are decided up front from the niri state, so
+    that they can be sent as a single batch (see: action_batch), which niri handles all at once
+    """
 
     # For convenience
-    target_id = target_window_data["id"]
-    orig_win = get_focused_window()
+    target_id = target_window_data.id
     is_empty_workspace = orig_win is None
+    actions_list = []
 
     # If we're already focused on window, we don't need to pull it
-    orig_id = None if is_empty_workspace else orig_win["id"]
+    orig_id = None if is_empty_workspace else orig_win.id
     if orig_id == target_id:
-        return
+        return actions_list
 
     # Move the target to the current workspace, if needed
-    orig_space_id = None if is_empty_workspace else orig_win["workspace_id"]
-    if orig_space_id != target_window_data["workspace_id"]:
-        orig_space_idx = get_focused_workspace_idx(orig_space_id)
-        run_command(f"niri msg action move-window-to-workspace {orig_space_idx} --window-id {target_id}")
+    orig_space_id = None if is_empty_workspace else orig_win.workspace_id
+    if orig_space_id != target_window_data.workspace_id:
+        orig_wspace = niri_state.workspaces.get(orig_space_id, None)
+        orig_space_idx = orig_wspace.idx if orig_wspace is not None else get_focused_workspace_idx(niri_state)
+        move_kwargs = {"window_id": target_id, "reference": make_workspace_reference(orig_space_idx), "focus": True}
+        actions_list.append(("MoveWindowToWorkspace", move_kwargs))
 
     # We'll want the target focused, no matter what we do next...
-    focus_window(target_id)
+    actions_list.append(("FocusWindow", {"id": target_id}))
 
     # We moved the window to the workspace, which is all we can do if it was already empty
     if is_empty_workspace:
-        return
+        return actions_list
 
     # If we were focusing a floating window, we can't figure out what column to pull to, so do nothing
-    if orig_win["is_floating"]:
-        return
+    if orig_win.is_floating:
+        return actions_list
 
     # If target is floating, we already moved it to the workspace, so we're done
     # -> Would be nice to position under cursor, but niri IPC doesn't provide this info...?
-    if target_window_data["is_floating"]:
-        return
+    if target_window_data.is_floating:
+        return actions_list
 
     # Un-stack the window before pulling, so we only pull the target (IPC only allows pulling a full column)
-    if check_is_stacked_in_column(target_window_data, all_windows_data):
-        run_command("niri msg action consume-or-expel-window-left")
+    if check_is_stacked_in_column(target_window_data, niri_state):
+        actions_list.append(("ConsumeOrExpelWindowLeft", {}))
 
     # Move the target window next to where we're looking (if it isn't already there)
-    orig_column_idx = orig_win["layout"]["pos_in_scrolling_layout"][0]
+    orig_column_idx = orig_win.col_idx
     dest_column_idx = orig_column_idx + 1
-    target_column_idx = target_window_data["layout"]["pos_in_scrolling_layout"][0]
+    target_column_idx = target_window_data.col_idx
     if target_column_idx != dest_column_idx:
-        run_command(f"niri msg action move-column-to-index {dest_column_idx}")
+        actions_list.append(("MoveColumnToIndex", {"index": dest_column_idx}))
 
         # Bit of a hack, since niri IPC doesn't include camera inspection/control
         # We quickly focus the original window to try to force the niri 'camera' to look at
         # both the window we were on and the window we've just pulled.
         # If we don't do this, the camera may pan our original window out of view, which is jarring
-        focus_window(orig_id)
-        focus_window(target_id)
+        # -> This is sent in the same batch as the other actions, so it doesn't show up as a visible 'step'
+        actions_list.append(("FocusWindow", {"id": orig_id}))
+        actions_list.append(("FocusWindow", {"id": target_id}))
 
-    return
+    return actions_list
 
 
-def push_window(target_window_data: dict, all_windows_data: list[dict], scratchpad_name: str | None = None) -> None:
+def make_push_actions(
+    target_window_data: WindowInfo, niri_state: NiriState, scratchpad_name: str | None = None
+) -> list:
     """
-    Pushs a target window to the end of the current workspace, or to the next workspace if floating.
-    If a scratchpad (workspace) name is provided, then push windows to that workspace instead.
+    Builds the actions needed to push a target window to the end of the current workspace, or to the
+    next workspace if floating. If a scratchpad (workspace) name is provided, then push windows to that
+    workspace instead. Actions are meant to be sent as a single batch (see: make_pull_actions)
     """
 
     # Push to 'scratchpad' workspace, if provided
     if scratchpad_name is not None:
-        id_arg = f"--window-id {target_window_data['id']}"
-        run_command(f"niri msg action move-window-to-workspace {id_arg} {scratchpad_name} --focus false")
-        return
+        move_kwargs = {
+            "window_id": target_window_data.id,
+            "reference": make_workspace_reference(scratchpad_name),
+            "focus": False,
+        }
+        return [("MoveWindowToWorkspace", move_kwargs)]
 
     # We can't move floats to the end of the workspace, so just push them to the next workspace
     # (not ideal, but if 'pull' is enable, user can quickly bring it back...)
-    if target_window_data["is_floating"]:
-        run_command("niri msg action move-window-to-workspace-down --focus false")
-        return
+    if target_window_data.is_floating:
+        return [("MoveWindowToWorkspaceDown", {"focus": False})]
 
     # Figure out where look after we push the window
-    final_column_idx = max(1, target_window_data["layout"]["pos_in_scrolling_layout"][0] - 1)
-    if not target_window_data["is_focused"]:
-        orig_win = get_focused_window()
-        final_column_idx = orig_win["layout"]["pos_in_scrolling_layout"][0] if orig_win is not None else 1
-        focus_window(target_window_data["id"])
+    actions_list = []
+    final_column_idx = max(1, target_window_data.col_idx - 1)
+    if not target_window_data.is_focused:
+        orig_win = niri_state.get_focused_window()
+        final_column_idx = orig_win.col_idx if orig_win is not None else 1
+        actions_list.append(("FocusWindow", {"id": target_window_data.id}))
 
     # Un-stack the window before pushing if needed (IPC only allows pushing a full column)
-    if check_is_stacked_in_column(target_window_data, all_windows_data):
-        run_command("niri msg action consume-or-expel-window-right")
+    if check_is_stacked_in_column(target_window_data, niri_state):
+        actions_list.append(("ConsumeOrExpelWindowRight", {}))
 
     # Move the target window to the end of the workspace then snap back to where we were looking
-    run_command("niri msg action move-column-to-last")
-    run_command(f"niri msg action focus-column {final_column_idx}")
+    actions_list.append(("MoveColumnToLast", {}))
+    actions_list.append(("FocusColumn", {"index": final_column_idx}))
+
+    return actions_list
+
+
+def start_event_reader() -> tuple[NiriRequests, NiriState, object]:
+    """
+    Helper used to start listening to niri events (before spawning, so the new window can't be missed).
+    Returns the event reader, the (initial) niri state from the event stream & the event iterator
+    """
+
+    reader = NiriRequests(NiriRequests.get_niri_socket_path())
+    events_iter = reader.read_eventstream(STATE_EVENT_NAMES)
+    event_state = NiriState()
+    for evt_name, evt_data in events_iter:
+        event_state.update(evt_name, evt_data)
+        if evt_name == "WindowsChanged":
+            break
+
+    return reader, event_state, events_iter
+
+
+def wait_for_new_window(
+    reader: NiriRequests, event_state: NiriState, events_iter, spawned_pid: int, timeout_sec: float
+) -> WindowInfo | None:
+    """
+    Wait for a newly opened window that came from the spawned command (based on pid) or which
+    has a target app-id (some commands, like flatpak, launch the app as a different process).
+    Returns None if no matching window opens within the timeout
+    """
+
+    known_ids_set = set(event_state.windows.keys())
+    t_end = perf_counter() + timeout_sec
+    try:
+        while True:
+            reader.set_timeout(max(t_end - perf_counter(), 0.001))
+            evt_name, evt_data = next(events_iter)
+            event_state.update(evt_name, evt_data)
+
+            # Windows may only get an app-id after opening, so check every change to new windows
+            if evt_name != "WindowOpenedOrChanged" or evt_data["window"]["id"] in known_ids_set:
+                continue
+            new_win = event_state.windows[evt_data["window"]["id"]]
+            if new_win.pid == spawned_pid or new_win.id in find_window_ids(event_state, TARGET_APP_IDS, MATCH_MODE):
+                return new_win
+
+    except TimeoutError:
+        pass
+
+    return None
+
+
+def place_new_window(
+    new_win: WindowInfo, niri_state: NiriState, orig_win: WindowInfo | None, force_pull: bool = False
+) -> None:
+    """Apply float/pull placement to a newly spawned (or pre-spawned) window, using a single batch of actions"""
+
+    actions_list = []
+    if MAKE_FLOATING and not new_win.is_floating:
+        actions_list.append(("MoveWindowToFloating", {"id": new_win.id}))
+
+        # Plan the pull as if the window is already floating, using a copy so the (shared) state isn't modified
+        new_win = copy(new_win)
+        new_win.is_floating = True
+
+    # Pull from wherever the window opened (e.g. from window rules) to where we were looking when spawning
+    if ENABLE_PULL or force_pull:
+        actions_list.extend(make_pull_actions(new_win, niri_state, orig_win))
+    niri.action_batch(actions_list)
 
     return
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Connect to niri
+
+# Use a single connection for all requests/actions (much faster than calling 'niri msg' repeatedly)
+niri = connect_client()
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 # %% For setup/debugging
 
-enable_appid_inspection = COMMAND is None and TARGET_APP_ID is None
+enable_appid_inspection = COMMAND is None and len(TARGET_APP_IDS) == 0
 if enable_appid_inspection:
     from time import sleep
 
     try:
         while True:
-            win_dict = get_focused_window()
-            print("app-id:", win_dict["app_id"])
+            win_info = get_focused_window()
+            print("app-id:", win_info.app_id)
             sleep(0.5)
 
     except KeyboardInterrupt:
@@ -259,45 +368,72 @@ if enable_appid_inspection:
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Main code
 
-# Check if the target app-id is already opened
-all_win_list = get_windows_list()
-target_win_list = [w for w in all_win_list if str(w["app_id"]).lower() == TARGET_APP_ID.lower()]
+# Check if the target app-id is already opened (using app-id index, so we don't search every window)
+niri_state = niri.get_state()
+target_win_ids = find_window_ids(niri_state, TARGET_APP_IDS, MATCH_MODE, TITLE_PATTERN)
+target_win_list = [niri_state.windows[win_id] for win_id in target_win_ids]
+
+# Pre-spawned (parked) instances from the daemon's warm pool don't count as open
+warm_pool = niri.get_warm_pool(COMMAND) if COMMAND is not None else None
+if warm_pool is not None:
+    parked_ids_set = set(warm_pool.get_parked_ids())
+    target_win_list = [w for w in target_win_list if w.id not in parked_ids_set]
 
 # Handle script arg modifiers
 if ALWAYS_SPAWN:
     target_win_list = []
 if ACTIVE_WORKSPACE_ONLY:
-    active_wspace_ids_list = get_active_workspace_ids()
-    target_win_list = [w for w in target_win_list if w["workspace_id"] in active_wspace_ids_list]
+    active_wspace_ids_set = get_active_workspace_ids(niri_state)
+    target_win_list = [w for w in target_win_list if w.workspace_id in active_wspace_ids_set]
 if NO_FLOATS:
-    target_win_list = [w for w in target_win_list if not w["is_floating"]]
+    target_win_list = [w for w in target_win_list if not w.is_floating]
 if NO_TILES:
-    target_win_list = [w for w in target_win_list if w["is_floating"]]
+    target_win_list = [w for w in target_win_list if w.is_floating]
 
 # Open if no existing window
 num_already_open = len(target_win_list)
 if num_already_open == 0:
     if ENABLE_SPAWN and COMMAND is not None:
-        # Run the command and detach from caller
-        subprocess.Popen(
-            COMMAND.split(" "),
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            close_fds=True,
-            start_new_session=True,
-        )
+
+        # Use a pre-spawned instance if available (the daemon spawns a replacement after we're done)
+        pooled_win = warm_pool.take_window(niri_state) if warm_pool is not None else None
+        if pooled_win is not None:
+            place_new_window(pooled_win, niri_state, niri_state.get_focused_window(), force_pull=True)
+            quit()
+
+        if SPAWN_WAIT_SEC is None:
+            spawn_command(COMMAND)
+            quit()
+
+        # Waiting may be limited (e.g. through the daemon, where other commands are held up while waiting)
+        wait_sec = SPAWN_WAIT_SEC
+        max_wait_sec = niri.get_max_wait_sec()
+        if max_wait_sec is not None and wait_sec > max_wait_sec:
+            wait_sec = max_wait_sec
+
+        # Listen for the new window (on a separate connection, since the event stream can't be used for actions)
+        orig_win = niri_state.get_focused_window()
+        reader, event_state, events_iter = start_event_reader()
+        try:
+            spawned_pid = spawn_command(COMMAND)
+            new_win = wait_for_new_window(reader, event_state, events_iter, spawned_pid, wait_sec)
+        finally:
+            reader.close()
+        if new_win is None:
+            print(f"Timed out waiting for new window (after {wait_sec} sec)")
+        else:
+            place_new_window(new_win, event_state, orig_win)
     quit()
 
 # Push/pull/jump to the (single) open instance
 if num_already_open == 1:
     target_win = target_win_list[0]
-    if target_win["is_focused"] and ENABLE_PUSH:
-        push_window(target_win, all_win_list, SCRATCHPAD)
+    if target_win.is_focused and ENABLE_PUSH:
+        niri.action_batch(make_push_actions(target_win, niri_state, SCRATCHPAD))
     elif ENABLE_PULL:
-        pull_window(target_win, all_win_list)
+        niri.action_batch(make_pull_actions(target_win, niri_state, niri_state.get_focused_window()))
     else:
-        focus_window(target_win["id"])
+        focus_window(target_win.id)
     quit()
 
 
@@ -307,20 +443,41 @@ if num_already_open == 1:
 # -> pid is included to sort among floating windows
 # -> id isn't meant for sorting, it's included so we can get back the window id easily after sorting/indexing
 make_sortable_position = lambda d: (
-    d["workspace_id"],
-    *(d["layout"]["pos_in_scrolling_layout"] if not d["is_floating"] else (0, 0)),
-    d["pid"],
-    d["id"],
+    d.workspace_id,
+    *((d.col_idx, d.row_idx) if not d.is_floating else (0, 0)),
+    d.pid,
+    d.id,
 )
 
+# Jump through instances in order of most recent use, if needed
+# -> Instances that haven't been focused recently go last, in order of position
+if USE_MRU:
+    target_ids_set = {w.id for w in target_win_list}
+    recent_ids_list = niri_state.get_focus_history(list({w.app_id for w in target_win_list}))
+    recent_ids_list = [win_id for win_id in recent_ids_list if win_id in target_ids_set]
+    other_pos_list = sorted(make_sortable_position(w) for w in target_win_list if w.id not in recent_ids_list)
+    mru_ids_list = recent_ids_list + [pos[-1] for pos in other_pos_list]
+
+    # Going forward from an instance means going back to the previous one (like alt-tab)
+    curr_win = niri_state.get_focused_window()
+    is_on_target = curr_win is not None and curr_win.id in target_ids_set
+    if CYCLE_FORWARD:
+        next_id = mru_ids_list[1] if is_on_target and mru_ids_list[0] == curr_win.id else mru_ids_list[0]
+    else:
+        next_id = mru_ids_list[-1]
+    focus_window(next_id)
+    quit()
+
 # Get 'position' of all target windows in a sortable format
 target_pos_list = []
-for win_dict in target_win_list:
-    target_pos_list.append(make_sortable_position(win_dict))
+for win_info in target_win_list:
+    target_pos_list.append(make_sortable_position(win_info))
 
 # Figure out the current view position & add to listing if needed
-curr_win = get_focused_window()
-curr_pos = make_sortable_position(curr_win) if curr_win is not None else (get_focused_workspace_idx(), 0, 0, -1, -1)
+curr_win = niri_state.get_focused_window()
+curr_pos = (
+    make_sortable_position(curr_win) if curr_win is not None else (get_focused_workspace_idx(niri_state), 0, 0, -1, -1)
+)
 if curr_pos not in target_pos_list:
     target_pos_list.append(curr_pos)
 
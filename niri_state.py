@@ -0,0 +1,953 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for maintaining a local copy of the niri windowing state,
+built up from the events coming from the niri IPC event stream.
+See: https://yalter.github.io/niri/niri_ipc/enum.Event.html
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import re
+import json
+import logging
+from collections import deque
+from fnmatch import translate as glob_to_regex
+from dataclasses import dataclass
+from time import perf_counter, time
+
+# Shared modules only log through their own (un-configured) logger, scripts decide where messages end up
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Event names
+
+# Events needed to keep the window/workspace state up-to-date. Anything else
+# (e.g. keyboard/config events) can be skipped when reading the event stream
+STATE_EVENT_NAMES = frozenset(
+    {
+        "WorkspacesChanged",
+        "WorkspaceUrgencyChanged",
+        "WorkspaceActivated",
+        "WindowsChanged",
+        "WindowOpenedOrChanged",
+        "WindowClosed",
+        "WindowFocusChanged",
+        "WindowUrgencyChanged",
+        "WindowLayoutsChanged",
+        "OverviewOpenedOrClosed",
+    }
+)
+
+# Events which are known, but don't affect our state
+# -> Not doing anything with keyboard or config
+# -> Not using active window changes (window focus events cover what we need)
+IGNORED_EVENT_NAMES = frozenset(
+    {
+        "KeyboardLayoutsChanged",
+        "KeyboardLayoutSwitched",
+        "ConfigLoaded",
+        "WorkspaceActiveWindowChanged",
+    }
+)
+
+# Shared (read-only) result for index lookups with no matching windows
+_EMPTY_IDS = frozenset()
+
+# Ways of matching app_ids to patterns (see: find_window_ids)
+APP_ID_MATCH_MODES = ("exact", "glob", "regex")
+
+# Number of recently focused windows remembered for each app_id (see: get_focus_history)
+FOCUS_HISTORY_SIZE = 16
+
+# Focus that returns to the original window within this time is treated as a 'bounce' (e.g. from scripts
+# focusing a window to maximize it, then restoring focus) and isn't recorded in the focus history
+FOCUS_BOUNCE_SEC = 0.1
+
+# Time allowed for niri events to confirm a predicted change (e.g. from an action), before it is given up on
+PREDICTION_TIMEOUT_SEC = 1.0
+
+# Format version of saved state snapshots (snapshots with a different version are ignored)
+SNAPSHOT_VERSION = 2
+
+# Snapshots are re-saved periodically (even without changes) as a sign that the writer is still
+# connected to niri. Snapshots that haven't been saved for longer than the max age are ignored
+SNAPSHOT_HEARTBEAT_SEC = 2.0
+SNAPSHOT_MAX_AGE_SEC = 5.0
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Data types
+
+
+class WindowInfo:
+    """
+    Compact record of niri window info, updated in-place as events come in.
+    The layout data is flattened into separate fields (e.g. col_idx/row_idx), along with
+    an 'is_maximized' flag, which is derived from the window & output (monitor) widths.
+    If the output width isn't known, windows are never considered maximized.
+    See: https://yalter.github.io/niri/niri_ipc/struct.Window.html
+    """
+
+    __slots__ = (
+        "id",
+        "title",
+        "app_id",
+        "pid",
+        "workspace_id",
+        "is_focused",
+        "is_floating",
+        "is_urgent",
+        "col_idx",
+        "row_idx",
+        "window_size",
+        "tile_pos_in_workspace_view",
+        "is_maximized",
+    )
+
+    def __init__(self, window_data: dict, output_width: int | None = None):
+        self.update(window_data, output_width)
+
+    def update(self, window_data: dict, output_width: int | None = None):
+        """Overwrite all fields using raw niri window data (e.g. from a WindowOpenedOrChanged event)"""
+        self.id: int = window_data["id"]
+        self.title: str | None = window_data["title"]
+        self.app_id: str | None = window_data["app_id"]
+        self.pid: int | None = window_data["pid"]
+        self.workspace_id: int | None = window_data["workspace_id"]
+        self.is_focused: bool = window_data["is_focused"]
+        self.is_floating: bool = window_data["is_floating"]
+        self.is_urgent: bool = window_data["is_urgent"]
+        self.update_layout(window_data["layout"], output_width)
+        return self
+
+    def update_layout(self, layout_data: dict, output_width: int | None = None):
+        """Overwrite layout fields using raw niri layout data (e.g. from a WindowLayoutsChanged event)"""
+        win_pos = layout_data["pos_in_scrolling_layout"]
+        self.col_idx, self.row_idx = win_pos if win_pos is not None else (None, None)
+        self.window_size: list[int] = layout_data["window_size"]
+        self.tile_pos_in_workspace_view: list[float] | None = layout_data["tile_pos_in_workspace_view"]
+        self.update_is_maximized(output_width)
+        return self
+
+    def update_is_maximized(self, output_width: int | None, max_width_threshold: float = 0.8):
+        """Re-compute the 'is_maximized' flag, based on the width of the output the window is on"""
+        is_known_width = output_width is not None
+        self.is_maximized = is_known_width and (self.window_size[0] / output_width) > max_width_threshold
+        return self
+
+    def __repr__(self):
+        return f"WindowInfo({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
+
+
+class WorkspaceInfo:
+    """
+    Compact record of niri workspace info, updated in-place as events come in
+    See: https://yalter.github.io/niri/niri_ipc/struct.Workspace.html
+    """
+
+    __slots__ = ("id", "idx", "name", "output", "is_urgent", "is_active", "is_focused", "active_window_id")
+
+    def __init__(self, workspace_data: dict):
+        self.update(workspace_data)
+
+    def update(self, workspace_data: dict):
+        """Overwrite all fields using raw niri workspace data (e.g. from a WorkspacesChanged event)"""
+        self.id: int = workspace_data["id"]
+        self.idx: int = workspace_data["idx"]
+        self.name: str | None = workspace_data["name"]
+        self.output: str | None = workspace_data["output"]
+        self.is_urgent: bool = workspace_data["is_urgent"]
+        self.is_active: bool = workspace_data["is_active"]
+        self.is_focused: bool = workspace_data["is_focused"]
+        self.active_window_id: int | None = workspace_data["active_window_id"]
+        return self
+
+    def __repr__(self):
+        return f"WorkspaceInfo({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
+
+
+class OutputInfo:
+    """
+    Compact record of niri output (i.e. monitor) info. Sizing info is in logical pixels
+    and will be None if the output is disabled.
+    See: https://yalter.github.io/niri/niri_ipc/struct.Output.html
+    """
+
+    __slots__ = ("name", "x", "y", "width", "height", "scale")
+
+    def __init__(self, output_data: dict):
+        self.update(output_data)
+
+    def update(self, output_data: dict):
+        """Overwrite all fields using raw niri output data (e.g. from an Outputs request)"""
+        logical = output_data.get("logical", None)
+        is_enabled = logical is not None
+        self.name: str = output_data["name"]
+        self.x: int | None = logical["x"] if is_enabled else None
+        self.y: int | None = logical["y"] if is_enabled else None
+        self.width: int | None = logical["width"] if is_enabled else None
+        self.height: int | None = logical["height"] if is_enabled else None
+        self.scale: float | None = logical["scale"] if is_enabled else None
+        return self
+
+    def __repr__(self):
+        return f"OutputInfo({', '.join(f'{k}={getattr(self, k)!r}' for k in self.__slots__)})"
+
+
+@dataclass
+class FocusState:
+    workspace_id: int = None
+    window_id: int = None
+
+    def copy_inplace(self, other_focus_state):
+        """Overwrite current data with data from another object (avoids creating new instances)"""
+        self.workspace_id = other_focus_state.workspace_id
+        self.window_id = other_focus_state.window_id
+        return self
+
+
+@dataclass
+class StateChange:
+    """Holds the window data (if any) that was opened, moved or closed by the most recent event"""
+
+    opened_window: WindowInfo = None
+    moved_window: WindowInfo = None
+    closed_window: WindowInfo = None
+
+    def clear(self):
+        """Reset all entries (avoids creating new instances on every event)"""
+        self.opened_window = None
+        self.moved_window = None
+        self.closed_window = None
+        return self
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class NiriState:
+    """
+    Helper used to keep track of niri windows/workspaces/focus, using event stream data.
+    Entries are stored as compact records (see WindowInfo, WorkspaceInfo, OutputInfo),
+    which are updated in-place, rather than being replaced on every event.
+    Also maintains per-workspace indexes of tiled/floating/maximized window ids (and an
+    index of window ids per app_id), so that these don't need to be found by searching
+    through every window on every event. A short history of recently focused windows is
+    also kept for each app_id, for most-recently-used ordering.
+
+    The expected results of actions can be applied right away as 'predictions' (see: predict),
+    so that decisions made before niri responds aren't based on out-of-date state. Predictions
+    are kept (even if older events disagree) until an event confirms them, they are rolled back
+    (e.g. if the action failed) or they time out (see: expire_predictions)
+    """
+
+    def __init__(self, outputs: dict[str, OutputInfo] | None = None):
+
+        self.windows: dict[int, WindowInfo] = {}
+        self.workspaces: dict[int, WorkspaceInfo] = {}
+        self.outputs: dict[str, OutputInfo] = {}
+        self.output_width_lut: dict[str, int] = {}
+        self.is_overview_open = False
+
+        self.focus = FocusState()
+        self.prev_focus = FocusState()
+        self.change = StateChange()
+
+        # Window id indexes, per workspace id (maximized windows are only tracked for tiled windows)
+        self._tiled_ids_per_workspace: dict[int, set[int]] = {}
+        self._floating_ids_per_workspace: dict[int, set[int]] = {}
+        self._maximized_ids_per_workspace: dict[int, set[int]] = {}
+        self._ids_per_app_id: dict[str | None, set[int]] = {}  # Keyed by lower-case app_id
+
+        # Recently focused windows per app_id (most recent first), stored as: (focus count, window id)
+        self._focus_history_per_app_id: dict[str | None, deque[tuple[int, int]]] = {}
+        self._num_focus_changes = 0
+
+        # Focus changes that may turn out to be a bounce, stored as: (window, replaced history entry)
+        self._bounce_entries: list[tuple[WindowInfo, tuple[int, int] | None]] = []
+        self._bounce_origin_id: int | None = None
+        self._t_last_focus_change = -FOCUS_BOUNCE_SEC
+
+        # Predicted window changes that haven't been confirmed by events, along with the last values
+        # reported by niri (used to roll back), stored as: {id: (predicted fields, niri fields, expiry time)}
+        self._pending_per_window: dict[int, tuple[dict, dict, float]] = {}
+        self._new_prediction_ids: set[int] = set()
+        self.num_predictions_confirmed = 0
+        self.num_predictions_rolled_back = 0
+
+        # Lookup table of state update functions, one per event name (see: update)
+        self._update_funcs_lut = {
+            "WorkspacesChanged": self._on_WorkspacesChanged,
+            "WorkspaceUrgencyChanged": self._on_WorkspaceUrgencyChanged,
+            "WorkspaceActivated": self._on_WorkspaceActivated,
+            "WindowsChanged": self._on_WindowsChanged,
+            "WindowOpenedOrChanged": self._on_WindowOpenedOrChanged,
+            "WindowClosed": self._on_WindowClosed,
+            "WindowFocusChanged": self._on_WindowFocusChanged,
+            "WindowUrgencyChanged": self._on_WindowUrgencyChanged,
+            "WindowLayoutsChanged": self._on_WindowLayoutsChanged,
+            "OverviewOpenedOrClosed": self._on_OverviewOpenedOrClosed,
+        }
+
+        self.set_outputs(outputs if outputs is not None else {})
+
+    def set_outputs(self, outputs: dict[str, OutputInfo]) -> set[str]:
+        """
+        Update output (i.e. monitor) info. Windows on outputs that were added, removed or
+        changed width (e.g. from hotplugging or scale changes) get their maximized state re-computed.
+        Returns the names of the outputs that changed
+        """
+
+        prev_width_lut = self.output_width_lut
+        self.outputs = outputs
+        self.output_width_lut = {name: out.width for name, out in outputs.items() if out.width is not None}
+
+        all_names = prev_width_lut.keys() | self.output_width_lut.keys()
+        changed_names = {name for name in all_names if prev_width_lut.get(name) != self.output_width_lut.get(name)}
+        if len(changed_names) > 0:
+            self._refresh_maximized([ws.id for ws in self.workspaces.values() if ws.output in changed_names])
+
+        return changed_names
+
+    def get_output_width(self, workspace_id: int | None) -> int | None:
+        """Get the width of the output that a workspace is on (None if unknown)"""
+        wspace = self.workspaces.get(workspace_id, None)
+        return self.output_width_lut.get(wspace.output, None) if wspace is not None else None
+
+    def get_focused_window(self) -> WindowInfo | None:
+        return self.windows.get(self.focus.window_id, None)
+
+    def get_tiled_window_ids(self, workspace_id: int) -> set[int]:
+        """Get ids of all (non-floating) windows on a workspace. Result should not be modified!"""
+        return self._tiled_ids_per_workspace.get(workspace_id, _EMPTY_IDS)
+
+    def get_floating_window_ids(self, workspace_id: int) -> set[int]:
+        """Get ids of all floating windows on a workspace. Result should not be modified!"""
+        return self._floating_ids_per_workspace.get(workspace_id, _EMPTY_IDS)
+
+    def get_maximized_window_ids(self, workspace_id: int) -> set[int]:
+        """Get ids of all maximized (non-floating) windows on a workspace. Result should not be modified!"""
+        return self._maximized_ids_per_workspace.get(workspace_id, _EMPTY_IDS)
+
+    def get_window_ids_by_app_id(self, app_id: str | None) -> set[int]:
+        """Get ids of all windows with the given app_id (ignoring case). Result should not be modified!"""
+        return self._ids_per_app_id.get(_lower_app_id(app_id), _EMPTY_IDS)
+
+    def get_app_ids(self) -> list[str | None]:
+        """Get all (lower-case) app_ids that currently have at least 1 window"""
+        return list(self._ids_per_app_id.keys())
+
+    def get_focus_history(self, app_ids: list[str | None]) -> list[int]:
+        """
+        Get ids of recently focused windows with any of the given app_ids, most recently focused first.
+        Only the last few windows (see FOCUS_HISTORY_SIZE) are remembered for each app_id
+        """
+        entries = [entry for app_id in app_ids for entry in self._focus_history_per_app_id.get(app_id, ())]
+        return [win_id for _, win_id in sorted(entries, reverse=True)]
+
+    def predict(self, window_id: int, timeout_sec: float = PREDICTION_TIMEOUT_SEC, **predicted_fields):
+        """
+        Apply the expected result of an action to a window right away, for example:
+            predict(5, is_maximized=True)
+        The change is marked as pending, until events from niri either confirm it, or it is rolled
+        back (in which case the last data from niri is restored), either on request or after timing out
+        """
+
+        # Record the niri data being replaced (only if not already replaced by an earlier prediction)
+        win = self.windows[window_id]
+        prev_fields, niri_fields, _ = self._pending_per_window.get(window_id, ({}, {}, None))
+        niri_fields = {**{key: getattr(win, key) for key in predicted_fields.keys()}, **niri_fields}
+        self._apply_window_fields(win, predicted_fields)
+        t_expire = perf_counter() + timeout_sec
+        self._pending_per_window[window_id] = ({**prev_fields, **predicted_fields}, niri_fields, t_expire)
+        self._new_prediction_ids.add(window_id)
+        return self
+
+    def pop_new_prediction_ids(self) -> set[int]:
+        """Get the ids of windows with predictions made since the last call (e.g. to roll back if actions fail)"""
+        new_ids, self._new_prediction_ids = self._new_prediction_ids, set()
+        return new_ids
+
+    def rollback_predictions(self, window_ids: set[int]) -> int:
+        """
+        Undo pending predictions (e.g. if the predicted action failed), restoring the last data
+        reported by niri. Windows without pending predictions are skipped. Returns number rolled back
+        """
+
+        num_rolled_back = 0
+        for win_id in window_ids:
+            pending = self._pending_per_window.pop(win_id, None)
+            win = self.windows.get(win_id, None)
+            if pending is None or win is None:
+                continue
+            _, niri_fields, _ = pending
+            self._apply_window_fields(win, niri_fields)
+            num_rolled_back += 1
+        self.num_predictions_rolled_back += num_rolled_back
+
+        return num_rolled_back
+
+    def expire_predictions(self) -> int:
+        """
+        Roll back predictions that timed out without being confirmed (e.g. if niri sent no events,
+        because the action had no effect). Returns number of predictions rolled back
+        """
+        t_now = perf_counter()
+        expired_ids = {win_id for win_id, (_, _, t_expire) in self._pending_per_window.items() if t_now >= t_expire}
+        return self.rollback_predictions(expired_ids) if len(expired_ids) > 0 else 0
+
+    def is_pending(self, window_id: int) -> bool:
+        """Check if a window has predicted changes which haven't been confirmed by niri yet"""
+        return window_id in self._pending_per_window
+
+    def get_focused_output(self) -> OutputInfo | None:
+        wspace = self.workspaces.get(self.focus.workspace_id, None)
+        return self.outputs.get(wspace.output, None) if wspace is not None else None
+
+    def update(self, event_name: str, event_data: dict) -> StateChange:
+        """
+        Update state using a single event from the niri event stream.
+        Returns info about windows that were opened/moved/closed by the event
+        """
+
+        self.prev_focus.copy_inplace(self.focus)
+        self.change.clear()
+        update_func = self._update_funcs_lut.get(event_name, None)
+        if update_func is not None:
+            update_func(event_data)
+        elif event_name not in IGNORED_EVENT_NAMES:
+            logger.warning("Unknown event: %s", event_name)
+
+        return self.change
+
+    def _on_WorkspacesChanged(self, event_data: dict):
+        # Replace existing workspace info
+        prev_output_lut = {ws.id: ws.output for ws in self.workspaces.values()}
+        self.workspaces = make_workspace_state_from_WorkspacesChanged(event_data, self.workspaces)
+        for item in self.workspaces.values():
+            if item.is_focused:
+                self.focus.workspace_id = item.id
+
+        # Workspaces that moved to a different output may need their windows' maximized state updated
+        moved_ids = [ws.id for ws in self.workspaces.values() if prev_output_lut.get(ws.id, ws.output) != ws.output]
+        if len(moved_ids) > 0:
+            self._refresh_maximized(moved_ids)
+        return
+
+    def _on_WorkspaceUrgencyChanged(self, event_data: dict):
+        # Update our existing workspace state
+        self.workspaces[event_data["id"]].is_urgent = event_data["urgent"]
+        return
+
+    def _on_WorkspaceActivated(self, event_data: dict):
+        # Activated workspace de-activates all others on the same output (and takes focus, if focused)
+        evt_wspace = self.workspaces[event_data["id"]]
+        for item in self.workspaces.values():
+            if item.output == evt_wspace.output:
+                item.is_active = False
+            if event_data["focused"]:
+                item.is_focused = False
+        evt_wspace.is_active = True
+        if event_data["focused"]:
+            evt_wspace.is_focused = True
+            self.focus.workspace_id = evt_wspace.id
+        return
+
+    def _on_WindowsChanged(self, event_data: dict):
+        # Replace existing window state (full state from niri, so no predictions are needed)
+        self.windows = make_window_state_from_WindowsChanged(event_data, self)
+        self._pending_per_window.clear()
+        self._new_prediction_ids.clear()
+        self._rebuild_indexes()
+        for item in self.windows.values():
+            if item.is_focused:
+                self.focus.window_id = item.id
+                self._record_focus(item)
+
+        # Forget about windows that no longer exist
+        for app_id, history in list(self._focus_history_per_app_id.items()):
+            history = deque((entry for entry in history if entry[1] in self.windows), FOCUS_HISTORY_SIZE)
+            if len(history) > 0:
+                self._focus_history_per_app_id[app_id] = history
+            else:
+                del self._focus_history_per_app_id[app_id]
+        return
+
+    def _on_WindowOpenedOrChanged(self, event_data: dict):
+
+        # Decide if we have a new/moved window
+        evt_win_data = event_data["window"]
+        evt_win_id = evt_win_data["id"]
+        output_width = self.get_output_width(evt_win_data["workspace_id"])
+        win = self.windows.get(evt_win_id, None)
+        if win is None:
+            win = WindowInfo(evt_win_data, output_width)
+            self.windows[evt_win_id] = win
+            self.change.opened_window = win
+        else:
+            prev_wspace_id = win.workspace_id
+            self._unindex_window(win)
+            win.update(evt_win_data, output_width)
+            if prev_wspace_id != win.workspace_id:
+                self.change.moved_window = win
+        self._index_window(win)
+        if len(self._pending_per_window) > 0:
+            self._reconcile_prediction(win)
+
+        # Update focus, if needed (a focused window means all others are unfocused)
+        if win.is_focused:
+            self._set_focused_window(evt_win_id)
+        return
+
+    def _on_WindowClosed(self, event_data: dict):
+        # Delete closed window state data
+        self.change.closed_window = self.windows.pop(event_data["id"], None)
+        if self.change.closed_window is not None:
+            self._unindex_window(self.change.closed_window)
+            self._pending_per_window.pop(event_data["id"], None)
+            self._forget_focus(self.change.closed_window)
+        return
+
+    def _on_WindowFocusChanged(self, event_data: dict):
+        # Update existing focus state
+        self._set_focused_window(event_data["id"])
+        return
+
+    def _on_WindowUrgencyChanged(self, event_data: dict):
+        # Update our existing window state
+        self.windows[event_data["id"]].is_urgent = event_data["urgent"]
+        return
+
+    def _on_WindowLayoutsChanged(self, event_data: dict):
+        # Update existing window layout data
+        for evt_win_id, evt_new_layout in event_data["changes"]:
+            win = self.windows[evt_win_id]
+            self._unindex_window(win)
+            win.update_layout(evt_new_layout, self.get_output_width(win.workspace_id))
+            self._index_window(win)
+            if len(self._pending_per_window) > 0:
+                self._reconcile_prediction(win)
+        return
+
+    def _on_OverviewOpenedOrClosed(self, event_data: dict):
+        self.is_overview_open = event_data["is_open"]
+        return
+
+    def _reconcile_prediction(self, win: WindowInfo):
+        """
+        Compare (newly updated) window data against any predicted changes. Predictions are
+        confirmed if the data matches, re-applied if they haven't timed out yet (the event may
+        have been sent before niri handled the action) or otherwise dropped
+        """
+
+        pending = self._pending_per_window.get(win.id, None)
+        if pending is None:
+            return
+
+        # Keep track of the latest niri data, in case the prediction needs to be rolled back
+        predicted_fields, niri_fields, t_expire = pending
+        for key in niri_fields.keys():
+            niri_fields[key] = getattr(win, key)
+
+        if all(getattr(win, key) == value for key, value in predicted_fields.items()):
+            del self._pending_per_window[win.id]
+            self.num_predictions_confirmed += 1
+        elif perf_counter() < t_expire:
+            self._apply_window_fields(win, predicted_fields)
+        else:
+            del self._pending_per_window[win.id]
+            self.num_predictions_rolled_back += 1
+
+        return
+
+    def _apply_window_fields(self, win: WindowInfo, fields_dict: dict):
+        """Helper used to overwrite window fields, while keeping the indexes up-to-date"""
+        self._unindex_window(win)
+        for key, value in fields_dict.items():
+            setattr(win, key, value)
+        self._index_window(win)
+        return
+
+    def _refresh_maximized(self, workspace_ids: list[int]):
+        """Re-compute the maximized state of all windows on the given workspaces (e.g. after output changes)"""
+        for wspace_id in workspace_ids:
+            output_width = self.get_output_width(wspace_id)
+            win_ids = self.get_tiled_window_ids(wspace_id) | self.get_floating_window_ids(wspace_id)
+            for win_id in win_ids:
+                win = self.windows[win_id]
+                self._unindex_window(win)
+                win.update_is_maximized(output_width)
+                self._index_window(win)
+        return
+
+    def _rebuild_indexes(self):
+        """Re-build all per-workspace window indexes from scratch (e.g. after replacing all windows)"""
+        self._tiled_ids_per_workspace.clear()
+        self._floating_ids_per_workspace.clear()
+        self._maximized_ids_per_workspace.clear()
+        self._ids_per_app_id.clear()
+        for item in self.windows.values():
+            self._index_window(item)
+        return
+
+    def _index_window(self, win: WindowInfo):
+        """Add a window to the per-workspace & app_id indexes (based on it's current floating/maximized state)"""
+        wspace_id = win.workspace_id
+        self._ids_per_app_id.setdefault(_lower_app_id(win.app_id), set()).add(win.id)
+        if win.is_floating:
+            self._floating_ids_per_workspace.setdefault(wspace_id, set()).add(win.id)
+        else:
+            self._tiled_ids_per_workspace.setdefault(wspace_id, set()).add(win.id)
+            if win.is_maximized:
+                self._maximized_ids_per_workspace.setdefault(wspace_id, set()).add(win.id)
+        return
+
+    def _unindex_window(self, win: WindowInfo):
+        """Remove a window from the indexes. Must be called before modifying the window record!"""
+        wspace_id = win.workspace_id
+        app_id_key = _lower_app_id(win.app_id)
+        app_ids_set = self._ids_per_app_id.get(app_id_key, None)
+        if app_ids_set is not None:
+            app_ids_set.discard(win.id)
+            if len(app_ids_set) == 0:
+                del self._ids_per_app_id[app_id_key]
+        for index_lut in (
+            self._tiled_ids_per_workspace,
+            self._floating_ids_per_workspace,
+            self._maximized_ids_per_workspace,
+        ):
+            ids_set = index_lut.get(wspace_id, None)
+            if ids_set is not None:
+                ids_set.discard(win.id)
+                if len(ids_set) == 0:
+                    del index_lut[wspace_id]
+        return
+
+    def _set_focused_window(self, window_id: int | None):
+        """Helper used to move the 'is_focused' flag from the previously focused window to a new one"""
+        prev_win = self.windows.get(self.focus.window_id, None)
+        if prev_win is not None:
+            prev_win.is_focused = False
+        new_win = self.windows.get(window_id, None)
+        if new_win is not None:
+            new_win.is_focused = True
+            if window_id != self.focus.window_id:
+                self._record_focus_change(new_win)
+        self.focus.window_id = window_id
+        return
+
+    def _record_focus_change(self, win: WindowInfo):
+        """
+        Helper used to record a change of focus in the focus history. If focus quickly returns
+        to where it started, the windows that it passed through are taken back out of the history
+        """
+
+        # Quick changes continue a possible bounce, otherwise a new one may start from the current focus
+        t_now = perf_counter()
+        is_quick_change = (t_now - self._t_last_focus_change) < FOCUS_BOUNCE_SEC
+        self._t_last_focus_change = t_now
+        if not is_quick_change:
+            self._bounce_entries.clear()
+            self._bounce_origin_id = self.focus.window_id
+        elif win.id == self._bounce_origin_id:
+            self._undo_focus_bounce()
+
+        is_recorded, replaced_entry = self._record_focus(win)
+        if is_recorded:
+            self._bounce_entries.append((win, replaced_entry))
+
+        return
+
+    def _undo_focus_bounce(self):
+        """Helper used to restore the focus history from before a bounce (see: _record_focus_change)"""
+
+        for win, replaced_entry in reversed(self._bounce_entries):
+            self._forget_focus(win)
+            if replaced_entry is not None and win.id in self.windows:
+                history = self._focus_history_per_app_id.setdefault(win.app_id, deque(maxlen=FOCUS_HISTORY_SIZE))
+                insert_idx = sum(1 for entry in history if entry > replaced_entry)
+                history.insert(insert_idx, replaced_entry)
+        self._bounce_entries.clear()
+
+        return
+
+    def _record_focus(self, win: WindowInfo) -> tuple[bool, tuple[int, int] | None]:
+        """
+        Helper used to move a window to the front of the focus history for it's app_id.
+        Returns: is_recorded, replaced_history_entry (None if the window wasn't in the history)
+        """
+
+        history = self._focus_history_per_app_id.get(win.app_id, None)
+        if history is None:
+            history = deque(maxlen=FOCUS_HISTORY_SIZE)
+            self._focus_history_per_app_id[win.app_id] = history
+            replaced_entry = None
+        elif len(history) > 0 and history[0][1] == win.id:
+            # Already the most recent (e.g. focused window had it's title changed), nothing to do
+            return False, None
+        else:
+            replaced_entry = self._forget_focus(win)
+
+        self._num_focus_changes += 1
+        history.appendleft((self._num_focus_changes, win.id))
+        return True, replaced_entry
+
+    def _forget_focus(self, win: WindowInfo) -> tuple[int, int] | None:
+        """Helper used to remove a window from the focus history (e.g. when it closes). Returns the removed entry"""
+        history = self._focus_history_per_app_id.get(win.app_id, None)
+        if history is None:
+            return None
+        removed_entry = None
+        for entry in history:
+            if entry[1] == win.id:
+                removed_entry = entry
+                history.remove(entry)
+                break
+        if len(history) == 0:
+            del self._focus_history_per_app_id[win.app_id]
+        return removed_entry
+
+
+class EventDispatcher:
+    """
+    Helper used to pass events on to handlers (e.g. window tiling behaviors), based on event name.
+    Every event first updates the shared niri state, then any handlers subscribed to
+    that event are called (in the order they were subscribed) using:
+        handler(niri_state, state_change, event_data)
+    Handlers can be switched off (e.g. during start-up), in which case only the state is updated
+    """
+
+    def __init__(self, niri_state: NiriState):
+        self.state = niri_state
+        self._handlers_lut: dict[str, list] = {}
+        self.is_handling_enabled = True
+
+        # Optional timing recorder (see niri_stats.py), used to record state update & handler times
+        self.stats = None
+
+    def subscribe(self, event_names: str | list[str], handler):
+        """Register a handler to be called on the given event(s)"""
+        if isinstance(event_names, str):
+            event_names = [event_names]
+        for name in event_names:
+            self._handlers_lut.setdefault(name, []).append(handler)
+        return self
+
+    def get_event_names(self) -> frozenset[str]:
+        """Get names of all events needed for state tracking or by subscribers (others can be skipped)"""
+        return STATE_EVENT_NAMES.union(self._handlers_lut.keys())
+
+    def dispatch(self, event_name: str, event_data: dict) -> StateChange:
+        """Update state & call all subscribed handlers for a single event"""
+
+        t1 = perf_counter()
+        state_change = self.state.update(event_name, event_data)
+        t2 = perf_counter()
+        handlers_list = self._handlers_lut.get(event_name, ()) if self.is_handling_enabled else ()
+        for handler in handlers_list:
+            handler(self.state, state_change, event_data)
+
+        if self.stats is not None:
+            self.stats.record("state", event_name, t2 - t1)
+            if len(handlers_list) > 0:
+                self.stats.record("handlers", event_name, perf_counter() - t2)
+
+        return state_change
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def make_workspace_state_from_WorkspacesChanged(
+    event_data: dict, prev_state: dict[int, WorkspaceInfo] | None = None
+) -> dict[int, WorkspaceInfo]:
+    """Build workspace state, re-using existing records (from a previous state) when possible"""
+    prev_state = prev_state if prev_state is not None else {}
+    state = {}
+    for info_dict in event_data["workspaces"]:
+        wspace = prev_state.get(info_dict["id"], None)
+        state[info_dict["id"]] = WorkspaceInfo(info_dict) if wspace is None else wspace.update(info_dict)
+    return state
+
+
+def make_window_state_from_WindowsChanged(event_data: dict, niri_state: NiriState) -> dict[int, WindowInfo]:
+    """Build window state, re-using existing records when possible"""
+    state = {}
+    for info_dict in event_data["windows"]:
+        win_id = info_dict["id"]
+        output_width = niri_state.get_output_width(info_dict["workspace_id"])
+        win = niri_state.windows.get(win_id, None)
+        state[win_id] = WindowInfo(info_dict, output_width) if win is None else win.update(info_dict, output_width)
+    return state
+
+
+def make_output_state_from_Outputs(outputs_data: dict[str, dict]) -> dict[str, OutputInfo]:
+    return {out_key: OutputInfo(out_dict) for out_key, out_dict in outputs_data.items()}
+
+
+def get_windows_by_conditions(window_state: dict[int, WindowInfo], **conditions) -> dict[int, WindowInfo]:
+    """Function used to filter window state data according to attribute-value conditions"""
+    meets_conditions = lambda data: all(getattr(data, k) == v for k, v in conditions.items())
+    return {winid: windata for winid, windata in window_state.items() if meets_conditions(windata)}
+
+
+def find_window_ids(
+    niri_state: NiriState,
+    app_id_patterns: list[str],
+    match_mode: str = "exact",
+    title_pattern: str | None = None,
+) -> set[int]:
+    """
+    Function used to find the ids of windows matching any of the given app_id patterns.
+    Patterns can be matched exactly, as globs (e.g. 'org.gnome.*') or as regex (searched),
+    all ignoring case. Exact patterns are looked up directly in the app_id index, while other
+    patterns are only checked against each distinct app_id, so the cost doesn't grow with
+    the number of windows per application. If a title pattern (regex) is given, only windows
+    with a matching title are kept (windows without a title never match)
+    """
+
+    if match_mode not in APP_ID_MATCH_MODES:
+        raise ValueError(f"Unknown match mode: {match_mode} (expecting one of: {', '.join(APP_ID_MATCH_MODES)})")
+
+    # Exact matches skip regex entirely, since this is the most common use
+    window_ids = set()
+    if match_mode == "exact":
+        for pattern in app_id_patterns:
+            window_ids.update(niri_state.get_window_ids_by_app_id(pattern))
+    else:
+        regex_strs = app_id_patterns if match_mode == "regex" else [glob_to_regex(p) for p in app_id_patterns]
+        app_id_regex = re.compile("|".join(f"(?:{regex_str})" for regex_str in regex_strs), re.IGNORECASE)
+        for app_id in niri_state.get_app_ids():
+            if app_id is not None and app_id_regex.search(app_id) is not None:
+                window_ids.update(niri_state.get_window_ids_by_app_id(app_id))
+
+    if title_pattern is not None:
+        title_regex = re.compile(title_pattern, re.IGNORECASE)
+        titles_iter = ((win_id, niri_state.windows[win_id].title) for win_id in window_ids)
+        window_ids = {win_id for win_id, title in titles_iter if title is not None and title_regex.search(title)}
+
+    return window_ids
+
+
+def _lower_app_id(app_id: str | None) -> str | None:
+    """Helper used to make app_id keys for case-insensitive lookups (app_ids can be missing, i.e. None)"""
+    return app_id.lower() if app_id is not None else None
+
+
+def get_state_snapshot_path() -> str | None:
+    """
+    Get the path to the saved state snapshot file (one per user session). Returns None if there is
+    no (private) runtime folder, since a shared folder (e.g. /tmp) would let other users supply the snapshot
+    """
+    runtime_folder = os.environ.get("XDG_RUNTIME_DIR", "")
+    return os.path.join(runtime_folder, "niri_tweaks_state.json") if runtime_folder != "" else None
+
+
+def make_state_snapshot(niri_state: NiriState, niri_socket_path: str, is_connected: bool = True) -> dict:
+    """
+    Build a compact (json-friendly) copy of the niri state, for saving to disk.
+    Each record is stored as a list of values, in the same order as the record __slots__.
+    The niri socket path is included, since it is unique to each niri session, along with
+    whether the state is still being kept up-to-date from a connection to niri
+    """
+    return {
+        "version": SNAPSHOT_VERSION,
+        "time": round(time(), 3),
+        "writer_pid": os.getpid(),
+        "is_connected": is_connected,
+        "niri_socket": niri_socket_path,
+        "outputs": [[getattr(out, k) for k in OutputInfo.__slots__] for out in niri_state.outputs.values()],
+        "workspaces": [[getattr(ws, k) for k in WorkspaceInfo.__slots__] for ws in niri_state.workspaces.values()],
+        "windows": [[getattr(win, k) for k in WindowInfo.__slots__] for win in niri_state.windows.values()],
+        "focus": [niri_state.focus.workspace_id, niri_state.focus.window_id],
+        "focus_history": [
+            [app_id, [list(entry) for entry in history]]
+            for app_id, history in niri_state._focus_history_per_app_id.items()
+        ],
+        "is_overview_open": niri_state.is_overview_open,
+    }
+
+
+def make_state_from_snapshot(snapshot: dict) -> NiriState:
+    """Re-build niri state from a snapshot (see: make_state_snapshot), including window indexes"""
+
+    def make_record(record_class, values_list):
+        record = record_class.__new__(record_class)
+        for key, value in zip(record_class.__slots__, values_list):
+            setattr(record, key, value)
+        return record
+
+    outputs_list = [make_record(OutputInfo, values) for values in snapshot["outputs"]]
+    niri_state = NiriState({out.name: out for out in outputs_list})
+    niri_state.workspaces = {ws.id: ws for ws in (make_record(WorkspaceInfo, v) for v in snapshot["workspaces"])}
+    niri_state.windows = {win.id: win for win in (make_record(WindowInfo, v) for v in snapshot["windows"])}
+    niri_state.focus.workspace_id, niri_state.focus.window_id = snapshot["focus"]
+    niri_state.is_overview_open = snapshot["is_overview_open"]
+    niri_state._rebuild_indexes()
+    for app_id, history_list in snapshot.get("focus_history", []):
+        history = deque((tuple(entry) for entry in history_list), FOCUS_HISTORY_SIZE)
+        niri_state._focus_history_per_app_id[app_id] = history
+        niri_state._num_focus_changes = max([niri_state._num_focus_changes, *(n for n, _ in history)])
+
+    return niri_state
+
+
+def save_state_snapshot(
+    niri_state: NiriState, niri_socket_path: str, snapshot_path: str, is_connected: bool = True
+) -> None:
+    """
+    Save a snapshot of the niri state to disk. The file is written under a temporary name
+    and then renamed, so that readers never see a partially written snapshot
+    """
+    temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as outfile:
+        json.dump(make_state_snapshot(niri_state, niri_socket_path, is_connected), outfile, separators=(",", ":"))
+    os.replace(temp_path, snapshot_path)
+    return
+
+
+def load_state_snapshot(niri_socket_path: str, snapshot_path: str) -> dict | None:
+    """
+    Load a saved state snapshot, if one exists for the current niri session.
+    Returns None if there is no snapshot, or it came from a different niri session or snapshot version.
+    Note that this does not mean the snapshot is up-to-date (see: is_snapshot_fresh)
+    """
+
+    try:
+        with open(snapshot_path, "r") as infile:
+            snapshot = json.load(infile)
+    except (OSError, ValueError):
+        return None
+
+    is_same_version = snapshot.get("version", None) == SNAPSHOT_VERSION
+    is_same_session = snapshot.get("niri_socket", None) == niri_socket_path and os.path.exists(niri_socket_path)
+    return snapshot if (is_same_version and is_same_session) else None
+
+
+def is_snapshot_fresh(snapshot: dict, max_age_sec: float = SNAPSHOT_MAX_AGE_SEC) -> bool:
+    """
+    Check if a snapshot is still being kept up-to-date with the event stream. This requires the
+    writer to be connected to niri and to have re-saved the snapshot recently (see: SNAPSHOT_HEARTBEAT_SEC),
+    otherwise it only holds the state from when the writer exited, stalled or lost its connection
+    """
+
+    age_sec = time() - snapshot.get("time", 0)
+    if not snapshot.get("is_connected", False) or not (0 <= age_sec < max_age_sec):
+        return False
+
+    try:
+        os.kill(snapshot["writer_pid"], 0)
+    except PermissionError:
+        # Process exists, but belongs to someone else (e.g. pid was re-used)
+        return False
+    except (OSError, KeyError, TypeError):
+        return False
+    return True
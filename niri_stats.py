@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for recording timing info (e.g. time spent decoding events or waiting on actions)
+using small fixed-size histograms, so that memory use stays bounded no matter how long a script runs.
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+from time import time
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class LatencyHistogram:
+    """
+    Histogram of timings, using power-of-2 microsecond bins (i.e. bin 'k' holds timings up to 2^k us).
+    This gives a fixed number of bins, with enough resolution to tell apart fast & slow cases
+    """
+
+    NUM_BINS = 40
+
+    def __init__(self):
+        self.bin_counts = [0] * self.NUM_BINS
+        self.count = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+
+    def add(self, time_sec: float):
+        bin_idx = min(int(time_sec * 1_000_000).bit_length(), self.NUM_BINS - 1)
+        self.bin_counts[bin_idx] += 1
+        self.count += 1
+        self.total_sec += time_sec
+        if time_sec > self.max_sec:
+            self.max_sec = time_sec
+        return
+
+    def get_percentile_ms(self, percentile: float) -> float:
+        """Get (upper bound) estimate of a percentile (0 to 100), in milliseconds"""
+        target_count = self.count * percentile / 100
+        running_count = 0
+        for bin_idx, bin_count in enumerate(self.bin_counts):
+            running_count += bin_count
+            if running_count >= target_count and running_count > 0:
+                return round(min(2**bin_idx / 1000, 1000 * self.max_sec), 4)
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(1000 * self.total_sec / max(self.count, 1), 4),
+            "p50_ms": self.get_percentile_ms(50),
+            "p90_ms": self.get_percentile_ms(90),
+            "p99_ms": self.get_percentile_ms(99),
+            "max_ms": round(1000 * self.max_sec, 4),
+            "bins_us": {2**idx: num for idx, num in enumerate(self.bin_counts) if num > 0},
+        }
+
+
+class LatencyStats:
+    """
+    Helper used to keep separate timing histograms for different stages of processing,
+    for example: record("decode", "WindowOpenedOrChanged", 0.0001)
+    """
+
+    def __init__(self):
+        self.histograms: dict[tuple[str, str], LatencyHistogram] = {}
+        self.start_time = time()
+
+    def record(self, stage: str, name: str, time_sec: float):
+        hist = self.histograms.get((stage, name), None)
+        if hist is None:
+            hist = LatencyHistogram()
+            self.histograms[(stage, name)] = hist
+        hist.add(time_sec)
+        return
+
+    def to_dict(self) -> dict:
+        """Get all stats as a (json-friendly) dictionary, like: {stage: {name: {...stats...}}}"""
+        stats_dict = {}
+        for (stage, name), hist in sorted(self.histograms.items()):
+            stats_dict.setdefault(stage, {})[name] = hist.to_dict()
+        return stats_dict
+
+    def make_table_str(self) -> str:
+        """Get all stats formatted as a table of text, for printing"""
+
+        rows_list = [
+            f"Timing stats (over {time() - self.start_time:.0f} sec)",
+            f"{'Stage':<8} {'Name':<36} {'Count':>8} {'Mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'Max':>9}  (ms)",
+        ]
+        for (stage, name), hist in sorted(self.histograms.items()):
+            info = hist.to_dict()
+            rows_list.append(
+                " ".join(
+                    [
+                        f"{stage:<8}",
+                        f"{name:<36}",
+                        f"{info['count']:>8}",
+                        *(f"{info[key]:>9.3f}" for key in ("mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")),
+                    ]
+                )
+            )
+
+        return "\n".join(rows_list)
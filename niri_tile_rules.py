@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared helpers for per-workspace/per-application tiling rules, used by niri_tile_to_n.py.
+Rules are loaded from a json config file, for example:
+    {
+        "rules": [
+            {"workspace_name": "^chat$", "n": 2},
+            {"output": "HDMI-A-1", "layout": "columns"},
+            {"app_id": "^firefox$", "maximize_solo": false}
+        ]
+    }
+Each rule has (optional) match patterns (regex) for the workspace name, output name & app_id,
+along with the tiling settings to use when all of its patterns match. Rules are applied in
+order, so later rules override earlier ones. Settings that aren't set by any matching rule
+use the script defaults (e.g. from command line flags).
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Imports
+
+import os
+import re
+import json
+from dataclasses import dataclass, fields, replace
+
+from niri_state import WorkspaceInfo
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Globals
+
+# Ways of arranging windows, while there are no more than 'N' windows on a workspace
+# -> master_stack: first window gets its own column, all others are stacked into a second column
+# -> stack: all windows are stacked into a single column
+# -> columns: every window gets its own column (i.e. the normal niri behavior)
+LAYOUT_NAMES = ("master_stack", "stack", "columns")
+
+# Keys used to match rules to windows (anything else in a rule is a setting)
+MATCH_KEYS = ("workspace_name", "output", "app_id")
+
+# Upper limit on stored settings lookups, so that the lookup table can't grow forever in long-running scripts
+MAX_CACHED_SETTINGS = 1024
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Data types
+
+
+@dataclass(frozen=True)
+class TileSettings:
+    """Tiling settings that apply to a single workspace/application combination"""
+
+    n: int = 3
+    maximize_solo: bool = True
+    maximize_solo_on_close: bool = True
+    collapse_solo_on_open: bool = True
+    apply_on_move: bool = False
+    layout: str = "master_stack"
+
+
+# Expected type of each setting, used to check config files
+_SETTING_TYPES_LUT = {field.name: field.type for field in fields(TileSettings)}
+
+
+class TileRule:
+    """A single (pre-compiled) rule, made of match patterns & the settings it overrides"""
+
+    __slots__ = ("workspace_name", "output", "app_id", "overrides")
+
+    def __init__(self, rule_dict: dict):
+
+        unknown_keys = set(rule_dict.keys()).difference(MATCH_KEYS, _SETTING_TYPES_LUT.keys())
+        if len(unknown_keys) > 0:
+            raise ValueError(f"Unknown rule keys: {', '.join(sorted(unknown_keys))}")
+
+        # Compile match patterns once up front, so matching is cheap
+        self.workspace_name = _compile_pattern(rule_dict, "workspace_name")
+        self.output = _compile_pattern(rule_dict, "output")
+        self.app_id = _compile_pattern(rule_dict, "app_id")
+
+        self.overrides = {k: v for k, v in rule_dict.items() if k in _SETTING_TYPES_LUT}
+        for key, value in self.overrides.items():
+            expected_type = _SETTING_TYPES_LUT[key]
+            if type(value) is not expected_type:
+                raise ValueError(f"Bad rule setting ({key}: {value!r}), expecting {expected_type.__name__}")
+        layout_name = self.overrides.get("layout", LAYOUT_NAMES[0])
+        if layout_name not in LAYOUT_NAMES:
+            raise ValueError(f"Unknown layout: {layout_name} (expecting one of: {', '.join(LAYOUT_NAMES)})")
+
+    def matches(self, workspace: WorkspaceInfo | None, app_id: str | None) -> bool:
+        """Check if the rule applies to a window on the given workspace with the given app_id"""
+        ws_name = workspace.name if workspace is not None else None
+        ws_output = workspace.output if workspace is not None else None
+        return (
+            _is_pattern_match(self.workspace_name, ws_name)
+            and _is_pattern_match(self.output, ws_output)
+            and _is_pattern_match(self.app_id, app_id)
+        )
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Classes
+
+
+class TileRules:
+    """
+    Helper used to look up the tiling settings for a window, based on a list of rules.
+    Rules are only evaluated the first time a workspace/app_id combination is seen, after
+    which the resulting settings are stored in a lookup table, so that lookups on every
+    event don't depend on the number of rules. The lookup table is keyed by workspace
+    id & app_id, along with the workspace name/output, so that renamed or moved workspaces
+    are handled without needing to be told about them. Entries for workspaces that no longer
+    exist are only dropped when the table is cleared (see: clear_cache), which also happens
+    automatically if the table gets too big
+    """
+
+    def __init__(self, default_settings: TileSettings, config_path: str | None = None):
+        self.default_settings = default_settings
+        self.config_path = config_path
+        self._rules: list[TileRule] = []
+        self._config_mtime = None
+        self._settings_lut: dict[tuple, TileSettings] = {}
+
+    def get_settings(self, workspace: WorkspaceInfo | None, app_id: str | None) -> TileSettings:
+        """Get the settings for a window on the given workspace, with the given app_id"""
+
+        if workspace is None:
+            lut_key = (None, None, None, app_id)
+        else:
+            lut_key = (workspace.id, workspace.name, workspace.output, app_id)
+        settings = self._settings_lut.get(lut_key, None)
+        if settings is None:
+            settings = self._evaluate_rules(workspace, app_id)
+            if len(self._settings_lut) >= MAX_CACHED_SETTINGS:
+                self.clear_cache()
+            self._settings_lut[lut_key] = settings
+
+        return settings
+
+    def reload(self) -> bool:
+        """
+        Re-load rules from the config file. If the config can't be loaded, the existing rules are kept
+        and an error is raised (OSError or ValueError). Returns True if the rules were re-loaded
+        """
+
+        if self.config_path is None:
+            return False
+
+        self._config_mtime = os.stat(self.config_path).st_mtime_ns
+        with open(self.config_path, "r") as infile:
+            config_dict = json.load(infile)
+
+        rules_list = config_dict.get("rules", None) if isinstance(config_dict, dict) else None
+        if not isinstance(rules_list, list):
+            raise ValueError("Config must hold a list of rules, like: {'rules': [...]}")
+        new_rules = [TileRule(rule_dict) for rule_dict in rules_list]
+
+        self._rules = new_rules
+        self.clear_cache()
+        return True
+
+    def clear_cache(self) -> None:
+        """Forget all stored settings lookups (e.g. after workspaces change), they'll be re-evaluated as needed"""
+        self._settings_lut.clear()
+        return
+
+    def reload_if_changed(self) -> bool:
+        """Re-load rules if the config file has been modified since it was last loaded (or last failed to load)"""
+
+        if self.config_path is None:
+            return False
+        try:
+            config_mtime = os.stat(self.config_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if config_mtime == self._config_mtime:
+            return False
+
+        # Only try loading each version of the file once, so that a broken config isn't re-loaded over & over
+        self._config_mtime = config_mtime
+        return self.reload()
+
+    def _evaluate_rules(self, workspace: WorkspaceInfo | None, app_id: str | None) -> TileSettings:
+        """Combine the settings of all matching rules (in order), on top of the defaults"""
+        overrides = {}
+        for rule in self._rules:
+            if rule.matches(workspace, app_id):
+                overrides.update(rule.overrides)
+        return replace(self.default_settings, **overrides) if len(overrides) > 0 else self.default_settings
+
+    def __len__(self):
+        return len(self._rules)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Functions
+
+
+def _compile_pattern(rule_dict: dict, key: str) -> re.Pattern | None:
+    """Helper used to compile a (regex) match pattern from a rule, if present"""
+    pattern_str = rule_dict.get(key, None)
+    if pattern_str is None:
+        return None
+    if not isinstance(pattern_str, str):
+        raise ValueError(f"Bad rule match ({key}: {pattern_str!r}), expecting a (regex) string")
+    try:
+        return re.compile(pattern_str)
+    except re.error as err:
+        raise ValueError(f"Bad rule match ({key}: {pattern_str!r}), {err}")
+
+
+def _is_pattern_match(pattern: re.Pattern | None, value: str | None) -> bool:
+    """Helper used to check a value against an (optional) pattern. A missing pattern matches everything"""
+    if pattern is None:
+        return True
+    return value is not None and pattern.search(value) is not None
@@ -5,14 +5,25 @@
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Imports
 
-import socket
-import json
 import os
+import json
+import queue
+import atexit
 import signal
+import asyncio
+import logging
 import argparse
-from dataclasses import dataclass
-from time import perf_counter, sleep
-from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from time import perf_counter, time
+
+from niri_ipc import NiriSocket, NiriRequests, connect_with_retry
+from niri_ipc_async import AsyncNiriRequests, AsyncNiriActions, reconnect_with_retry
+from niri_state import NiriState, EventDispatcher, StateChange, WindowInfo
+from niri_state import make_output_state_from_Outputs, get_state_snapshot_path, save_state_snapshot
+from niri_state import SNAPSHOT_HEARTBEAT_SEC
+from niri_stats import LatencyStats
+from niri_tile_rules import TileRules, TileSettings
+from niri_planner import ActionPlanner
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -20,13 +31,22 @@ from collections import deque
 
 # Set built-in defaults (helpful for debugging)
 default_N = 3
-default_delay_ms = 2500 if perf_counter() < 60 else 0
+default_quiet_ms = 500
+default_max_startup_ms = 5000
+default_connect_timeout_sec = 30
+default_output_refresh_sec = 5
+default_rules_check_sec = 2
+default_prediction_check_sec = 0.25
 default_maximize_solos = True
 default_maximize_solo_on_close = True
 default_collapse_solos_on_open = True
 default_apply_on_move = False
 default_debug_names = False
 default_debug_data = False
+default_log_file_mb = 5
+default_stats_period_sec = 60
+default_save_snapshot = True
+default_snapshot_delay_ms = 50
 
 # Define script arguments
 parser = argparse.ArgumentParser(
@@ -38,11 +58,18 @@ parser.add_argument(
     type=int,
     help=f"Number of windows handled with auto-tiling (default {default_N})",
 )
+parser.add_argument(
+    "-q",
+    "--quiet",
+    default=default_quiet_ms,
+    type=int,
+    help=f"On startup, wait for this many milliseconds without niri events before tiling (default: {default_quiet_ms})",
+)
 parser.add_argument(
     "-delay",
-    default=default_delay_ms,
+    default=0,
     type=int,
-    help=f"Number of milliseconds to delay before listening to niri IPC (default: {default_delay_ms})",
+    help="Extra (fixed) number of milliseconds to wait on startup before tiling (default: 0)",
 )
 parser.add_argument(
     "-x",
@@ -64,323 +91,620 @@ parser.add_argument(
     action="store_false" if default_apply_on_move else "store_true",
     help=f"Apply tiling logic to windows that are moved into other workspaces (default: {default_apply_on_move})",
 )
+parser.add_argument(
+    "-r",
+    "--rules",
+    default=None,
+    type=str,
+    help="Path to a (json) config file of per-workspace/app tiling rules, reloaded when changed (see README)",
+)
 parser.add_argument(
     "-dn",
     action="store_false" if default_debug_names else "store_true",
-    help="Enable event name printing, for debugging",
+    help="Enable event name logging, for debugging",
 )
 parser.add_argument(
     "-dd",
     action="store_false" if default_debug_data else "store_true",
-    help="Enable event data printing, for debugging",
+    help="Enable event data logging, for debugging",
+)
+parser.add_argument(
+    "-de",
+    "--debug_events",
+    default=None,
+    type=str,
+    help="Comma separated event names to log when debugging, e.g. WindowClosed,WindowFocusChanged (default: all)",
+)
+parser.add_argument(
+    "-lf",
+    "--log_file",
+    default=None,
+    type=str,
+    help=f"Path to a log file (rotated every {default_log_file_mb}MB), otherwise logs are printed to the terminal",
+)
+parser.add_argument(
+    "-sl",
+    "--stats_log",
+    default=None,
+    type=str,
+    help="Path to a file for periodically saving timing stats as json lines (stats can also be printed with SIGUSR1)",
+)
+parser.add_argument(
+    "-sp",
+    "--stats_period",
+    default=default_stats_period_sec,
+    type=float,
+    help=f"Number of seconds between saving timing stats, when using a stats log (default: {default_stats_period_sec})",
+)
+parser.add_argument(
+    "-ss",
+    action="store_false" if default_save_snapshot else "store_true",
+    help=f"Save niri state to disk, so other scripts can skip querying niri (default: {default_save_snapshot})",
 )
 
 # Get script configs
 args, _ = parser.parse_known_args()
 TILE_TO_N = args.n
+STARTUP_QUIET_MS = args.quiet
 STARTUP_DELAY_MS = args.delay
 MAXIMIZE_SOLOS = args.x
 MAXIMIZE_SOLOS_ON_CLOSE = args.xc
 COLLAPSE_SOLOS_ON_OPEN = args.c
 APPLY_TO_MOVED_WINDOWS = args.m
-ENABLE_EVENT_NAME_DEBUG_PRINT = args.dn
-ENABLE_EVENT_DATA_DEBUG_PRINT = args.dd
+RULES_CONFIG_PATH = args.rules
+ENABLE_EVENT_NAME_DEBUG_LOG = args.dn
+ENABLE_EVENT_DATA_DEBUG_LOG = args.dd
+DEBUG_EVENT_NAMES = frozenset(args.debug_events.split(",")) if args.debug_events is not None else None
+LOG_FILE_PATH = args.log_file
+SAVE_SNAPSHOT = args.ss
+STATS_LOG_PATH = args.stats_log
+STATS_PERIOD_SEC = args.stats_period
 
 
 # ---------------------------------------------------------------------------------------------------------------------
-# %% Data types
+# %% Classes
 
 
-@dataclass
-class TimeKeeper:
-    t1: int = 0
-    t2: int = 0
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler which leaves all message formatting to the background (listener) thread.
+    The regular QueueHandler formats messages before queuing them, which would mean
+    converting large event data to strings on the event handling thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StartupTracker:
+    """
+    Helper used to decide when tiling should start. Niri sends the full workspace & window state
+    as soon as the event stream starts, but when starting along with niri, there can be a burst
+    of other events (e.g. startup applications opening). Tiling is held off until the initial
+    state has arrived and the event stream has gone quiet, so that we only start acting once
+    things have settled (rather than guessing at a fixed delay)
+    """
 
-    def get_time_elapsed_ms(self) -> int:
-        """Reports the time (in ms) since the last time this function was called"""
-        self.t1 = self.t2
-        self.t2 = round(perf_counter() * 1000)
-        delta_ms = self.t2 - self.t1
-        return delta_ms
+    INITIAL_EVENT_NAMES = frozenset({"WorkspacesChanged", "WindowsChanged"})
+
+    def __init__(self, quiet_ms: int, min_wait_ms: int = 0, max_wait_ms: int = default_max_startup_ms):
+        self.quiet_sec = quiet_ms / 1000
+        self.min_wait_sec = min_wait_ms / 1000
+        self.max_wait_sec = max(max_wait_ms, min_wait_ms) / 1000
+        self.is_ready = asyncio.Event()
+        self._missing_event_names = set(self.INITIAL_EVENT_NAMES)
+        self._t_start = perf_counter()
+        self._t_last_event = self._t_start
+
+    def on_event(self, event_name: str):
+        """Record the arrival of an event (should be called for every event during startup)"""
+        self._t_last_event = perf_counter()
+        self._missing_event_names.discard(event_name)
+        if len(self._missing_event_names) == 0:
+            self.is_ready.set()
+        return
 
+    async def wait_until_settled(self) -> float:
+        """Wait for initial state & a quiet period without events. Returns the time taken (in seconds)"""
 
-@dataclass
-class FocusState:
-    workspace_id: int = None
-    window_id: int = None
+        await self.is_ready.wait()
+        while True:
+            t_now = perf_counter()
+            time_waited_sec = t_now - self._t_start
+            if time_waited_sec >= self.max_wait_sec:
+                break
+            remaining_sec = max(self.quiet_sec - (t_now - self._t_last_event), self.min_wait_sec - time_waited_sec)
+            if remaining_sec <= 0:
+                break
+            await asyncio.sleep(remaining_sec)
 
-    def copy_inplace(self, other_focus_state):
-        """Overwrite current data with data from another object (avoids creating new instances)"""
-        self.workspace_id = other_focus_state.workspace_id
-        self.window_id = other_focus_state.window_id
-        return self
+        return perf_counter() - self._t_start
 
 
 # ---------------------------------------------------------------------------------------------------------------------
-# %% Classes
+# %% Functions
 
 
-class NiriSocket:
-    """Helper used to read & write json messages to a niri socket connection"""
+def setup_logging(log_file_path: str | None, log_level: int) -> QueueListener:
+    """
+    Helper used to set up logging, so that log messages are written out on a separate thread,
+    either to a (rotating) log file or to the terminal. Returns the background log listener
+    """
 
-    def __init__(self, socket_path: str, buffer_size: int = 4096):
+    if log_file_path is not None:
+        output_handler = RotatingFileHandler(log_file_path, maxBytes=default_log_file_mb * 1_000_000, backupCount=2)
+    else:
+        output_handler = logging.StreamHandler()
+    output_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
 
-        # Sanity check
-        is_bad_path = socket_path is None or str(socket_path) == ""
-        assert not is_bad_path, "Cannot connect to niri, no socket path given..."
+    # Messages from the shared modules (e.g. unknown events) go to the same place as the script messages
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    for logger_name in ("niri_tile_to_n", "niri_ipc", "niri_ipc_async", "niri_state"):
+        module_logger = logging.getLogger(logger_name)
+        module_logger.addHandler(queue_handler)
+        module_logger.setLevel(log_level)
+        module_logger.propagate = False
 
-        self._skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self._skt.connect(skt_path)
-        self._bufsize = buffer_size
+    log_listener = QueueListener(log_queue, output_handler)
+    log_listener.start()
+    return log_listener
 
-        # Storage for
-        self._msg_queue = deque([])
-        self._inprog_str = None
 
-    def _read_next(self):
+def send_actions(action_list: list[tuple[str, dict]], predicted_ids: set[int]) -> None:
+    """
+    Helper used to send a batch of actions to niri, without waiting for a response.
+    This way, events keep being read while niri handles the actions. Errors are logged once responses arrive,
+    and the predictions made along with the batch are rolled back (see: handle_action_error)
+    """
 
-        # Read from existing (buffered) messages, if any
-        if len(self._msg_queue) > 0:
-            next_msg = self._msg_queue.popleft()
-            return json.loads(next_msg)
+    for (action_name, _), resp_future in zip(action_list, niri_action.submit_batch(action_list)):
+        resp_future.add_done_callback(lambda future, name=action_name: handle_action_error(name, future, predicted_ids))
 
-        while True:
-            # Listen for raw (binary) string data from socket
-            # -> Will return 0 bytes if connection closes
-            resp_binstr = self._skt.recv(self._bufsize)
-            if len(resp_binstr) == 0:
-                print("DEBUG - READNEXT: No data received!")
-                return {}
-
-            # If we have an in-progress result, append the new data to it
-            resp_str = resp_binstr.decode("utf-8")
-            if self._inprog_str is not None:
-                resp_str = "".join((self._inprog_str, resp_str))
-                self._inprog_str = None
-
-            # Stop listening if got at least 1 message
-            # - Expect response to look like: "message 1\nmessage 2\nmessage 3\n"
-            # - If incomplete, we'll see something not ending with '\n': "message 1\nmessa"
-            msg_list = resp_str.split("\n")
-            last_msg_piece = msg_list.pop()
-            contains_incomplete_message = len(last_msg_piece) > 0
-            self._inprog_str = last_msg_piece if contains_incomplete_message else None
-            if len(msg_list) > 0:
-                break
+    return
 
-        # Sanity check, make sure we read something
-        if len(msg_list) == 0:
-            raise IOError("Error reading next message (empty message list)!")
 
-        # If we have more than 1 message, return only the 'next one
-        # (future calls to this function will return the queued up messages)
-        out_msg_str = msg_list[0]
-        if len(msg_list) > 1:
-            self._msg_queue.extend(msg_list[1:])
+def handle_action_error(action_name: str, resp_future: asyncio.Future, predicted_ids: set[int]) -> None:
+    """
+    Callback used to report actions that fail. Since the state won't end up as predicted,
+    pending predictions for the windows affected by the batch of actions are rolled back
+    """
 
-        return json.loads(out_msg_str)
+    if resp_future.cancelled():
+        return
+    if resp_future.exception() is not None:
+        logger.error("Error with action (%s): %s", action_name, resp_future.exception())
+        niri_state.rollback_predictions(predicted_ids)
+        return
 
-    def _send_string(self, string: str):
-        """Helper used to send simple string messages (e.g. for requests)"""
-        return self._skt.sendall(f'"{string}"\n'.encode("utf-8"))
+    is_ok, resp = resp_future.result()
+    if not is_ok:
+        logger.error("Error with action (%s): %s", action_name, resp)
+        niri_state.rollback_predictions(predicted_ids)
 
-    def _send_json(self, json_data: dict):
-        """Helper used to send json message (e.g. for actions)"""
-        json_as_str = json.dumps(json_data, indent=None, separators=(",", ":"))
-        return self._skt.sendall(("".join([json_as_str, "\n"])).encode("utf-8"))
+    return
 
-    def close(self):
-        self._skt.close()
 
-    @staticmethod
-    def get_niri_socket_path():
-        return os.environ.get("NIRI_SOCKET")
+def send_planned_actions(niri_state: NiriState) -> None:
+    """
+    Helper used to send all actions planned while handling an event, as a single batch.
+    Focus is only moved where needed & restored once at the end (see: ActionPlanner)
+    """
+    send_actions(planner.plan(niri_state.focus.window_id), niri_state.pop_new_prediction_ids())
+    return
 
 
-class NiriRequests(NiriSocket):
+def maximize_window(niri_state: NiriState, target_window_id: int) -> bool:
     """
-    Helper used to make requests to niri
-    See: https://yalter.github.io/niri/niri_ipc/enum.Request.html
+    Helper used to maximize a window if it's not already maximized.
+    Returns True if the window needed maximization, false otherwise
     """
 
-    def get_version(self):
-        return self.request("Version")
+    solo_win_data = niri_state.windows[target_window_id]
+    need_maximization = not solo_win_data.is_maximized
+    if need_maximization:
+        planner.set_maximized(solo_win_data, True)
+        niri_state.predict(solo_win_data.id, is_maximized=True)
 
-    def request(self, message: str):
-        self._send_string(message)
+    return need_maximization
 
-        # Listen for ok/err response
-        resp_json = self._read_next()
-        is_ok_resp = "Ok" in resp_json.keys()
-        resp_data = resp_json["Ok" if is_ok_resp else "Err"]
-        return is_ok_resp, resp_data
 
-    def read_eventstream(self):
+def collapse_window(niri_state: NiriState, target_window_id: int) -> bool:
+    """
+    Helper used to collapse a maximized window.
+    Returns: True if window needed collapse, false otherwise
+    """
 
-        is_ok, evt_resp = self.request("EventStream")
-        if not is_ok:
-            print("DEBUG - EventStream response:", evt_resp, sep="\n")
-            raise IOError("Error requesting EventStream")
+    solo_win_data = niri_state.windows[target_window_id]
+    need_collapse = solo_win_data.is_maximized
+    if need_collapse:
+        planner.set_maximized(solo_win_data, False)
+        niri_state.predict(solo_win_data.id, is_maximized=False)
 
-        # Read events from stream, forever
-        while True:
-            event_json = self._read_next()
-            event_name = tuple(event_json.keys())[0]
-            event_data = event_json.get(event_name, None)
-            yield event_name, event_data
-        return
+    return need_collapse
 
 
-class NiriActions(NiriSocket):
+def get_settings(niri_state: NiriState, window: WindowInfo) -> TileSettings:
+    """Helper used to get the tiling settings (from rules) that apply to a window"""
+    return tile_rules.get_settings(niri_state.workspaces.get(window.workspace_id, None), window.app_id)
+
+
+def get_new_tiled_window(niri_state: NiriState, state_change: StateChange) -> tuple[WindowInfo | None, TileSettings]:
     """
-    Helper used to trigger actions through the niri IPC
-    See: https://yalter.github.io/niri/niri_ipc/enum.Action.html
+    Helper used to get the newly opened (or moved) window from a state change,
+    if it's a window that the tiling logic should apply to (None otherwise).
+    Returns: new_window, tiling_settings
     """
 
-    def action(self, message: str, **kwargs):
+    new_win = state_change.opened_window
+    if new_win is None:
+        new_win = state_change.moved_window
+        if new_win is None:
+            return None, tile_rules.default_settings
 
-        # Build action request
-        json_data = {"Action": {message: kwargs}}
-        self._send_json(json_data)
+    # Ignore newly created maximized or floating windows
+    # -> Assume opened maximized windows are done by user window rules (don't want to interfere)
+    # -> Tiling logic shouldn't apply to floating windows
+    settings = get_settings(niri_state, new_win)
+    is_ignored_move = new_win is state_change.moved_window and not settings.apply_on_move
+    if is_ignored_move or new_win.is_maximized or new_win.is_floating:
+        return None, settings
 
-        # Listen for ok/err response
-        resp_json = self._read_next()
-        is_ok_resp = "Err" not in resp_json.keys()
-        resp_data = resp_json if is_ok_resp else resp_json["Err"]
-        return is_ok_resp, resp_data
+    return new_win, settings
 
 
 # ---------------------------------------------------------------------------------------------------------------------
-# %% Functions
+# %% Event handlers
 
 
-def catch_sigterm(signum, frame):
-    """Turn SIGTERM events into exceptions for graceful shutdown"""
-    raise InterruptedError
+def on_close_maximize_solo(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """When closing windows, if only one (tiled) window remains on the workspace, maximize it"""
 
+    closed_win = state_change.closed_window
+    if closed_win is None:
+        return
 
-def make_workspace_state_from_WorkspacesChanged(event_data: dict) -> dict[int, dict]:
-    return {info_dict["id"]: info_dict for info_dict in event_data["workspaces"]}
+    curr_tile_ids = niri_state.get_tiled_window_ids(closed_win.workspace_id)
+    if len(curr_tile_ids) == 1:
+        solo_win = niri_state.windows[next(iter(curr_tile_ids))]
+        if get_settings(niri_state, solo_win).maximize_solo_on_close:
+            maximize_window(niri_state, solo_win.id)
 
+    return
 
-def make_window_state_from_WindowsChanged(event_data: dict, workspace_state, output_width_lut: dict) -> dict[int, dict]:
-    state = {}
-    for info_dict in event_data["windows"]:
-        win_id = info_dict["id"]
-        win_aug_data = get_additional_window_data(info_dict, workspace_state, output_width_lut)
-        info_dict.update(win_aug_data)
-        state[win_id] = info_dict
-    return state
 
+def on_open_maximize_solo(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """Maximize the first window opened on a workspace"""
 
-def get_windows_by_conditions(window_state: dict[int, dict], **conditions) -> dict[int, dict]:
-    """Function used to filter window state data according to key-value conditions"""
-    meets_conditions = lambda data: all(data[k] == v for k, v in conditions.items())
-    return {winid: windata for winid, windata in window_state.items() if meets_conditions(windata)}
+    new_win, settings = get_new_tiled_window(niri_state, state_change)
+    if new_win is None or not settings.maximize_solo:
+        return
 
+    curr_tile_ids = niri_state.get_tiled_window_ids(new_win.workspace_id)
+    if len(curr_tile_ids) == 1 and settings.n >= 1:
+        maximize_window(niri_state, new_win.id)
 
-def get_additional_window_data(
-    window_data: dict,
-    workspace_state: dict,
-    output_width_lut: dict,
-    max_width_threshold: float = 0.8,
-) -> dict:
-    """Helper used to generate addition windowing data (particularly 'is_maximized' flag)"""
-    # Set up augmentation data
-    win_pos = window_data["layout"]["pos_in_scrolling_layout"]
-    win_col, win_row = win_pos if win_pos is not None else (None, None)
-    augment_dict = {
-        "col_idx": win_col,
-        "row_idx": win_row,
-        "is_maximized": False,
-    }
+    return
 
-    # Try to figure out if window is maximized
-    win_wspace_id = window_data["workspace_id"]
-    win_output = workspace_state.get(win_wspace_id, {}).get("output", None)
-    output_width = output_width_lut.get(win_output, None)
-    if output_width is not None:
-        win_width = window_data["layout"]["window_size"][0]
-        augment_dict["is_maximized"] = (win_width / output_width) > max_width_threshold
 
-    return augment_dict
+def on_open_collapse_solo(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """Collapse a maximized solo window when a second window is opened on the same workspace"""
 
+    new_win, settings = get_new_tiled_window(niri_state, state_change)
+    if new_win is None or not settings.collapse_solo_on_open:
+        return
 
-def toggle_window_maximization(target_window_id: int, focused_window_id: int):
-    """Helper used to toggle the maximization state of a window, without messing with current focused window"""
+    curr_wspace_id = new_win.workspace_id
+    num_tile_wins = len(niri_state.get_tiled_window_ids(curr_wspace_id))
+    curr_max_ids = niri_state.get_maximized_window_ids(curr_wspace_id)
+    if num_tile_wins == 2 and len(curr_max_ids) == 1 and settings.n >= 2:
+        collapse_window(niri_state, next(iter(curr_max_ids)))
 
-    if target_window_id == focused_window_id:
-        niri_action.action("MaximizeColumn")
-    else:
-        niri_action.action("FocusWindow", id=target_window_id)
-        niri_action.action("MaximizeColumn")
-        niri_action.action("FocusWindow", id=focused_window_id)
+    return
+
+
+def on_open_consume_to_n(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """Stack new windows into the on-screen columns (based on the layout), as long as there are no more than 'N'"""
+
+    new_win, settings = get_new_tiled_window(niri_state, state_change)
+    if new_win is None:
+        return
+
+    # Don't bother trying to re-arrange/tile if we have too few/many windows or something is maximized
+    curr_wspace_id = new_win.workspace_id
+    num_tile_wins = len(niri_state.get_tiled_window_ids(curr_wspace_id))
+    num_max_wins = len(niri_state.get_maximized_window_ids(curr_wspace_id))
+    if num_max_wins == 0 and num_tile_wins <= settings.n:
+        consume_action = get_consume_action_funcs_lut[settings.layout](new_win, num_tile_wins)
+        if consume_action is not None:
+            planner.add_action(consume_action, id=new_win.id)
+            predict_consume(niri_state, new_win, consume_action)
 
     return
 
 
-def maximize_window(window_state: dict, focus_state: FocusState, target_window_id: int) -> bool:
+def predict_consume(niri_state: NiriState, new_win: WindowInfo, consume_action: str) -> None:
     """
-    Helper used to maximize a window if it's not already maximized.
-    This function assumes window state includes 'is_maximized' flag!
-    Returns True if the window needed maximization, false otherwise
+    Update the state to match the expected column layout after consuming a (new, solo) window
+    into a neighbouring column. The window's own column disappears, so all later columns shift left
     """
 
-    solo_win_data = window_state[target_window_id]
-    need_maximization = not solo_win_data["is_maximized"]
-    if need_maximization:
-        solo_id = solo_win_data["id"]
-        toggle_window_maximization(solo_id, focus_state.window_id)
-        win_state[solo_id]["is_maximized"] = True
+    prev_col_idx = new_win.col_idx
+    for win_id in niri_state.get_tiled_window_ids(new_win.workspace_id):
+        other_win = niri_state.windows[win_id]
+        if other_win.col_idx is not None and other_win.col_idx > prev_col_idx:
+            niri_state.predict(win_id, col_idx=other_win.col_idx - 1)
+    if consume_action == "ConsumeOrExpelWindowLeft":
+        niri_state.predict(new_win.id, col_idx=prev_col_idx - 1)
 
-    return need_maximization
+    return
+
+
+def get_master_stack_consume_action(new_win: WindowInfo, num_tile_wins: int) -> str | None:
+    """Pick the action needed to move a new window into the 'stack' column (the 2nd column)"""
+    if num_tile_wins <= 2:
+        return None
+    is_new_win_onscreen = new_win.col_idx == 2
+    return "ConsumeOrExpelWindowRight" if is_new_win_onscreen else "ConsumeOrExpelWindowLeft"
+
+
+def get_stack_consume_action(new_win: WindowInfo, num_tile_wins: int) -> str | None:
+    """Pick the action needed to move a new window into the (single) stacked column"""
+    if num_tile_wins <= 1:
+        return None
+    return "ConsumeOrExpelWindowLeft" if new_win.col_idx > 1 else "ConsumeOrExpelWindowRight"
+
+
+# Functions used to pick the action needed to arrange a new window, for each layout
+get_consume_action_funcs_lut = {
+    "master_stack": get_master_stack_consume_action,
+    "stack": get_stack_consume_action,
+    "columns": lambda new_win, num_tile_wins: None,
+}
+
+
+def on_workspaces_changed_refresh_outputs(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """Ask for updated output info, since workspace changes can come from monitors being (un)plugged"""
+    is_outputs_refresh_needed.set()
+    return
+
+
+def on_workspaces_changed_clear_rules_cache(niri_state: NiriState, state_change: StateChange, event_data: dict) -> None:
+    """Drop stored per-workspace tiling settings, so that settings for removed workspaces don't pile up"""
+    tile_rules.clear_cache()
+    return
+
+
+def log_stats():
+    """Log timing stats (e.g. in response to SIGUSR1)"""
+    logger.info("%s", stats.make_table_str())
+    logger.info("Actions sent: %d, saved by planning: %d", planner.num_actions_sent, planner.num_actions_saved)
+    logger.info(
+        "Predicted changes confirmed: %d, rolled back: %d",
+        niri_state.num_predictions_confirmed,
+        niri_state.num_predictions_rolled_back,
+    )
+    return
+
+
+async def save_stats_forever(log_path: str, period_sec: float) -> None:
+    """Periodically append timing stats to a log file (one line of json each time)"""
+    while True:
+        await asyncio.sleep(period_sec)
+        with open(log_path, "a") as outfile:
+            actions_dict = {"sent": planner.num_actions_sent, "saved": planner.num_actions_saved}
+            stats_dict = {"time": round(time(), 3), "stats": stats.to_dict(), "actions": actions_dict}
+            outfile.write(json.dumps(stats_dict) + "\n")
+    return
 
 
-def collapse_window(window_state: dict, focus_state: FocusState, target_window_id: int) -> bool:
+async def save_snapshot_forever(snapshot_path: str, is_changed: asyncio.Event) -> None:
     """
-    Helperused to collapse a maximized window. This function assumes
-    that the window state includes 'is_maximized' flag!
-    Returns: True if window needed collapse, false otherwise
+    Save a snapshot of the niri state whenever it changes. Saving waits for a short delay
+    after each change, so that bursts of events (e.g. during animations) lead to a single save.
+    The snapshot is also re-saved periodically, so readers can tell that it's still being kept up-to-date
     """
+    while True:
+        try:
+            await asyncio.wait_for(is_changed.wait(), SNAPSHOT_HEARTBEAT_SEC)
+            await asyncio.sleep(default_snapshot_delay_ms / 1000)
+        except asyncio.TimeoutError:
+            pass
+        is_changed.clear()
+        save_state_snapshot(niri_state, skt_path, snapshot_path, is_connected=is_niri_synced.is_set())
+    return
 
-    solo_win_data = window_state[target_window_id]
-    need_collapse = solo_win_data["is_maximized"]
-    if need_collapse:
-        solo_id = solo_win_data["id"]
-        toggle_window_maximization(solo_id, focus_state.window_id)
-        win_state[solo_id]["is_maximized"] = False
 
-    return need_collapse
+async def expire_predictions_forever(period_sec: float) -> None:
+    """
+    Periodically roll back predictions that niri never confirmed. Otherwise predictions for
+    actions that had no effect (so niri sent no events) would be kept in the state indefinitely
+    """
+    while True:
+        await asyncio.sleep(period_sec)
+        num_expired = niri_state.expire_predictions()
+        if num_expired > 0:
+            logger.debug("Rolled back %d unconfirmed predictions", num_expired)
+    return
+
+
+async def refresh_outputs_forever(period_sec: float) -> None:
+    """
+    Keep output (monitor) info up-to-date, since niri doesn't have events for output changes.
+    Outputs are re-requested after workspace changes and otherwise periodically, as a fallback.
+    Requests are sent on the action connection, so they don't hold up event handling
+    """
+
+    while True:
+        try:
+            await asyncio.wait_for(is_outputs_refresh_needed.wait(), period_sec)
+        except asyncio.TimeoutError:
+            pass
+        is_outputs_refresh_needed.clear()
+
+        try:
+            is_ok, outputs_data = await niri_action.submit_request("Outputs")
+        except OSError:
+            # Lost connection, the main listening loop handles re-connecting
+            continue
+
+        if is_ok:
+            changed_names = niri_state.set_outputs(make_output_state_from_Outputs(outputs_data))
+            if len(changed_names) > 0:
+                logger.info("Output changes: %s", ", ".join(sorted(changed_names)))
+
+    return
+
+
+def reload_rules() -> None:
+    """Re-load tiling rules from the config file (e.g. on SIGHUP), keeping the existing rules on errors"""
+    try:
+        if tile_rules.reload():
+            logger.info("Loaded %d tiling rules from: %s", len(tile_rules), tile_rules.config_path)
+    except (OSError, ValueError) as err:
+        logger.error("Error loading tiling rules (keeping existing rules): %s", err)
+    return
+
+
+async def reload_rules_forever(period_sec: float) -> None:
+    """Periodically check if the rules config file has changed, and re-load it if so"""
+    while True:
+        await asyncio.sleep(period_sec)
+        try:
+            if tile_rules.reload_if_changed():
+                logger.info("Re-loaded %d tiling rules from: %s", len(tile_rules), tile_rules.config_path)
+        except (OSError, ValueError) as err:
+            logger.error("Error re-loading tiling rules (keeping existing rules): %s", err)
+    return
+
+
+async def enable_tiling_when_settled(startup: StartupTracker) -> None:
+    """Switch on tiling behaviors, once niri has settled after startup"""
+    time_taken_sec = await startup.wait_until_settled()
+    dispatcher.is_handling_enabled = True
+    logger.debug("Tiling enabled, %.0f ms after startup", 1000 * time_taken_sec)
+    return
+
+
+async def reconnect_to_niri() -> None:
+    """
+    Re-connect both the event stream & action sockets, with backoff if niri isn't available.
+    Also refreshes output (monitor) info, since this isn't part of the event stream
+    """
+
+    await reconnect_with_retry(niri_events, default_connect_timeout_sec)
+    await reconnect_with_retry(niri_action, default_connect_timeout_sec)
+    is_outputs_ok, outputs_resp = await niri_events.request("Outputs")
+    if is_outputs_ok:
+        niri_state.set_outputs(make_output_state_from_Outputs(outputs_resp["Outputs"]))
+    logger.info("Reconnected to niri")
+
+    return
+
+
+async def listen_forever(listen_event_names: set[str] | None) -> None:
+    """
+    Main listening loop. Reads events & runs all tiling behaviors. Since actions are
+    sent without waiting on niri, events continue to be read while actions are handled.
+    On startup, events only update the state until niri has settled (see: StartupTracker)
+    """
+
+    # Cancel listening on SIGTERM, for graceful shutdown. Print timing stats on SIGUSR1
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    loop.add_signal_handler(signal.SIGUSR1, log_stats)
+    loop.add_signal_handler(signal.SIGHUP, reload_rules)
+    stats_task, snapshot_task = None, None
+    if STATS_LOG_PATH is not None:
+        stats_task = asyncio.create_task(save_stats_forever(STATS_LOG_PATH, STATS_PERIOD_SEC))
+    is_state_changed = asyncio.Event()
+    snapshot_path = get_state_snapshot_path()
+    if SAVE_SNAPSHOT and snapshot_path is None:
+        logger.warning("No runtime folder (from env: XDG_RUNTIME_DIR), state snapshots won't be saved")
+    elif SAVE_SNAPSHOT:
+        snapshot_task = asyncio.create_task(save_snapshot_forever(snapshot_path, is_state_changed))
+
+    outputs_task = asyncio.create_task(refresh_outputs_forever(default_output_refresh_sec))
+    predictions_task = asyncio.create_task(expire_predictions_forever(default_prediction_check_sec))
+    rules_task = None
+    if RULES_CONFIG_PATH is not None:
+        rules_task = asyncio.create_task(reload_rules_forever(default_rules_check_sec))
+
+    # Hold off on tiling until niri has settled
+    startup = StartupTracker(STARTUP_QUIET_MS, STARTUP_DELAY_MS)
+    dispatcher.is_handling_enabled = False
+    startup_task = asyncio.create_task(enable_tiling_when_settled(startup))
+
+    await niri_events.start()
+    await niri_action.start()
+    try:
+        while True:
+            try:
+                async for evt_name, evt_data in niri_events.read_eventstream(listen_event_names):
+
+                    # Log events for debugging (data is only formatted on the logging thread)
+                    if is_debug_logging and (DEBUG_EVENT_NAMES is None or evt_name in DEBUG_EVENT_NAMES):
+                        if ENABLE_EVENT_DATA_DEBUG_LOG:
+                            logger.debug("%s: %s", evt_name, evt_data)
+                        else:
+                            logger.debug("%s", evt_name)
+
+                    # Update state & run all tiling behaviors
+                    if not dispatcher.is_handling_enabled:
+                        startup.on_event(evt_name)
+                    dispatcher.dispatch(evt_name, evt_data)
+                    if planner.has_changes():
+                        send_planned_actions(niri_state)
+                    if evt_name == "WindowsChanged":
+                        is_niri_synced.set()
+                    is_state_changed.set()
+
+            except OSError as err:
+                # Lost connection to niri (e.g. on a hiccup or reload), so try to re-connect
+                # -> The new event stream begins with the full window/workspace state, which re-syncs our state
+                # -> Until then, the saved snapshot is marked as out-of-date, so other scripts don't use it
+                logger.warning("Lost connection to niri (%s), reconnecting...", err)
+                is_niri_synced.clear()
+                is_state_changed.set()
+                await reconnect_to_niri()
+
+    finally:
+        for task in (stats_task, snapshot_task, startup_task, outputs_task, predictions_task, rules_task):
+            if task is not None:
+                task.cancel()
+        niri_action.close()
+        niri_events.close()
+
+    return
 
 
 # ---------------------------------------------------------------------------------------------------------------------
 # %% Setup
 
-# Handle startup delay (prevent listening to niri during potentially busy startup)
-if STARTUP_DELAY_MS > 0:
-    sleep(STARTUP_DELAY_MS / 1000)
+# Set up logging, which is handled on a background thread
+is_debug_logging = ENABLE_EVENT_NAME_DEBUG_LOG or ENABLE_EVENT_DATA_DEBUG_LOG
+logger = logging.getLogger("niri_tile_to_n")
+log_listener = setup_logging(LOG_FILE_PATH, logging.DEBUG if is_debug_logging else logging.INFO)
+atexit.register(log_listener.stop)
 
 # Get niri socket from env
 skt_path = NiriSocket.get_niri_socket_path()
 if skt_path is None or skt_path == "":
-    print("Couldn't find niri socket! (from env: NIRI_SOCKET)")
+    logger.error("Couldn't find niri socket! (from env: NIRI_SOCKET)")
     quit()
 
 # Create separate read/write sockets, since eventstream reader cannot issue actions
-niri_reader = NiriRequests(skt_path)
-niri_action = NiriActions(skt_path)
+# -> Connect right away, but keep retrying in case niri is still starting up
+niri_reader = connect_with_retry(NiriRequests, skt_path, default_connect_timeout_sec)
+niri_events = AsyncNiriRequests(skt_path)
+niri_action = AsyncNiriActions(skt_path)
 
 # Sanity check. Make sure we have the right version
 is_version_ok, version_resp = niri_reader.request("Version")
 expected_version, actual_version = "25.08 (af4b5f9)", version_resp.get("Version", "unknown")
 if actual_version != expected_version:
-    print(
-        "",
-        "WARNING - Unexpected niri version!",
-        f"expected: {expected_version}",
-        f"  actual: {actual_version}",
-        "Errors may occur...",
-        sep="\n",
+    logger.warning(
+        "Unexpected niri version! (expected: %s, actual: %s) Errors may occur...", expected_version, actual_version
     )
 
 
@@ -390,187 +714,57 @@ if actual_version != expected_version:
 # Get monitor into
 is_outputs_ok, outputs_resp = niri_reader.request("Outputs")
 if not is_outputs_ok:
-    print("Error requesting info about monitors", outputs_resp, sep="\n")
+    logger.error("Error requesting info about monitors: %s", outputs_resp)
     quit()
-output_full_info = {out_key: out_dict["logical"] for out_key, out_dict in outputs_resp["Outputs"].items()}
-output_width_lut = {out_key: out_info["width"] for out_key, out_info in output_full_info.items()}
+niri_reader.close()
 
 # Initialize state tracking
-prev_focus_state = FocusState()
-focus_state = FocusState()
-timekeeper = TimeKeeper()
-win_state = None
-wspace_state = None
+niri_state = NiriState(make_output_state_from_Outputs(outputs_resp["Outputs"]))
+
+# Record timing of each stage of event handling (decoding, state updates, tiling behaviors & actions)
+stats = LatencyStats()
+niri_events.stats = stats
+niri_action.stats = stats
+
+# Set up tiling settings, with (optional) per-workspace/app rules on top of the script flags
+default_settings = TileSettings(
+    n=TILE_TO_N,
+    maximize_solo=MAXIMIZE_SOLOS,
+    maximize_solo_on_close=MAXIMIZE_SOLOS_ON_CLOSE,
+    collapse_solo_on_open=COLLAPSE_SOLOS_ON_OPEN,
+    apply_on_move=APPLY_TO_MOVED_WINDOWS,
+)
+tile_rules = TileRules(default_settings, RULES_CONFIG_PATH)
+reload_rules()
+
+# Set up tiling behaviors, which run in response to events
+# -> Behaviors only plan actions, which are sent together once an event has been fully handled
+planner = ActionPlanner()
+dispatcher = EventDispatcher(niri_state)
+dispatcher.subscribe("WindowClosed", on_close_maximize_solo)
+dispatcher.subscribe("WindowOpenedOrChanged", on_open_maximize_solo)
+dispatcher.subscribe("WindowOpenedOrChanged", on_open_collapse_solo)
+dispatcher.subscribe("WindowOpenedOrChanged", on_open_consume_to_n)
+dispatcher.subscribe("WorkspacesChanged", on_workspaces_changed_refresh_outputs)
+dispatcher.subscribe("WorkspacesChanged", on_workspaces_changed_clear_rules_cache)
+is_outputs_refresh_needed = asyncio.Event()
+is_niri_synced = asyncio.Event()
+dispatcher.stats = stats
+
+# Only decode events that we need, unless we're logging events for debugging
+listen_event_names = dispatcher.get_event_names()
+if is_debug_logging:
+    listen_event_names = None if DEBUG_EVENT_NAMES is None else listen_event_names.union(DEBUG_EVENT_NAMES)
 
 # Main listening loop
-signal.signal(signal.SIGTERM, catch_sigterm)
 try:
-    init_time = timekeeper.get_time_elapsed_ms()
-    for evt_name, evt_data in niri_reader.read_eventstream():
-
-        # For debugging printouts, add spaces between events that don't occur together
-        time_elapsed_ms = timekeeper.get_time_elapsed_ms()
-        if ENABLE_EVENT_NAME_DEBUG_PRINT or ENABLE_EVENT_DATA_DEBUG_PRINT:
-            if time_elapsed_ms > 250:
-                print("", f"Time elapsed (sec): {(timekeeper.t2 - init_time) // 1000}", sep="\n")
-            if ENABLE_EVENT_NAME_DEBUG_PRINT:
-                print(evt_name)
-            if ENABLE_EVENT_DATA_DEBUG_PRINT:
-                print(evt_data)
-
-        # Handle all IPC stream events
-        prev_focus_state.copy_inplace(focus_state)
-        closed_window_data, newest_window_data = None, None
-        if evt_name == "WorkspacesChanged":
-            # Replace existing workspace info
-            wspace_state = make_workspace_state_from_WorkspacesChanged(evt_data)
-            for item in wspace_state.values():
-                if item["is_focused"]:
-                    focus_state.workspace_id = item["id"]
-
-        elif evt_name == "WorkspaceUrgencyChanged":
-            # Update our existing workspace state
-            evt_wspace_id = evt_data["id"]
-            wspace_state[evt_wspace_id]["is_urgent"] = evt_data["urgent"]
-
-        elif evt_name == "WorkspaceActivated":
-            # Record new focused workspace (ignore 'active' state, we don't use it)
-            if evt_data["focused"]:
-                focus_state.workspace_id = evt_data["id"]
-                wspace_state[prev_focus_state.workspace_id]["is_focused"] = False
-            pass
-
-        elif evt_name == "WorkspaceActiveWindowChanged":
-            # Not using this...?
-            # print(
-            #     f"DEBUG EVENT - *{evt_name}*  |  Not using...?",
-            #     "  Data:",
-            #     f"    active_window_id: {evt_data['active_window_id']}",
-            #     f"        workspace_id: {evt_data['workspace_id']}",
-            #     sep="\n",
-            # )
-            pass
-
-        elif evt_name == "WindowsChanged":
-            # Replace existing window state
-            win_state = make_window_state_from_WindowsChanged(evt_data, wspace_state, output_width_lut)
-            for item in win_state.values():
-                if item["is_focused"]:
-                    focus_state.window_id = item["id"]
-
-        elif evt_name == "WindowOpenedOrChanged":
-            # Decide if we have a new/moved window
-            evt_win_id = evt_data["window"]["id"]
-            evt_win_wspace_id = evt_data["window"]["workspace_id"]
-            evt_is_new_window = evt_win_id not in win_state.keys()
-            evt_is_moved_window, prev_win_wspace_id = False, None
-            if not evt_is_new_window:
-                prev_win_wspace_id = win_state[evt_win_id]["workspace_id"]
-                evt_is_moved_window = prev_win_wspace_id != evt_win_wspace_id
-
-            # Update focus, if needed
-            if evt_data["window"]["is_focused"]:
-                focus_state.window_id = evt_win_id
-
-            # Replace existing window state for the target window
-            win_aug_data = get_additional_window_data(evt_data["window"], wspace_state, output_width_lut)
-            win_state[evt_win_id] = {**evt_data["window"], **win_aug_data}
-            need_check_rearrange = evt_is_new_window or (evt_is_moved_window and APPLY_TO_MOVED_WINDOWS)
-            newest_window_data = win_state[evt_win_id] if need_check_rearrange else None
-
-        elif evt_name == "WindowClosed":
-            # Delete closed window state data & remove from windows-per-workspace mapping
-            evt_win_id = evt_data["id"]
-            closed_window_data = win_state.pop(evt_win_id)
-
-        elif evt_name == "WindowFocusChanged":
-            # Update existing focus state
-            focus_state.window_id = evt_data["id"]
-
-        elif evt_name == "WindowUrgencyChanged":
-            # Update our existing window state
-            evt_win_id = evt_data["id"]
-            win_state[evt_win_id]["is_urgent"] = evt_data["urgent"]
-
-        elif evt_name == "WindowLayoutsChanged":
-            # Replace existing window layout data
-            for evt_win_id, evt_new_layout in evt_data["changes"]:
-                win_state[evt_win_id]["layout"] = evt_new_layout
-                win_aug_data = get_additional_window_data(win_state[evt_win_id], wspace_state, output_width_lut)
-                win_state[evt_win_id].update(win_aug_data)
-            pass
-
-        elif evt_name == "KeyboardLayoutsChanged":
-            # Not doing anything with keyboard...
-            pass
-
-        elif evt_name == "KeyboardLayoutSwitched":
-            # Not doing anything with keyboard...
-            pass
-
-        elif evt_name == "OverviewOpenedOrClosed":
-            # Not doing anything with overview...
-            evt_is_overview_open = evt_data["is_open"]
-
-        elif evt_name == "ConfigLoaded":
-            # Not doing anything with config...
-            pass
-
-        else:
-            print("Unknown event:", evt_name)
-
-        # Handle max-on-close
-        if closed_window_data is not None:
-            if MAXIMIZE_SOLOS_ON_CLOSE:
-                curr_wspace_id = closed_window_data["workspace_id"]
-                curr_wins = get_windows_by_conditions(win_state, workspace_id=curr_wspace_id, is_floating=False)
-                if len(curr_wins) == 1:
-                    solo_id = tuple(curr_wins.keys())[0]
-                    maximize_window(win_state, focus_state, solo_id)
-                pass
-
-        # Handle window-creation behaviors
-        if newest_window_data is not None:
-
-            # Ignore newly created maximized or floating windows
-            # -> Assume opened maximized windows are done by user window rules (don't want to interfere)
-            # -> Tiling logic shouldn't apply to floating windows
-            if newest_window_data["is_maximized"] or newest_window_data["is_floating"]:
-                continue
-
-            # Don't bother trying to re-arrange/tile if we already have more than 'N' windows
-            curr_wspace_id = newest_window_data["workspace_id"]
-            curr_tile_wins = get_windows_by_conditions(win_state, workspace_id=curr_wspace_id, is_floating=False)
-            num_tile_wins = len(curr_tile_wins)
-            if num_tile_wins == 0 or num_tile_wins > TILE_TO_N:
-                continue
-
-            # Auto-maximize solo windows, if needed
-            if MAXIMIZE_SOLOS and num_tile_wins == 1:
-                solo_id = tuple(curr_tile_wins.keys())[0]
-                maximize_window(win_state, focus_state, solo_id)
-
-            # Collapse maximized windows, if needed
-            curr_max_wins: dict = get_windows_by_conditions(curr_tile_wins, is_maximized=True)
-            num_max_wins = len(curr_max_wins)
-            if COLLAPSE_SOLOS_ON_OPEN and num_max_wins == 1 and num_tile_wins == 2:
-                solo_max_id = tuple(curr_max_wins.keys())[0]
-                collapse_window(win_state, focus_state, solo_max_id)
-                num_max_wins -= 1
-
-            # Apply tiling if needed
-            is_zero_max_windows = num_max_wins == 0
-            if is_zero_max_windows and (2 < num_tile_wins <= TILE_TO_N):
-                is_new_win_onscreen = newest_window_data["col_idx"] == 2
-                consume_action = "ConsumeOrExpelWindowRight" if is_new_win_onscreen else "ConsumeOrExpelWindowLeft"
-                niri_action.action(consume_action, id=newest_window_data["id"])
-
-            pass
+    asyncio.run(listen_forever(listen_event_names))
 
-except (KeyboardInterrupt, InterruptedError):
+except (KeyboardInterrupt, asyncio.CancelledError):
     pass
 
 finally:
-    niri_action.close()
-    niri_reader.close()
+    if is_debug_logging:
+        logger.debug("Merged layout events: %d", niri_events.num_coalesced_events)
+        log_stats()
     print("", f"({os.path.basename(__file__)}) - Closed niri IPC connection", sep="\n")
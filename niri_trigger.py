@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Minimal client used to trigger keybind scripts through the resident daemon (niri_daemon.py).
+Usage is the same as calling a script directly, but with a short script name in front, for example:
+    python3 niri_trigger.py spawnjump alacritty -p
+If the daemon isn't running, the corresponding script is run directly instead.
+Kept deliberately small (only standard library imports) so that it starts as quickly as possible.
+"""
+
+import os
+import sys
+import socket
+import json
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Shared settings
+
+# Short names used to refer to each of the scripts that can be run by the daemon
+SCRIPT_NAMES_LUT = {
+    "spawnjump": "niri_spawnjump.py",
+    "peekaboo": "niri_peekaboo.py",
+    "workspace": "niri_workspace_helper.py",
+}
+
+
+def get_daemon_socket_path() -> str:
+    """Get the path to the socket the daemon listens on (one per user session)"""
+    runtime_folder = os.environ.get("XDG_RUNTIME_DIR", "/tmp")
+    return os.path.join(runtime_folder, "niri_tweaks_daemon.sock")
+
+
+def get_script_path(script_name: str) -> str:
+    """Get the full path to a script, based on its short name"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), SCRIPT_NAMES_LUT[script_name])
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Main
+
+if __name__ == "__main__":
+
+    argv = sys.argv[1:]
+    if len(argv) == 0 or argv[0] not in SCRIPT_NAMES_LUT:
+        print("Usage: niri_trigger.py {" + ",".join(SCRIPT_NAMES_LUT.keys()) + "} [script args...]")
+        sys.exit(1)
+
+    try:
+        skt = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        skt.connect(get_daemon_socket_path())
+
+    except (FileNotFoundError, ConnectionRefusedError):
+        # No daemon, so fall back to running the script directly
+        script_path = get_script_path(argv[0])
+        os.execv(sys.executable, [sys.executable, script_path, *argv[1:]])
+
+    # Send script args as a single json line, then print out anything the script printed
+    with skt:
+        skt.sendall((json.dumps(argv) + "\n").encode("utf-8"))
+        skt.shutdown(socket.SHUT_WR)
+        resp_chunks = []
+        while True:
+            chunk = skt.recv(4096)
+            if len(chunk) == 0:
+                break
+            resp_chunks.append(chunk)
+        resp_str = b"".join(resp_chunks).decode("utf-8")
+        if len(resp_str) > 0:
+            print(resp_str, end="")
@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import subprocess
-import json
+
+from niri_ipc import connect_client, make_workspace_reference
+from niri_state import WindowInfo, WorkspaceInfo
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -42,34 +43,31 @@ HAVE_HIDDEN_WSPACES = HIDDEN_WSPACES_LIST is not None
 # %% Helpers
 
 
-def run_command(command_str: str, **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(command_str.split(" "), **kwargs)
+def get_all_workspaces_info() -> list[WorkspaceInfo]:
+    return niri.get_workspaces()
+
 
+def get_all_windows_info() -> list[WindowInfo]:
+    return niri.get_windows()
 
-def get_all_workspaces_info() -> list[dict]:
-    resp = run_command("niri msg --json workspaces", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
 
+def get_focused_window() -> WindowInfo:
+    return niri.get_focused_window()
 
-def get_all_windows_info() -> list[dict]:
-    resp = run_command("niri msg --json windows", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
 
+def get_first_workspace(workspaces_info_list: list[WorkspaceInfo]) -> WorkspaceInfo:
+    return min(workspaces_info_list, key=lambda ws: ws.idx)
 
-def get_focused_window() -> dict:
-    resp = run_command("niri msg --json focused-window", capture_output=True, text=True)
-    resp.check_returncode()
-    return json.loads(resp.stdout)
 
+def get_last_workspace(workspaces_info_list: list[WorkspaceInfo]) -> WorkspaceInfo:
+    return max(workspaces_info_list, key=lambda ws: ws.idx)
 
-def get_first_workspace(workspaces_info_list: list[dict]) -> dict:
-    return min(workspaces_info_list, key=lambda ws: ws["idx"])
 
+# ---------------------------------------------------------------------------------------------------------------------
+# %% Connect to niri
 
-def get_last_workspace(workspaces_info_list: list[dict]) -> dict:
-    return max(workspaces_info_list, key=lambda ws: ws["idx"])
+# Share one connection for the workspace queries & focus actions below
+niri = connect_client()
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -79,7 +77,7 @@ def get_last_workspace(workspaces_info_list: list[dict]) -> dict:
 all_wspaces_info = get_all_workspaces_info()
 curr_wspace = None
 for wspace in all_wspaces_info:
-    if wspace["is_focused"]:
+    if wspace.is_focused:
         curr_wspace = wspace
         break
 
@@ -95,20 +93,20 @@ if curr_wspace is None:
 if TARGET_WORKSPACE_KEY in ("first", "last", "next", "prev"):
 
     # Only consider workspaces on the same output and ignore empty/hidden workspaces
-    candidate_wspaces_info = [ws for ws in all_wspaces_info if ws["output"] == curr_wspace["output"]]
+    candidate_wspaces_info = [ws for ws in all_wspaces_info if ws.output == curr_wspace.output]
     if HAVE_HIDDEN_WSPACES:
-        candidate_wspaces_info = [ws for ws in candidate_wspaces_info if ws["name"] not in HIDDEN_WSPACES_LIST]
+        candidate_wspaces_info = [ws for ws in candidate_wspaces_info if ws.name not in HIDDEN_WSPACES_LIST]
     if SKIP_EMPTY:
         all_wins_info = get_all_windows_info()
-        non_empty_wspace_ids = {w["workspace_id"] for w in all_wins_info}
-        candidate_wspaces_info = [ws for ws in candidate_wspaces_info if ws["id"] in non_empty_wspace_ids]
+        non_empty_wspace_ids = {w.workspace_id for w in all_wins_info}
+        candidate_wspaces_info = [ws for ws in candidate_wspaces_info if ws.id in non_empty_wspace_ids]
 
     # Sanity check. If we somehow have no candidates, use our current workspace
     if len(candidate_wspaces_info) == 0:
         candidate_wspaces_info = [curr_wspace]
 
     # Replace command key with actual workspace (let's us re-use index/naming code later on)
-    curr_wspace_idx = curr_wspace["idx"]
+    curr_wspace_idx = curr_wspace.idx
     target_wspace_info = curr_wspace
     if TARGET_WORKSPACE_KEY == "first":
         target_wspace_info = get_first_workspace(candidate_wspaces_info)
@@ -117,19 +115,19 @@ if TARGET_WORKSPACE_KEY in ("first", "last", "next", "prev"):
         target_wspace_info = get_last_workspace(candidate_wspaces_info)
 
     elif TARGET_WORKSPACE_KEY == "next":
-        next_wspaces_info = [ws for ws in candidate_wspaces_info if ws["idx"] > curr_wspace_idx]
+        next_wspaces_info = [ws for ws in candidate_wspaces_info if ws.idx > curr_wspace_idx]
         if len(next_wspaces_info) == 0:
             next_wspaces_info = [get_first_workspace(candidate_wspaces_info)] if ALLOW_WRAP_AROUND else [curr_wspace]
-        target_wspace_info = min(next_wspaces_info, key=lambda ws: ws["idx"])
+        target_wspace_info = min(next_wspaces_info, key=lambda ws: ws.idx)
 
     elif TARGET_WORKSPACE_KEY == "prev":
-        prev_wspaces_info = [ws for ws in candidate_wspaces_info if ws["idx"] < curr_wspace_idx]
+        prev_wspaces_info = [ws for ws in candidate_wspaces_info if ws.idx < curr_wspace_idx]
         if len(prev_wspaces_info) == 0:
             prev_wspaces_info = [get_last_workspace(candidate_wspaces_info)] if ALLOW_WRAP_AROUND else [curr_wspace]
-        target_wspace_info = max(prev_wspaces_info, key=lambda ws: ws["idx"])
+        target_wspace_info = max(prev_wspaces_info, key=lambda ws: ws.idx)
 
     # Workspaces always (?) have a valid index
-    TARGET_WORKSPACE_KEY = target_wspace_info["idx"]
+    TARGET_WORKSPACE_KEY = target_wspace_info.idx
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -137,24 +135,23 @@ if TARGET_WORKSPACE_KEY in ("first", "last", "next", "prev"):
 
 # Focus target workspace or (if focused) toggle overview or jump to first/last column
 target_wspace_handle = str(TARGET_WORKSPACE_KEY)
-curr_wspace_handle = str(curr_wspace["idx"]) if target_wspace_handle.isdigit() else curr_wspace["name"]
+curr_wspace_handle = str(curr_wspace.idx) if target_wspace_handle.isdigit() else curr_wspace.name
 if curr_wspace_handle != target_wspace_handle:
-    run_command(f"niri msg action focus-workspace {TARGET_WORKSPACE_KEY}")
+    niri.action("FocusWorkspace", reference=make_workspace_reference(TARGET_WORKSPACE_KEY))
 
 elif USE_OVERVIEW_TOGGLE:
-    run_command("niri msg action toggle-overview")
+    niri.action("ToggleOverview")
 
 else:
     # Drop focus from floating windows (focus first/last doesn't work otherwise)
     curr_win = get_focused_window()
-    if curr_win["is_floating"]:
-        run_command("niri msg action switch-focus-between-floating-and-tiling")
+    if curr_win.is_floating:
+        niri.action("SwitchFocusBetweenFloatingAndTiling")
 
     # Figure out if the current window is already the first column or not
-    curr_colrow = curr_win["layout"]["pos_in_scrolling_layout"]
-    curr_col = curr_colrow[0] if curr_colrow is not None else 100
+    curr_col = curr_win.col_idx if curr_win.col_idx is not None else 100
     if curr_col > 1:
-        run_command("niri msg action focus-column-first")
+        niri.action("FocusColumnFirst")
     else:
-        run_command("niri msg action focus-column-last")
+        niri.action("FocusColumnLast")
     pass